@@ -0,0 +1,94 @@
+"""Throughput of `Annotator` in MB of text per second, single process and over a process pool.
+
+    python benchmarks/bench_annotator.py [--data-dir DIR] [--mb 5] [--workers 4] [--target 2.0]
+
+With `--data-dir` the annotator is built from the saved `NameIndex` there, otherwise from a synthetic vocabulary of
+`--names` names. Documents are generated from the vocabulary mixed with filler words. Exits with status 1 if the
+single-process throughput is below `--target` MB/s.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ontology_index.annotator import Annotator
+
+
+def synthetic_names(n, rng):
+    syllables = ['ab', 'ca', 'di', 'em', 'fo', 'gu', 'ha', 'ic', 'jo', 'ka', 'lu', 'me', 'no', 'op', 'pra', 'qui', 'ro', 'sy', 'tu', 'vex']
+    words = sorted({''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(max(n // 2, 100))})
+    return {
+        ' '.join(rng.choice(words) for _ in range(rng.choice([1, 1, 2, 2, 2, 3, 4]))): {f'http://example.org/{i}'}
+        for i in range(n)
+    }
+
+
+def synthetic_documents(names, mb, rng, doc_size=2000):
+    names = sorted(names)
+    filler = ['the', 'of', 'patients', 'with', 'and', 'in', 'a', 'was', 'treated', 'study', 'trial', 'for', '(n=120)', 'were', 'randomised', '-', 'risk', 'cohort', 'phase', 'II']
+    docs = []
+    size = 0
+    while size < mb * 1e6:
+        words = []
+        length = 0
+        while length < doc_size:
+            w = rng.choice(names).title() if rng.random() < 0.15 else rng.choice(filler)
+            if rng.random() < 0.1:
+                w += rng.choice([',', '.', ';'])
+            words.append(w)
+            length += len(w) + 1
+        doc = ' '.join(words)
+        docs.append(doc)
+        size += len(doc.encode('utf-8'))
+    return docs, size
+
+
+def throughput(annotator, docs, size, workers=None):
+    start = time.perf_counter()
+    if workers and workers > 1:
+        annotations = annotator.annotate_many(docs, workers=workers)
+    else:
+        annotations = [annotator.annotate(doc) for doc in docs]
+    seconds = time.perf_counter() - start
+    return size / 1e6 / seconds, sum(len(a) for a in annotations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--names', type=int, default=200000)
+    parser.add_argument('--mb', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--target', type=float, default=2.0, help="minimum single-process MB/s")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    if args.data_dir:
+        from ontology_index.name_index import NameIndex
+        names = NameIndex(data_dir=args.data_dir).name_index
+    else:
+        names = synthetic_names(args.names, rng)
+    annotator = Annotator(names)
+    print(f"built annotator over {len(annotator.names)} names in {time.perf_counter() - start:.1f}s")
+
+    docs, size = synthetic_documents(annotator.names, args.mb, rng)
+    print(f"{len(docs)} documents, {size / 1e6:.1f} MB")
+
+    mb_s, n = throughput(annotator, docs, size)
+    print(f"1 process: {mb_s:.2f} MB/s ({n} annotations)")
+    if args.workers and args.workers > 1:
+        mb_s_pool, n_pool = throughput(annotator, docs, size, workers=args.workers)
+        print(f"{args.workers} processes: {mb_s_pool:.2f} MB/s ({n_pool} annotations)")
+
+    if mb_s < args.target:
+        print(f"below the target of {args.target:.2f} MB/s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
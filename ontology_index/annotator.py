@@ -0,0 +1,126 @@
+import re
+from .name_index import TextFilter, TranslateTable
+from .parallel import chunked_map
+
+_worker_state = {}
+
+
+def init_annotator_worker(annotator):
+    _worker_state.update(annotator=annotator)
+
+
+def annotate_chunk(texts):
+    annotator = _worker_state['annotator']
+    return [annotator.annotate(text) for text in texts]
+
+
+class Annotator(TextFilter):
+    """Finds the names of `NameIndex.name_index` in free text, with a trie over the tokens of every filtered name.
+
+Text is normalised token by token with the `filter_name` rules (lower case, the same characters kept, apostrophes
+dropped, a lone `&` read as `and` and joined to the words either side, and `, .` trimmed from token ends), so a name
+matches wherever its filtered form appears as a run of whole tokens. `annotate` returns `(start, end, name, iris)`
+for the longest matches that do not overlap (in tokens; the earliest wins a tie), with character offsets into the
+original text.
+"""
+
+    terminal = None
+
+    # `name_table`, keeping apostrophes until each token is looked at, and the marks left by `mark_ands`
+    text_table = TranslateTable('abcdefghijklmnopqrstuvwxyz0123456789., \'\x01\x02', ' ', overrides={'/': ' ', '-': ' '})
+    # runs of characters between spaces, without the `, .` and apostrophes at either end
+    token_pattern = re.compile(r"[^ ,.']+(?:[,.']+[^ ,.']+)*")
+    lone_and_pattern = re.compile(r'(\s+|^)&(\s+|$)')
+
+    @staticmethod
+    def mark_ands(s):
+        """Mark each lone `&` (which `filter_name` turns into `and`, joined to the words either side) and the
+whitespace around it, keeping the length of `s`."""
+        return Annotator.lone_and_pattern.sub(lambda m: '\x01'*len(m.group(1)) + '\x02' + '\x01'*len(m.group(2)), s)
+
+    def __init__(self, names):
+        """`names` is `{filtered_name: {iri, ...}}`, e.g. `NameIndex.name_index`."""
+        self.root = {}
+        self.names = []
+        self.iris = []
+        ids = {}
+        for name, iris in names.items():
+            tokens = tuple(t for t in self.tokenize(name) if t)
+            if not tokens:
+                continue
+            if not tokens in ids:
+                ids[tokens] = len(self.names)
+                self.names.append(name)
+                self.iris.append(set())
+                node = self.root
+                for t in tokens:
+                    node = node.setdefault(t, {})
+                node[self.terminal] = ids[tokens]
+            # filtered names differing only in trimmed punctuation share tokens, the first in sorted order names them
+            i = ids[tokens]
+            self.names[i] = min(self.names[i], name)
+            self.iris[i].update(iris)
+        self.iris = [frozenset(iris) for iris in self.iris]
+
+    @classmethod
+    def from_name_index(cls, name_index):
+        return cls(name_index.name_index)
+
+    def tokens(self, text):
+        """`[(token, start, end), ...]` for `text`, normalised as `filter_name` normalises names."""
+        lower = text.lower()
+        if len(lower) != len(text):
+            # keep offsets aligned where lower-casing changes the length
+            lower = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+        if '&' in lower:
+            lower = self.mark_ands(lower)
+        translated = lower.translate(self.text_table)
+
+        tokens = []
+        for m in self.token_pattern.finditer(translated):
+            t = m.group()
+            if "'" in t:
+                t = t.replace("'", '')
+            if '\x01' in t or '\x02' in t:
+                t = t.replace('\x01', '').replace('\x02', 'and')
+            tokens.append((t, *m.span()))
+        return tokens
+
+    def annotate(self, text):
+        tokens = self.tokens(text)
+
+        # every match, as (length in tokens, first token, last token + 1, name id)
+        keys = [t for t, start, end in tokens]
+        root = self.root
+        terminal = self.terminal
+        matches = []
+        for i in range(len(keys)):
+            node = root.get(keys[i])
+            j = i
+            while not node is None:
+                j += 1
+                if terminal in node:
+                    matches.append((j-i, i, j, node[terminal]))
+                if j == len(keys):
+                    break
+                node = node.get(keys[j])
+
+        taken = [False] * len(tokens)
+        annotations = []
+        for n, i, j, k in sorted(matches, key=lambda x:(-x[0], x[1])):
+            if any(taken[i:j]):
+                continue
+            taken[i:j] = [True] * n
+            annotations.append((tokens[i][1], tokens[j-1][2], self.names[k], self.iris[k]))
+
+        return sorted(annotations, key=lambda x:(x[0], x[1]))
+
+    def annotate_many(self, texts, workers=None, chunksize=100):
+        """`annotate` for each of `texts`, in order; with `workers` > 1 chunks of texts go to a process pool."""
+        results = []
+        for chunk in chunked_map(
+            annotate_chunk, texts, workers=workers, chunksize=chunksize, desc="Annotating",
+            initializer=init_annotator_worker, initargs=(self,)
+        ):
+            results.extend(chunk)
+        return results
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import mmap
+import hashlib
+import tempfile
+from array import array
+from collections.abc import Mapping, Set, ItemsView, ValuesView
+
+MAGIC = b'OIDX'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+
+def write_index(path, arrays, meta=None):
+    """Write named `array.array`s (plus a JSON-able `meta` dict) to a versioned binary index file.
+
+Layout: `MAGIC`, format version (uint32), header length (uint32), JSON header, then each array's raw bytes
+aligned to 8 bytes. The file is written to a unique temporary file next to `path` and moved into place.
+"""
+    header = {'byteorder': sys.byteorder, 'meta': meta or {}, 'arrays': {}}
+    offset = 0
+    for name, a in arrays.items():
+        header['arrays'][name] = [a.typecode, offset, len(a)]
+        offset += -(-len(a) * a.itemsize // ALIGNMENT) * ALIGNMENT
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(len(MAGIC) + 8 + len(header_bytes)) % ALIGNMENT)
+
+    # a unique name in the same directory, so concurrent writers never share a temporary file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(array('I', [FORMAT_VERSION, len(header_bytes)]).tobytes())
+            f.write(header_bytes)
+            for a in arrays.values():
+                b = a.tobytes()
+                f.write(b)
+                f.write(b'\0' * (-len(b) % ALIGNMENT))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class BinaryIndexFile():
+    """Read-only, memory-mapped view of a file written by `write_index`.
+
+Arrays are returned as `memoryview`s over the mapping, so nothing is copied or parsed up front and the pages are
+shared between every process that opens the same file.
+"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self.mm)
+
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not an ontology_index binary index")
+        version, header_len = buf[len(MAGIC):len(MAGIC)+8].cast('I')
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(buf[start:start+header_len]).decode('utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine")
+
+        self.meta = header['meta']
+        self._arrays = header['arrays']
+        self._data = buf[start+header_len:]
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def array(self, name):
+        typecode, offset, length = self._arrays[name]
+        itemsize = array(typecode).itemsize
+        return self._data[offset:offset+length*itemsize].cast(typecode)
+
+
+class StringTable():
+    """Sorted table of strings stored as an offsets array plus one UTF-8 blob.
+
+Ids follow the sort order, so `find` is a binary search over the (possibly memory-mapped) blob.
+"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def build(cls, strings):
+        return cls.from_sorted(sorted(set(strings)))
+
+    @classmethod
+    def from_sorted(cls, strings):
+        """Build from strings already in sorted order, keeping duplicates."""
+        offsets = array('q', [0])
+        blob = bytearray()
+        for s in strings:
+            blob.extend(s.encode('utf-8'))
+            offsets.append(len(blob))
+        return cls(offsets, array('B', blob))
+
+    @classmethod
+    def from_file(cls, index_file, name):
+        return cls(index_file.array(f"{name}.offsets"), index_file.array(f"{name}.blob"))
+
+    def to_arrays(self, name):
+        return {f"{name}.offsets": self.offsets, f"{name}.blob": self.blob}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bytes(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i+1]])
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i+1]], 'utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def bisect_left(self, s, lo=0, hi=None):
+        b = s.encode('utf-8')
+        if hi is None:
+            hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < b:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, s):
+        i = self.bisect_left(s)
+        if i < len(self) and self._bytes(i) == s.encode('utf-8'):
+            return i
+
+
+def pack_mapping(mapping, fields='s', kind='multimap', scalar=True, prefix=''):
+    """Encode a mapping as string tables, an offsets array and a flat posting list of records.
+
+`kind` is one of `multimap` (`{key: {record, ...}}`), `map` (`{key: record}`) or `set` (keys only). Each record
+is a tuple with one value per character of `fields`: `s` a string, `i` a non-negative int, `w` a tuple of tokens.
+With `scalar=True` a record is the bare value of its single field rather than a 1-tuple.
+Array names are prefixed with `prefix`, so several mappings can share one file.
+"""
+    if kind == 'set':
+        keys = StringTable.build(mapping)
+        return keys.to_arrays(f'{prefix}keys'), {'kind': kind}
+
+    def records(k):
+        if kind == 'map':
+            return [mapping[k]]
+        return mapping[k]
+
+    def as_tuple(r):
+        return (r,) if scalar else tuple(r)
+
+    def encode_field(t, v):
+        if t == 'w':
+            return ' '.join(v)
+        return v
+
+    keys = StringTable.build(mapping.keys())
+    values = StringTable.build(
+        encode_field(t, v)
+        for k in mapping
+        for r in records(k)
+        for t, v in zip(fields, as_tuple(r))
+        if t != 'i'
+    )
+    value_ids = {s:i for i,s in enumerate(values)}
+
+    offsets = array('q', [0])
+    postings = array('I')
+    for k in keys:
+        encoded = sorted(
+            tuple(v if t == 'i' else value_ids[encode_field(t, v)] for t, v in zip(fields, as_tuple(r)))
+            for r in set(records(k))
+        )
+        for r in encoded:
+            postings.extend(r)
+        offsets.append(len(postings) // len(fields))
+
+    arrays = {
+        **keys.to_arrays(f'{prefix}keys'),
+        **values.to_arrays(f'{prefix}values'),
+        f'{prefix}offsets': offsets,
+        f'{prefix}postings': postings,
+    }
+    return arrays, {'kind': kind, 'fields': fields, 'scalar': scalar}
+
+
+def save_mapping(path, mapping, fields='s', kind='multimap', scalar=True, meta=None):
+    arrays, info = pack_mapping(mapping, fields=fields, kind=kind, scalar=scalar)
+    write_index(path, arrays, meta={**(meta or {}), 'mapping': info})
+
+
+def load_mapping(path):
+    index_file = BinaryIndexFile(path)
+    info = index_file.meta['mapping']
+    if info['kind'] == 'set':
+        return MmapSet(index_file)
+    return MmapMapping(index_file, info)
+
+
+class MmapSet(Set):
+    def __init__(self, index_file, prefix=''):
+        self.keys = StringTable.from_file(index_file, f'{prefix}keys')
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and not self.keys.find(key) is None
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _ValuesView(ValuesView):
+    def __iter__(self):
+        for k, v in self._mapping._iter_items():
+            yield v
+
+
+class MmapMapping(Mapping):
+    """Read-only mapping over a memory-mapped file written by `save_mapping`; records are decoded on access."""
+
+    def __init__(self, index_file, info, prefix=''):
+        self.kind = info['kind']
+        self.fields = info['fields']
+        self.scalar = info['scalar']
+        self.keys_table = StringTable.from_file(index_file, f'{prefix}keys')
+        self.values_table = StringTable.from_file(index_file, f'{prefix}values')
+        self.offsets = index_file.array(f'{prefix}offsets')
+        self.postings = index_file.array(f'{prefix}postings')
+
+    def _decode(self, r):
+        values = []
+        for t, v in zip(self.fields, r):
+            if t == 's':
+                v = self.values_table[v]
+            elif t == 'w':
+                v = tuple(self.values_table[v].split(' '))
+            values.append(v)
+        return values[0] if self.scalar else tuple(values)
+
+    def _value(self, k):
+        w = len(self.fields)
+        start, end = self.offsets[k]*w, self.offsets[k+1]*w
+        records = [self._decode(self.postings[i:i+w]) for i in range(start, end, w)]
+        if self.kind == 'map':
+            return records[0]
+        return set(records)
+
+    def _iter_items(self):
+        for k in range(len(self.keys_table)):
+            yield self.keys_table[k], self._value(k)
+
+    def __getitem__(self, key):
+        k = self.keys_table.find(key) if isinstance(key, str) else None
+        if k is None:
+            raise KeyError(key)
+        return self._value(k)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and not self.keys_table.find(key) is None
+
+    def __iter__(self):
+        return iter(self.keys_table)
+
+    def __len__(self):
+        return len(self.keys_table)
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+
+def open_index(data_dir, stem, from_json):
+    """Open `{stem}.oidx` from `data_dir` if it exists, otherwise parse `{stem}.json` with `from_json`."""
+    path = f"{data_dir}/{stem}.oidx"
+    if os.path.exists(path):
+        return load_mapping(path)
+    with open(f"{data_dir}/{stem}.json", 'rt') as f:
+        return from_json(json.load(f))
+
+
+def file_digest(path, chunk_size=1<<20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
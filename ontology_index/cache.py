@@ -0,0 +1,196 @@
+import pickle
+import sqlite3
+from collections import OrderedDict, defaultdict
+
+
+def pickled_size(value):
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class BoundedCache():
+    """In-memory cache bounded by entry count (`maxsize`) and/or approximate size (`max_bytes`).
+
+`policy` is `lru` (evict the least recently used entry) or `lfu` (the least frequently used, oldest first among
+ties). With `path`, entries are also written through to an SQLite file and misses fall back to it, so warm results
+survive a restart; keys are stored as strings and values pickled.
+
+`hits`, `misses`, `evictions` and `disk_hits` count lookups since creation (see `stats`).
+"""
+
+    def __init__(self, maxsize=100000, max_bytes=None, policy='lru', path=None, sizeof=None):
+        if not policy in ('lru', 'lfu'):
+            raise ValueError(f"Unknown cache policy '{policy}', expected 'lru' or 'lfu'")
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.sizeof = sizeof or pickled_size
+
+        self.data = {}
+        self.sizes = {}
+        self.nbytes = 0
+        self.order = OrderedDict()  # lru: keys, least recent first
+        self.freqs = {}  # lfu: key -> use count
+        self.freq_keys = defaultdict(OrderedDict)  # lfu: use count -> keys, oldest first
+        self.min_freq = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+        self.path = path
+        self.db = None
+        if not path is None:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)")
+            self.db.commit()
+
+    def _touch(self, key):
+        if self.policy == 'lru':
+            self.order.move_to_end(key)
+        else:
+            f = self.freqs[key]
+            del self.freq_keys[f][key]
+            if not self.freq_keys[f]:
+                del self.freq_keys[f]
+                if self.min_freq == f:
+                    self.min_freq = f + 1
+            self.freqs[key] = f + 1
+            self.freq_keys[f+1][key] = None
+
+    def _victim(self):
+        if self.policy == 'lru':
+            return next(iter(self.order))
+        return next(iter(self.freq_keys[self.min_freq]))
+
+    def _discard(self, key):
+        del self.data[key]
+        self.nbytes -= self.sizes.pop(key, 0)
+        if self.policy == 'lru':
+            del self.order[key]
+        else:
+            f = self.freqs.pop(key)
+            del self.freq_keys[f][key]
+            if not self.freq_keys[f]:
+                del self.freq_keys[f]
+                if self.min_freq == f:
+                    self.min_freq = min(self.freq_keys, default=0)
+
+    def _over_budget(self, count=0, nbytes=0):
+        """Whether the cache would be over budget holding `count` more entries of `nbytes` more bytes."""
+        return (
+            (not self.maxsize is None and len(self.data) + count > self.maxsize) or
+            (not self.max_bytes is None and self.nbytes + nbytes > self.max_bytes)
+        )
+
+    def _insert(self, key, value):
+        if key in self.data:
+            self._discard(key)
+        size = self.sizeof(value) if not self.max_bytes is None else 0
+
+        # make room first, so the LFU victim is never the entry being added (it would always have the lowest count)
+        while self.data and self._over_budget(1, size):
+            self._discard(self._victim())
+            self.evictions += 1
+
+        self.data[key] = value
+        if not self.max_bytes is None:
+            self.sizes[key] = size
+            self.nbytes += size
+        if self.policy == 'lru':
+            self.order[key] = None
+        else:
+            self.freqs[key] = 1
+            self.freq_keys[1][key] = None
+            self.min_freq = 1
+
+        # an entry over budget on its own is not kept
+        if self._over_budget():
+            self._discard(key)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        if key in self.data:
+            self.hits += 1
+            self._touch(key)
+            return self.data[key]
+
+        if not self.db is None:
+            row = self.db.execute("SELECT value FROM cache WHERE key = ?", (str(key),)).fetchone()
+            if not row is None:
+                self.hits += 1
+                self.disk_hits += 1
+                value = pickle.loads(row[0])
+                self._insert(key, value)
+                return value
+
+        self.misses += 1
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._insert(key, value)
+        if not self.db is None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                (str(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            )
+            self.db.commit()
+
+    def __contains__(self, key):
+        if key in self.data:
+            return True
+        if not self.db is None:
+            return not self.db.execute("SELECT 1 FROM cache WHERE key = ?", (str(key),)).fetchone() is None
+        return False
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self, disk=False):
+        self.data.clear()
+        self.sizes.clear()
+        self.nbytes = 0
+        self.order.clear()
+        self.freqs.clear()
+        self.freq_keys.clear()
+        self.min_freq = 0
+        if disk and not self.db is None:
+            self.db.execute("DELETE FROM cache")
+            self.db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.data),
+            'bytes': self.nbytes if not self.max_bytes is None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+    def close(self):
+        if not self.db is None:
+            self.db.close()
+            self.db = None
+
+    def __getstate__(self):
+        # the SQLite connection cannot be pickled (e.g. into worker processes); it is reopened from `path`
+        state = self.__dict__.copy()
+        state['db'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not self.path is None:
+            self.db = sqlite3.connect(self.path)
+
+
+_missing = object()
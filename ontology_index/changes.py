@@ -0,0 +1,122 @@
+import json
+
+
+def diff_mapping(old, new):
+    """`(added, removed, changed, entries_added, entries_removed)` between two `{key: value}` or `{key: {value, ...}}` mappings.
+
+Keys are compared by value; for set values the entry counts are the set members gained and lost, for scalars a
+changed value counts as one of each.
+"""
+    old = {} if old is None else old
+    added, removed, changed = set(), set(), set()
+    entries_added = entries_removed = 0
+
+    for k in new:
+        n = new[k]
+        if not k in old:
+            added.add(k)
+            entries_added += len(n) if isinstance(n, (set, frozenset)) else 1
+            continue
+        o = old[k]
+        if isinstance(n, (set, frozenset)):
+            o = set(o)
+            if o != n:
+                changed.add(k)
+                entries_added += len(n - o)
+                entries_removed += len(o - n)
+        elif o != n:
+            changed.add(k)
+            entries_added += 1
+            entries_removed += 1
+
+    for k in old:
+        if not k in new:
+            removed.add(k)
+            o = old[k]
+            entries_removed += len(o) if isinstance(o, (set, frozenset)) else 1
+
+    return added, removed, changed, entries_added, entries_removed
+
+
+class ChangeReport():
+    """Keys added, removed and changed in each index by an update, e.g. from one ontology release to the next.
+
+`indexes[name]` is `{'added': keys, 'removed': keys, 'changed': keys, 'entries_added': n, 'entries_removed': n}`,
+where an entry is one member of a key's set (one triple, name, xref...). For a plain set index (like
+`disease_iris`) the members themselves are added or removed.
+"""
+
+    def __init__(self, source=None):
+        self.source = source
+        self.indexes = {}
+
+    def add_mapping(self, name, old, new):
+        added, removed, changed, entries_added, entries_removed = diff_mapping(old, new)
+        self.indexes[name] = {
+            'added': added,
+            'removed': removed,
+            'changed': changed,
+            'entries_added': entries_added,
+            'entries_removed': entries_removed,
+        }
+
+    def add_set(self, name, old, new):
+        old = set() if old is None else set(old)
+        new = set(new)
+        self.indexes[name] = {
+            'added': new - old,
+            'removed': old - new,
+            'changed': set(),
+            'entries_added': len(new - old),
+            'entries_removed': len(old - new),
+        }
+
+    def add_keys(self, name, keys):
+        """Record `keys` as changed in `name`, for changes derived from other indexes."""
+        self.indexes[name] = {
+            'added': set(),
+            'removed': set(),
+            'changed': set(keys),
+            'entries_added': 0,
+            'entries_removed': 0,
+        }
+
+    def keys(self, *names):
+        """Every key added, removed or changed in the `names` indexes (or all of them)."""
+        keys = set()
+        for name in names or self.indexes:
+            if name in self.indexes:
+                r = self.indexes[name]
+                keys.update(r['added'], r['removed'], r['changed'])
+        return keys
+
+    def __bool__(self):
+        return any(self.keys(name) for name in self.indexes)
+
+    def summary(self):
+        return {
+            name: {k:(len(v) if isinstance(v, set) else v) for k,v in r.items()}
+            for name, r in self.indexes.items()
+        }
+
+    def to_json(self):
+        return {
+            'source': self.source,
+            'indexes': {
+                name: {k:(sorted(v) if isinstance(v, set) else v) for k,v in r.items()}
+                for name, r in self.indexes.items()
+            },
+        }
+
+    def save(self, path):
+        with open(path, 'wt') as f:
+            json.dump(self.to_json(), f, indent=1)
+
+    def __str__(self):
+        lines = [f"Changes from {self.source}" if self.source else "Changes"]
+        for name, r in self.summary().items():
+            lines.append(
+                f"  {name}: {r['added']} added, {r['removed']} removed, {r['changed']} changed "
+                f"(+{r['entries_added']} / -{r['entries_removed']} entries)"
+            )
+        return '\n'.join(lines)
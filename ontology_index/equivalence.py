@@ -0,0 +1,160 @@
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+from .binary_index import write_index, BinaryIndexFile, StringTable
+
+
+class UnionFind():
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = parent.setdefault(x, x)
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+        return ra
+
+    def groups(self):
+        groups = defaultdict(set)
+        for x in self.parent:
+            groups[self.find(x)].add(x)
+        return list(groups.values())
+
+
+class EquivalenceClasses():
+    """Groups of equivalent IRIs, stored as two CSR blocks over interned member ids.
+
+`classes[class_offsets[c]:class_offsets[c+1]]` are the members of class `c`, and
+`member_classes[member_offsets[m]:member_offsets[m+1]]` the classes member `m` belongs to. Without merging, a
+member may be in several classes (e.g. a source code shared by two CUIs).
+"""
+
+    def __init__(self, members, member_offsets, member_classes, class_offsets, class_members):
+        self.members = members
+        self.member_offsets = member_offsets
+        self.member_classes = member_classes
+        self.class_offsets = class_offsets
+        self.class_members = class_members
+        if isinstance(members, StringTable):
+            self._find = members.find
+        else:
+            self._find = {m:i for i,m in enumerate(members)}.get
+
+    @classmethod
+    def build(cls, classes, merge=False):
+        """Build from an iterable of member collections; with `merge=True` classes sharing a member are merged."""
+        classes = [set(c) for c in classes if c]
+        if merge:
+            uf = UnionFind()
+            for c in classes:
+                first, *rest = c
+                uf.find(first)
+                for m in rest:
+                    uf.union(first, m)
+            classes = uf.groups()
+
+        members = sorted({m for c in classes for m in c})
+        member_ids = {m:i for i,m in enumerate(members)}
+        classes = sorted(set(tuple(sorted(member_ids[m] for m in c)) for c in classes))
+
+        class_offsets = array('q', [0])
+        class_members = array('I')
+        member_lists = [[] for _ in members]
+        for c, ms in enumerate(classes):
+            class_members.extend(ms)
+            class_offsets.append(len(class_members))
+            for m in ms:
+                member_lists[m].append(c)
+
+        member_offsets = array('q', [0])
+        member_classes = array('I')
+        for cs in member_lists:
+            member_classes.extend(cs)
+            member_offsets.append(len(member_classes))
+
+        return cls(members, member_offsets, member_classes, class_offsets, class_members)
+
+    def save(self, path, meta=None):
+        arrays = {
+            **StringTable.build(self.members).to_arrays('members'),
+            'member_offsets': self.member_offsets,
+            'member_classes': self.member_classes,
+            'class_offsets': self.class_offsets,
+            'class_members': self.class_members,
+        }
+        write_index(path, {k:a if isinstance(a, array) else array(a.format, a) for k,a in arrays.items()}, meta=meta)
+
+    @classmethod
+    def load(cls, path):
+        index_file = BinaryIndexFile(path)
+        return cls(
+            StringTable.from_file(index_file, 'members'),
+            *(index_file.array(name) for name in ('member_offsets', 'member_classes', 'class_offsets', 'class_members'))
+        )
+
+    def __len__(self):
+        return len(self.class_offsets) - 1
+
+    def __contains__(self, iri):
+        return not self._find(iri) is None
+
+    def get_class_ids(self, iri):
+        m = self._find(iri)
+        if m is None:
+            return []
+        return list(self.member_classes[self.member_offsets[m]:self.member_offsets[m+1]])
+
+    def get_members(self, c):
+        return {self.members[m] for m in self.class_members[self.class_offsets[c]:self.class_offsets[c+1]]}
+
+    def get_equivalents(self, iri):
+        """Every other member of the classes `iri` belongs to."""
+        equivalents = set()
+        for c in self.get_class_ids(iri):
+            equivalents.update(self.get_members(c))
+        equivalents.discard(iri)
+        return equivalents
+
+    def classes(self):
+        for c in range(len(self)):
+            yield self.get_members(c)
+
+    def as_rels(self, rel_name):
+        return EquivalenceRelsView(self, rel_name)
+
+
+class EquivalenceRelsView(Mapping):
+    """Read-only `{iri: {(rel_name, iri), ...}}` view pairing every member with the rest of its classes."""
+
+    def __init__(self, classes, rel_name):
+        self.classes = classes
+        self.rel_name = rel_name
+        self._len = None
+
+    def __getitem__(self, iri):
+        equivalents = self.classes.get_equivalents(iri)
+        if not equivalents:
+            raise KeyError(iri)
+        return {(self.rel_name, m) for m in equivalents}
+
+    def __contains__(self, iri):
+        return bool(self.classes.get_equivalents(iri))
+
+    def __iter__(self):
+        for m in self.classes.members:
+            if m in self:
+                yield m
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
@@ -0,0 +1,49 @@
+from collections.abc import Mapping
+from .binary_index import pack_mapping, write_index, BinaryIndexFile, MmapMapping
+
+KMER_INFO = {'kind': 'multimap', 'fields': 's', 'scalar': True}
+
+
+def save_kmer_index(path, token_index, source_hash=None, size_limit=None):
+    """Save a `{k: {kmer: {iri, ...}}}` token index, tagged with the hash of the `iri_name_index` it was built from."""
+    arrays = {}
+    for k in sorted(token_index):
+        kmers = token_index[k]
+        kmer_arrays, info = pack_mapping({' '.join(kmer):iris for kmer,iris in kmers.items()}, prefix=f'{k}/')
+        arrays.update(kmer_arrays)
+
+    write_index(path, arrays, meta={'ks': sorted(token_index), 'source_hash': source_hash, 'size_limit': size_limit})
+
+
+def kmer_index_meta(path):
+    return BinaryIndexFile(path).meta
+
+
+def load_kmer_index(path, source_hash=None, size_limit=None):
+    """Open a saved token index, or return `None` if it was built from a different source or `size_limit`."""
+    index_file = BinaryIndexFile(path)
+    meta = index_file.meta
+    if meta['source_hash'] != source_hash or meta['size_limit'] != size_limit:
+        return None
+
+    return {k:KmerLevel(MmapMapping(index_file, KMER_INFO, prefix=f'{k}/')) for k in meta['ks']}
+
+
+class KmerLevel(Mapping):
+    """`{kmer_tuple: {iri, ...}}` view over a saved mapping keyed by space-joined k-mers."""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def __getitem__(self, kmer):
+        return self.mapping[' '.join(kmer)]
+
+    def __contains__(self, kmer):
+        return ' '.join(kmer) in self.mapping
+
+    def __iter__(self):
+        for k in self.mapping:
+            yield tuple(k.split(' '))
+
+    def __len__(self):
+        return len(self.mapping)
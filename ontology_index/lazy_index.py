@@ -0,0 +1,108 @@
+import os
+import hashlib
+from .binary_index import open_index, file_digest
+
+
+class LazyIndexes():
+    """Mixin that loads saved index attributes from `data_dir` on first access.
+
+`index_files` maps an attribute to the `(stem, from_json)` pair passed to `open_index`. `index_loaders` maps an
+attribute to the name of a method taking `data_dir`, for attributes that are not a single saved mapping (the
+method must set the attribute, and may set others at the same time); `index_loader_files` lists the files in
+`data_dir` such a method may read.
+
+`load_indexes` only records where to load from; `preload` forces everything to be loaded up front.
+
+Attributes loaded this way are remembered, so `is_saved` can tell a saved index from one built or replaced since;
+code changing a loaded index in place calls `set_modified`, and `save_indexes` calls `set_saved`.
+"""
+
+    index_files = {}
+    index_loaders = {}
+    index_loader_files = {}
+
+    def lazy_attributes(self):
+        return [*self.index_files, *self.index_loaders]
+
+    def load_indexes(self, data_dir=None, lazy=True):
+        if data_dir is None:
+            data_dir = self.data_dir
+
+        self._index_dir = data_dir
+        self._saved = {}
+        for attr in self.lazy_attributes():
+            self.__dict__.pop(attr, None)
+
+        if not lazy:
+            self.preload()
+
+    def preload(self):
+        for attr in self.lazy_attributes():
+            getattr(self, attr)
+        return self
+
+    def is_loaded(self, attr):
+        return attr in self.__dict__
+
+    def is_saved(self, attr):
+        """Whether `attr` is (or will load as) the index saved in the directory it is loaded from."""
+        if not attr in self.__dict__:
+            return not self.__dict__.get('_index_dir') is None
+        return self.__dict__.get('_saved', {}).get(attr) is self.__dict__[attr]
+
+    def set_saved(self, data_dir, *attrs):
+        """Record that `attrs` now match the indexes saved in `data_dir` (which only counts for the directory loaded from)."""
+        if data_dir == self.__dict__.get('_index_dir'):
+            saved = self.__dict__.setdefault('_saved', {})
+            for attr in attrs:
+                if attr in self.__dict__:
+                    saved[attr] = self.__dict__[attr]
+
+    def index_paths(self, attr, data_dir):
+        """The files in `data_dir` that `attr` is loaded from."""
+        if attr in self.index_files:
+            stem = self.index_files[attr][0]
+            names = (f"{stem}.oidx", f"{stem}.json")
+        else:
+            names = self.index_loader_files.get(attr, ())
+        return [f"{data_dir}/{name}" for name in names if os.path.exists(f"{data_dir}/{name}")]
+
+    def saved_digest(self, *attrs):
+        """Digest of the files `attrs` are loaded from, or `None` if one of them is not the saved index."""
+        data_dir = self.__dict__.get('_index_dir')
+        if data_dir is None or not all(self.is_saved(attr) for attr in attrs):
+            return None
+        h = hashlib.blake2b(digest_size=16)
+        try:
+            for path in sorted({path for attr in attrs for path in self.index_paths(attr, data_dir)}):
+                h.update(f"{os.path.basename(path)}:{file_digest(path)}\n".encode('utf-8'))
+        except OSError:
+            return None
+        return h.hexdigest()
+
+    def set_modified(self, *attrs):
+        """Record that `attrs` were changed in place, so no longer match the saved indexes."""
+        saved = self.__dict__.get('_saved', {})
+        for attr in attrs:
+            saved.pop(attr, None)
+
+    def __getattr__(self, name):
+        data_dir = self.__dict__.get('_index_dir')
+        if name.startswith('_') or data_dir is None:
+            raise AttributeError(name)
+
+        try:
+            if name in self.index_files:
+                stem, from_json = self.index_files[name]
+                setattr(self, name, open_index(data_dir, stem, from_json))
+                self.set_saved(data_dir, name)
+            elif name in self.index_loaders:
+                loader = self.index_loaders[name]
+                getattr(self, loader)(data_dir)
+                self.set_saved(data_dir, *(attr for attr, m in self.index_loaders.items() if m == loader))
+            else:
+                raise AttributeError(name)
+        except FileNotFoundError as e:
+            raise AttributeError(f"{type(self).__name__} index '{name}' is not available in {data_dir}") from e
+
+        return self.__dict__[name]
@@ -1,23 +1,112 @@
 import re
 import json
 import pickle
-from collections import defaultdict
+import heapq
+from functools import lru_cache
+from collections import defaultdict, Counter, deque
 from .onto_index import EfoIndex, MeshIndex, UmlsIndex
+import os
+from .binary_index import save_mapping, file_digest
+from .lazy_index import LazyIndexes
+from .kmer_index import save_kmer_index, load_kmer_index, kmer_index_meta
+from .parallel import chunked_map
+from .changes import ChangeReport
+from .ols import OlsClient
 from tqdm.auto import tqdm
 
-import requests
-import urllib
 import re
 
+class SuffixTrie():
+    """Trie over reversed suffixes, so every suffix of a string can be matched in one walk from its end."""
+    
+    terminal = None
+    
+    def __init__(self, suffixes):
+        self.root = {}
+        for rank, suffix in enumerate(suffixes):
+            node = self.root
+            for c in reversed(suffix):
+                node = node.setdefault(c, {})
+            node[self.terminal] = rank
+    
+    def matches(self, s):
+        """Yield `(rank, length)` for every suffix that `s` ends with."""
+        node = self.root
+        for i in range(len(s)-1, -1, -1):
+            node = node.get(s[i])
+            if node is None:
+                return
+            if self.terminal in node:
+                yield node[self.terminal], len(s)-i
+
+
+class AhoCorasick():
+    """Aho-Corasick automaton, finding every occurrence of many literal patterns in one scan of a string."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # ids of the patterns ending at each node, through fail links too
+        for i, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for c in pattern:
+                child = self.goto[node].get(c)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][c] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = child
+            self.out[node].append(i)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and not c in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(c, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+                queue.append(child)
+
+    def finditer(self, s):
+        """Yield `(start, end, pattern_id)` for every occurrence of every pattern in `s`, overlapping ones included."""
+        goto, fail, out, patterns = self.goto, self.fail, self.out, self.patterns
+        node = 0
+        for i, c in enumerate(s):
+            while node and not c in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            for p in out[node]:
+                yield i+1-len(patterns[p]), i+1, p
+
+
+class TranslateTable(dict):
+    """`str.translate` table that keeps the characters in `keep` and maps every other character to `default`."""
+    
+    def __init__(self, keep, default, overrides={}):
+        super().__init__({ord(c):v for c,v in overrides.items()})
+        self.keep = set(keep)
+        self.default = default
+    
+    def __missing__(self, c):
+        v = c if chr(c) in self.keep else self.default
+        self[c] = v
+        return v
+
+
 class TextFilter():
     def __init__(self):
         pass
     
-    def normalise_whitespace(self, s):
-        s = re.sub('\s+', ' ', s)
-        s = re.sub('\s+$', '', s)
-        s = re.sub('^\s+', '', s)
-        return s
+    @staticmethod
+    def normalise_whitespace(s):
+        return ' '.join(s.split())
 
     exclude_suffixes = {
         'nos',
@@ -36,82 +125,115 @@ class TextFilter():
         '(morphologic abnormality)'
     }
     
+    and_pattern = re.compile('(\s|^)&(\s|$)')
+    lone_dot_pattern = re.compile('(\s|^)\.(\s|$)')
+    name_table = TranslateTable('abcdefghijklmnopqrstuvwxyz0123456789., ', ' ', overrides={'/': ' ', '-': ' ', "'": None})
+    punctuation_table = TranslateTable('abcdefghijklmnopqrstuvwxyz0123456789 ', None)
+    
+    filter_cache_size = 1<<16
+    
     def filter_name(self, s):
-
-        s = self.normalise_whitespace(s.lower())
+        cls = type(self)
+        if not '_filter_name_cached' in cls.__dict__:
+            cls._filter_name_cached = staticmethod(lru_cache(maxsize=cls.filter_cache_size)(cls._filter_name))
+        return self._filter_name_cached(s)
+    
+    @classmethod
+    def _filter_name(cls, s):
+        if not '_suffix_trie' in cls.__dict__:
+            cls._suffix_trie = SuffixTrie(sorted(cls.exclude_suffixes, key=lambda x:(-len(x), x)))
         
-#         if re.match('.*(\s|^)\([^)]*\)(\s|$).*', s):
-#             s = re.sub('(\s|^)\([^)]*\)(\s|$)', ' ', s)
-
-#             # tidy up problems that occur due to removing brackets
-#             s = self.normalise_whitespace(s)
-
-#             if bool(s):
-#                 if s[-1] == ',':
-#                     s = self.normalise_whitespace(s[:-1])
-#             if bool(s):
-#                 if s[0] == ',':
-#                     s = self.normalise_whitespace(s[1:])
-
-#         else:
-#             s = self.normalise_whitespace(s)
-
-#         if re.match('.*(\s|^)\[[^\]]*\](\s|$).*', s):
-#             s = re.sub('(\s|^)\[[^\]]*\](\s|$)', ' ', s)
-
-#             # tidy up problems that occur due to removing brackets
-#             s = self.normalise_whitespace(s)
-
-#             if bool(s):
-#                 if s[-1] == ',':
-#                     s = self.normalise_whitespace(s[:-1])
-#             if bool(s):
-#                 if s[0] == ',':
-#                     s = self.normalise_whitespace(s[1:])
-
-#         else:
-#             s = self.normalise_whitespace(s)
+        s = cls.normalise_whitespace(s.lower())
         
-        for suffix in self.exclude_suffixes:
-            if s[-len(suffix):] == suffix:
-                s = self.normalise_whitespace(s[:-len(suffix)])
+        # single pass over the suffixes in trie rank order (longest first), each stripped at most once
+        last_rank = -1
+        while True:
+            match = min(((rank, n) for rank, n in cls._suffix_trie.matches(s) if rank > last_rank), default=None)
+            if match is None:
+                break
+            last_rank, n = match
+            s = cls.normalise_whitespace(s[:-n])
         
-        s = re.sub('(\s|^)&(\s|$)', 'and', s)  # normalise ands
-        s = re.sub('[/\-]', ' ', s)
-        s = re.sub('[\']', '', s)
-        s = re.sub('[^a-z0-9., ]', ' ', s)
-        s = re.sub('(\s|^)\.(\s|$)', ' ', s)
-        s = self.normalise_whitespace(s)
-        s = self.trim(s)
+        s = cls.and_pattern.sub('and', s)  # normalise ands
+        s = s.translate(cls.name_table)
+        s = cls.lone_dot_pattern.sub(' ', s)
+        s = cls.normalise_whitespace(s)
+        s = cls.trim(s)
         
         return s
 
     def remove_punctuation(self, s):
-        s = re.sub('[^a-z0-9 ]', '', s)  # remove punctuation
-        s = self.normalise_whitespace(s)
-
-        return s
+        return self.normalise_whitespace(s.translate(self.punctuation_table))  # remove punctuation
     
-    def trim(self, s):
-        change = True
-        while change:
-            change = False
-            if bool(s):
-                if s[-1] in {',','.',' '}:
-                    s = s[:-1]
-                    change = True
-            if bool(s):
-                if s[0] == {',','.',' '}:
-                    s = s[1:]
-                    change = True
-                    
-        return s
+    @staticmethod
+    def trim(s):
+        return s.strip(', .')
     
     def tokenize(self, s):
-        return [self.trim(t) for t in re.split('(?<=\S)[\s](?=\S)', self.normalise_whitespace(s))]
+        return [self.trim(t) for t in self.normalise_whitespace(s).split(' ')]
     
 
-class NameIndex(TextFilter):
+def filter_names(names):
+    text_filter = TextFilter()
+    return [text_filter.filter_name(n) for n in names]
+
+
+def normalise_names(rows):
+    """`(iri, name)` pairs -> `(iri, name, filtered_name, tokens)` for every name that survives `filter_name`."""
+    text_filter = TextFilter()
+    normalised = []
+    for iri, name in rows:
+        filtered_name = text_filter.filter_name(name)
+        if filtered_name:
+            tokens = text_filter.tokenize(text_filter.remove_punctuation(filtered_name))  # remove all punctuation
+            normalised.append((iri, name, filtered_name, tuple(tokens)))
+    return normalised
+
+
+_worker_state = {}
+
+
+def init_qualifier_worker(qualifier_index):
+    _worker_state.update(qualifier_index=qualifier_index)
+
+
+def extract_qualifiers_chunk(qs):
+    """`qs` -> `[(q, (new_q, qualifiers)), ...]` with the worker's `QualifierIndex`."""
+    qualifier_index = _worker_state['qualifier_index']
+    return [(q, qualifier_index.extract_qualifiers(q)) for q in qs]
+
+
+class NameIndex(TextFilter, LazyIndexes):
+    
+    efo_name_types = {
+        'http://www.w3.org/2000/01/rdf-schema#label',
+        'http://www.w3.org/2004/02/skos/core#prefLabel',
+        'http://www.geneontology.org/formats/oboInOwl#hasExactSynonym',
+        'http://www.geneontology.org/formats/oboInOwl#shorthand'
+    }
+    mesh_name_types = {
+        'http://id.nlm.nih.gov/mesh/vocab#prefLabel',
+        'http://www.w3.org/2000/01/rdf-schema#label',
+        'http://id.nlm.nih.gov/mesh/vocab#altLabel'
+    }
+    umls_name_types = {
+        'umls:pref_term',
+        'umls:case_word_order_variant',
+        'umls:case_variant',
+        'umls:variant',
+        'umls:word_order_variant'
+    }
+    
+    index_files = {
+        'name_index': ('name_index', lambda d: {k:set(vs) for k,vs in d.items()}),
+        'iri_name_index': ('iri_name_index', lambda d: {k:{(n,f,tuple(t)) for n,f,t in vs} for k,vs in d.items()}),
+    }
+    index_loaders = {
+        'token_index': 'load_token_index',
+    }
+    index_loader_files = {
+        'token_index': ('token_index.oidx',),
+    }
 
     def __init__(self, data_dir='.', efo_index=None, mesh_index=None, umls_index=None):
         self.data_dir = data_dir
@@ -136,101 +258,310 @@ class NameIndex(TextFilter):
         except:
             pass
     
-    def gen_query_index(self):
+    def gen_query_index(self, workers=None, chunksize=10000):
+        """Build `name_index` and `iri_name_index` from the EFO, MeSH and UMLS names.
+
+Names are normalised in chunks, spread over `workers` processes if given, and merged source by source. MeSH
+descriptors that already have EFO names are skipped.
+"""
         self.name_index = defaultdict(set)
         self.iri_name_index = defaultdict(set)
         
-        for iri, d in tqdm(self.efo_index.iri2name.items(), leave=True, position=0):
-            for name_type, name in d:
-                filtered_name = self.filter_name(name)
-                if filtered_name:
-                    if name_type in {
-                        'http://www.w3.org/2000/01/rdf-schema#label',
-                        'http://www.w3.org/2004/02/skos/core#prefLabel',
-                        'http://www.geneontology.org/formats/oboInOwl#hasExactSynonym',
-                        'http://www.geneontology.org/formats/oboInOwl#shorthand'
-                    }:
-                        self.name_index[filtered_name].add(iri)  # (name, name_type, iri)
-                        tokens = self.tokenize(self.remove_punctuation(filtered_name))  # remove all punctuation
-                        self.iri_name_index[iri].add((name, filtered_name, tuple(tokens)))
-                
-        for iri, d in tqdm(self.mesh_index.iri2name.items(), leave=True, position=0):
+        def add_names(rows, desc=None):
+            for chunk in chunked_map(normalise_names, rows, workers=workers, chunksize=chunksize, desc=desc):
+                for iri, name, filtered_name, tokens in chunk:
+                    self.name_index[filtered_name].add(iri)  # (name, name_type, iri)
+                    self.iri_name_index[iri].add((name, filtered_name, tokens))
+        
+        add_names([row for iri in self.efo_index.iri2name for row in self.efo_names(iri)], desc="EFO names")
+        
+        mesh_rows = []
+        mesh_iris = set()
+        for iri in tqdm(self.mesh_index.iri2name, leave=True, position=0):
             iri = self.mesh_index.get_iri(iri)
-            if iri in self.iri_name_index:
+            if (iri in self.iri_name_index) or (iri in mesh_iris):
                 continue
-            for name,name_type,score in self.mesh_index.get_names(iri):
-                filtered_name = self.filter_name(name)
-                if filtered_name:
-                    if name_type in {
-                        'http://id.nlm.nih.gov/mesh/vocab#prefLabel',
-                        'http://www.w3.org/2000/01/rdf-schema#label',
-                        'http://id.nlm.nih.gov/mesh/vocab#altLabel'
-                    }:
-                        self.name_index[filtered_name].add(iri)  # (name, name_type, iri)
-                        tokens = self.tokenize(self.remove_punctuation(filtered_name))  # remove all punctuation
-                        self.iri_name_index[iri].add((name, filtered_name, tuple(tokens)))
-
-        for iri, d in tqdm(self.umls_index.iri2name.items(), leave=True, position=0):
-            for name_type, umls_name_type, name in d:
-                filtered_name = self.filter_name(name)
-                if filtered_name:
-                    name_type = self.umls_index.name_types[umls_name_type]
-                    if name_type in {
-                        'umls:pref_term',
-                        'umls:case_word_order_variant',
-                        'umls:case_variant',
-                        'umls:variant',
-                        'umls:word_order_variant'
-                    }:
-                        self.name_index[filtered_name].add(iri)  # (name, name_type, iri)
-                        tokens = self.tokenize(self.remove_punctuation(filtered_name))  # remove all punctuation
-                        self.iri_name_index[iri].add((name, filtered_name, tuple(tokens)))
+            mesh_iris.add(iri)
+            mesh_rows.extend(self.mesh_names(iri))
+        add_names(mesh_rows, desc="MeSH names")
+        
+        add_names([row for iri in self.umls_index.iri2name for row in self.umls_names(iri)], desc="UMLS names")
                         
         self.gen_kmer_index()
     
+    def efo_names(self, iri):
+        """`(iri, name)` rows for the EFO names of `iri` that go into the query index."""
+        return [(iri, name) for name_type, name in self.efo_index.iri2name.get(iri, ()) if name_type in self.efo_name_types]
+    
+    def mesh_names(self, iri):
+        if not iri in self.mesh_index.iri2name:
+            return []
+        return [(iri, name) for name,name_type,score in self.mesh_index.get_names(iri) if name_type in self.mesh_name_types]
+    
+    def umls_names(self, iri):
+        return [
+            (iri, name)
+            for name_type, umls_name_type, name in self.umls_index.iri2name.get(iri, ())
+            if self.umls_index.name_types.get(umls_name_type) in self.umls_name_types
+        ]
+    
+    def update_names(self, *changes, workers=None, chunksize=10000):
+        """Patch `name_index`, `iri_name_index` and `token_index` for the IRIs touched by ontology updates.
+
+`changes` are the `ChangeReport`s returned by `EfoIndex.update_from_file` and `MeshIndex.update_from_file` (run
+first, so the ontology indexes hold the new release). Only the names of the touched IRIs are normalised again;
+every other entry is kept. Returns a `ChangeReport` of the name indexes.
+"""
+        iris = set()
+        for report in changes:
+            iris.update(report.keys('names'))
+        
+        # saved indexes are read-only views; patching needs them in memory
+        if not isinstance(self.name_index, dict):
+            self.name_index = {k:set(vs) for k,vs in self.name_index.items()}
+        if not isinstance(self.iri_name_index, dict):
+            self.iri_name_index = {k:set(vs) for k,vs in self.iri_name_index.items()}
+        token_index = self.token_index  # loading it sets `token_index_size_limit`
+        size_limit = getattr(self, 'token_index_size_limit', None)
+        patch_tokens = not size_limit
+        if patch_tokens and not all(isinstance(level, dict) for level in token_index.values()):
+            self.token_index = {k1:{k2:set(v2) for k2,v2 in v1.items()} for k1,v1 in token_index.items()}
+        
+        def normalise(rows, desc=None):
+            entries = defaultdict(set)
+            for chunk in chunked_map(normalise_names, rows, workers=workers, chunksize=chunksize, desc=desc):
+                for iri, name, filtered_name, tokens in chunk:
+                    entries[iri].add((name, filtered_name, tokens))
+            return entries
+        
+        # as in `gen_query_index`, MeSH names are only used for IRIs without EFO names
+        iris = sorted(iris)
+        entries = normalise([row for iri in iris for row in self.efo_names(iri)], desc="EFO names")
+        for iri, e in normalise([row for iri in iris if not iri in entries for row in self.mesh_names(iri)], desc="MeSH names").items():
+            entries[iri].update(e)
+        for iri, e in normalise([row for iri in iris for row in self.umls_names(iri)], desc="UMLS names").items():
+            entries[iri].update(e)
+        
+        old_entries = {iri:set(self.iri_name_index[iri]) for iri in iris if iri in self.iri_name_index}
+        # names touched, and what each held before (names new to `name_index` are left out, so report as added)
+        touched_names = set()
+        old_names = {}
+        for iri in iris:
+            old = old_entries.get(iri, set())
+            new = entries.get(iri, set())
+            if old == new:
+                continue
+            
+            old_filtered = {f for n,f,t in old}
+            new_filtered = {f for n,f,t in new}
+            for f in old_filtered ^ new_filtered:
+                if not f in touched_names:
+                    touched_names.add(f)
+                    if f in self.name_index:
+                        old_names[f] = set(self.name_index[f])
+            for f in old_filtered - new_filtered:
+                self.name_index[f].discard(iri)
+                if not self.name_index[f]:
+                    del self.name_index[f]
+            for f in new_filtered - old_filtered:
+                self.name_index.setdefault(f, set()).add(iri)
+            
+            if patch_tokens:
+                old_kmers = {kmer for n,f,t in old for kmer in self.gen_kmers(t)}
+                new_kmers = {kmer for n,f,t in new for kmer in self.gen_kmers(t)}
+                for kmer in old_kmers - new_kmers:
+                    level = self.token_index[len(kmer)]
+                    level[kmer].discard(iri)
+                    if not level[kmer]:
+                        del level[kmer]
+                for kmer in new_kmers - old_kmers:
+                    self.token_index.setdefault(len(kmer), {}).setdefault(kmer, set()).add(iri)
+            
+            if new:
+                self.iri_name_index[iri] = new
+            else:
+                del self.iri_name_index[iri]
+        
+        if not patch_tokens:
+            # postings dropped for exceeding the size limit cannot be patched, so rebuild from the patched names
+            self.gen_kmer_index(size_limit=size_limit)
+        self.set_modified('name_index', 'iri_name_index', 'token_index')
+        
+        report = ChangeReport(source='names')
+        report.add_mapping('iri_name_index', old_entries, {iri:self.iri_name_index[iri] for iri in iris if iri in self.iri_name_index})
+        report.add_mapping('name_index', old_names, {f:self.name_index[f] for f in touched_names if f in self.name_index})
+        return report
+    
+    def gen_kmers(self, l, k=3):
+        if len(l) < k:
+            yield tuple(sorted(l))
+        for i in range(len(l)-k+1):
+            yield tuple(sorted(l[i:i+k]))
+    
     def gen_kmer_index(self, size_limit=None):
-        def gen_kmers(l, k=3):
-            if len(l) < k:
-                yield tuple(sorted(l))
-            for i in range(len(l)-k+1):
-                yield tuple(sorted(l[i:i+k]))
-
         token_index = defaultdict(lambda :defaultdict(set))
         for iri,data in tqdm(self.iri_name_index.items(), position=0, leave=True, desc="Generating kmer index"):
             for name, filtered_name, tokens in data:
-                for kmer in gen_kmers(tokens):
+                for kmer in self.gen_kmers(tokens):
                     token_index[len(kmer)][kmer].add(iri)
         
+        self.token_index_size_limit = size_limit
         if size_limit:
             self.token_index = {k1:{k2:v2 for k2,v2 in v1.items() if len(v2)<=size_limit} for k1,v1 in token_index.items()}
         else:
             self.token_index = {k1:{k2:v2 for k2,v2 in v1.items()} for k1,v1 in token_index.items()}
     
-    def save_indexes(self, data_dir=None):
+    def save_indexes(self, data_dir=None, binary=True):
         if data_dir is None:
             data_dir = self.data_dir
         
-        with open(f'{data_dir}/name_index.json', 'wt') as f:
-            json.dump({k:list(vs) for k,vs in self.name_index.items()}, f)
-        with open(f'{data_dir}/iri_name_index.json', 'wt') as f:
-            json.dump({k:list(vs) for k,vs in self.iri_name_index.items()}, f)
-            
-    def load_indexes(self, data_dir=None):
+        if binary:
+            save_mapping(f'{data_dir}/name_index.oidx', self.name_index)
+            save_mapping(f'{data_dir}/iri_name_index.oidx', self.iri_name_index, fields='ssw', scalar=False)
+        else:
+            with open(f'{data_dir}/name_index.json', 'wt') as f:
+                json.dump({k:sorted(vs) for k,vs in self.name_index.items()}, f, sort_keys=True)
+            with open(f'{data_dir}/iri_name_index.json', 'wt') as f:
+                json.dump({k:sorted(vs) for k,vs in self.iri_name_index.items()}, f, sort_keys=True)
+        
+        self.save_token_index(data_dir)
+        self.set_saved(data_dir, 'name_index', 'iri_name_index', 'token_index')
+    
+    def iri_name_index_path(self, data_dir=None):
         if data_dir is None:
             data_dir = self.data_dir
+        
+        path = f'{data_dir}/iri_name_index.oidx'
+        if os.path.exists(path):
+            return path
+        return f'{data_dir}/iri_name_index.json'
+    
+    def save_token_index(self, data_dir=None):
+        if data_dir is None:
+            data_dir = self.data_dir
+        
+        save_kmer_index(
+            f'{data_dir}/token_index.oidx', 
+            self.token_index, 
+            source_hash=file_digest(self.iri_name_index_path(data_dir)), 
+            size_limit=getattr(self, 'token_index_size_limit', None)
+        )
             
-        with open(f'{data_dir}/name_index.json', 'rt') as f:
-            self.name_index = {k:set(vs) for k,vs in json.load(f).items()}
-        with open(f'{data_dir}/iri_name_index.json', 'rt') as f:
-            self.iri_name_index = {k:{(n,f,tuple(t)) for n,f,t in vs} for k,vs in json.load(f).items()}
-            
-        self.gen_kmer_index()
+    def load_token_index(self, data_dir=None, size_limit=None):
+        """Open the saved k-mer index, rebuilding (and re-saving) it if it is missing or was built from a different `iri_name_index`.
+
+Without a `size_limit`, the one set in `token_index_size_limit` before loading is expected, or else whichever the
+saved index was built with; a rebuild keeps that limit.
+"""
+        if data_dir is None:
+            data_dir = self.data_dir
+        
+        path = f'{data_dir}/token_index.oidx'
+        if size_limit is None:
+            size_limit = self.__dict__.get('token_index_size_limit')
+        if size_limit is None:
+            try:
+                size_limit = kmer_index_meta(path).get('size_limit')
+            except (OSError, ValueError):
+                pass
+        
+        source_hash = file_digest(self.iri_name_index_path(data_dir))
+        try:
+            token_index = load_kmer_index(path, source_hash=source_hash, size_limit=size_limit)
+        except (OSError, ValueError):
+            token_index = None
+        
+        if token_index is None:
+            self.gen_kmer_index(size_limit=size_limit)
+            try:
+                save_kmer_index(path, self.token_index, source_hash=source_hash, size_limit=size_limit)
+            except OSError:
+                pass
+        else:
+            self.token_index = token_index
+            self.token_index_size_limit = size_limit
             
     def query(self, q, filter_query=True):
         if filter_query:
             q  = self.filter_name(q)
         if q in self.name_index:
             return self.name_index[q]
+    
+    def query_many(self, qs, filter_query=True, workers=None, chunksize=10000):
+        """Batch version of `query`, returning results aligned to `qs`.
+
+Inputs are deduplicated and normalised once; with `workers` > 1 the normalisation is spread over a process pool.
+"""
+        qs = list(qs)
+        unique_qs = list(dict.fromkeys(qs))
+        
+        if filter_query:
+            filtered_qs = [f for chunk in chunked_map(filter_names, unique_qs, workers=workers, chunksize=chunksize, desc="Normalising queries") for f in chunk]
+        else:
+            filtered_qs = unique_qs
+        
+        results = {}
+        filtered_results = {}
+        for q, f in zip(unique_qs, filtered_qs):
+            if not f in filtered_results:
+                filtered_results[f] = self.name_index.get(f)
+            results[q] = filtered_results[f]
+        
+        return [results[q] for q in qs]
+    
+    def search(self, q, top_k=10, size_limit=1000, filter_query=True):
+        """Fuzzy name search using the k-mer `token_index`.
+
+Candidates are the IRIs posted under the query's token k-mers (rarest k-mers first, skipping any k-mer posted to more
+than `size_limit` IRIs). Each candidate is scored by the best Jaccard overlap between the query k-mers and the k-mers of
+one of its names, and candidates are visited in order of k-mer hits so the scan stops once no remaining candidate can
+beat the current top-k. Returns a list of `(iri, score, name)`, best first.
+
+With a `token_index_size_limit`, a query k-mer missing from the index may have been dropped for being too common,
+so it is counted as skipped too. IRIs sharing only skipped k-mers with the query are not candidates at all.
+"""
+        if filter_query:
+            q = self.filter_name(q)
+        q_kmers = set(self.gen_kmers(self.tokenize(self.remove_punctuation(q))))
+        if not q_kmers:
+            return []
+        
+        token_index = self.token_index  # loading it sets `token_index_size_limit`
+        pruned = bool(getattr(self, 'token_index_size_limit', None))
+        
+        postings = []
+        skipped = 0
+        for kmer in q_kmers:
+            level = token_index.get(len(kmer), {})
+            if not kmer in level:
+                # its IRIs may have been dropped from a size-limited index, so any candidate could share it
+                skipped += pruned
+                continue
+            iris = level[kmer]
+            if size_limit and len(iris) > size_limit:
+                skipped += 1
+            else:
+                postings.append(iris)
+        
+        hits = Counter()
+        for iris in sorted(postings, key=len):
+            hits.update(iris)
+        
+        best = []
+        for iri, n in hits.most_common():
+            if len(best) >= top_k and (n + skipped) / len(q_kmers) <= best[0][0]:
+                break
+            
+            score, name = max(
+                (len(q_kmers & kmers) / len(q_kmers | kmers), name)
+                for name, kmers in ((name, set(self.gen_kmers(tokens))) for name, filtered_name, tokens in self.iri_name_index[iri])
+            )
+            if len(best) < top_k:
+                heapq.heappush(best, (score, iri, name))
+            elif score > best[0][0]:
+                heapq.heapreplace(best, (score, iri, name))
+        
+        return [(iri, score, name) for score, iri, name in sorted(best, reverse=True)]
         
     def get_name(self, iri):
         try:
@@ -302,7 +633,7 @@ class NameIndex(TextFilter):
             pass
         
         
-class QualifierIndex(TextFilter):
+class QualifierIndex(TextFilter, LazyIndexes):
     """For extraction of allowed qualifiers from indications
 
 From `NCIT` and `HPO`.
@@ -336,42 +667,43 @@ Miscellaneous
 * `http://purl.obolibrary.org/obo/NCIT_C34340` Accidental
   """
     
-    def __init__(self, data_dir='.'):
+    index_loaders = {
+        'token_qualifier_index': 'load_qualifier_indexes',
+        'ols_qualifiers': 'load_qualifier_indexes',
+    }
+    index_loader_files = {
+        'token_qualifier_index': ('ols_token_qualifier_index.pkl', 'ols_qualifiers.pkl'),
+        'ols_qualifiers': ('ols_token_qualifier_index.pkl', 'ols_qualifiers.pkl'),
+    }
+    
+    def __init__(self, data_dir='.', ols_client=None):
         self.data_dir = data_dir
+        self.ols_client = ols_client
+        self.qualifier_matcher = None
         
         try:
             self.load_indexes()
         except:
             pass
 
+    def get_ols_client(self):
+        """The `OlsClient` queries go through, by default one caching responses in `data_dir`."""
+        if self.ols_client is None:
+            self.ols_client = OlsClient(cache_path=f'{self.data_dir}/ols_cache.sqlite')
+        return self.ols_client
+
     def get_iri_terms(self, q):
         iri, source = q
-        iri_str = urllib.parse.quote(iri, safe='')
-        iri_str = urllib.parse.quote(iri_str, safe='')
-        r = requests.get(f"https://www.ebi.ac.uk/ols/api/ontologies/{source}/terms/{iri_str}", params={'size':10, 'page':1})
-        return r.json()
+        return self.get_ols_client().get_terms(iri, source)
 
     def get_iri_decendents(self, q):
-        iri, source = q
-        iri_str = urllib.parse.quote(iri, safe='')
-        iri_str = urllib.parse.quote(iri_str, safe='')
-        data = []
-        p = 0
-        while True:
-            r = requests.get(f"https://www.ebi.ac.uk/ols/api/ontologies/{source}/terms/{iri_str}/hierarchicalDescendants", params={'size': 50, 'page': p}).json()
-            if '_embedded' in r:
-                data.extend(r['_embedded']['terms'])
-            if r['page']['number'] >= r['page']['totalPages'] -1:
-                break
-            else:
-                p+=1
-        return data
+        return self.get_ols_client().get_descendants_many([q])[q]
     
     def gen_indexes(self, ncit=True, hpo=True, miscellaneous=True):
 
-        hp_qualifiers = {}
+        hp_roots = []
         if hpo:
-            for iri in tqdm({
+            hp_roots = [(iri, 'hp') for iri in (
                 'http://purl.obolibrary.org/obo/HP_0031797',
                 'http://purl.obolibrary.org/obo/HP_0011008', 
                 'http://purl.obolibrary.org/obo/HP_0003679', 
@@ -380,16 +712,11 @@ Miscellaneous
                 'http://purl.obolibrary.org/obo/HP_0025280', 
                 'http://purl.obolibrary.org/obo/HP_0012824', 
                 'http://purl.obolibrary.org/obo/HP_0040279',
-            }, leave=True, position=0, desc="HPO qualifiers"):
-                for r in self.get_iri_decendents((iri, 'hp')):
-                    hp_qualifiers[(r['iri'], r['ontology_name'])] = {r['label']}
-                    if 'synonyms' in r:
-                        if r['synonyms']:
-                            hp_qualifiers[(r['iri'], r['ontology_name'])].update(r['synonyms'])
+            )]
 
-        ncit_qualifiers = {}
+        ncit_roots = []
         if ncit:
-            for iri in tqdm({
+            ncit_roots = [(iri, 'ncit') for iri in (
             #     'http://purl.obolibrary.org/obo/NCIT_C41009', # Qualifier
                 'http://purl.obolibrary.org/obo/NCIT_C13442', # Anatomical qualifier
                 'http://purl.obolibrary.org/obo/NCIT_C21514', # Temporal qualifier
@@ -397,12 +724,20 @@ Miscellaneous
                 'http://purl.obolibrary.org/obo/NCIT_C27992', # Disease qualifier
                 'http://purl.obolibrary.org/obo/NCIT_C28102', # Disease clinical qualifier
                 'http://purl.obolibrary.org/obo/NCIT_C27993', # General qualifier (contains 'primary')
-            }, leave=True, position=0, desc="NCIT qualifiers"):
-                for r in self.get_iri_decendents((iri, 'ncit')):
-                    ncit_qualifiers[(r['iri'], r['ontology_name'])] = {r['label']}
+            )]
+        
+        # every root and page is fetched at once
+        descendants = self.get_ols_client().get_descendants_many(hp_roots + ncit_roots, desc="OLS qualifiers")
+        
+        hp_qualifiers = {}
+        ncit_qualifiers = {}
+        for roots, qualifiers in ((hp_roots, hp_qualifiers), (ncit_roots, ncit_qualifiers)):
+            for root in roots:
+                for r in descendants[root]:
+                    qualifiers[(r['iri'], r['ontology_name'])] = {r['label']}
                     if 'synonyms' in r:
                         if r['synonyms']:
-                            ncit_qualifiers[(r['iri'], r['ontology_name'])].update(r['synonyms'])
+                            qualifiers[(r['iri'], r['ontology_name'])].update(r['synonyms'])
 
         if miscellaneous:
             custom_qualifiers = {
@@ -426,51 +761,112 @@ Miscellaneous
                     token_qualifier_index[t].add((s, (iri, source)))
 
         self.token_qualifier_index = dict(token_qualifier_index)
+        self.qualifier_matcher = None
 
         
+    def token_qualifier_index_path(self, data_dir=None):
+        if data_dir is None:
+            data_dir = self.data_dir
+        return f'{data_dir}/ols_token_qualifier_index.pkl'
+    
     def save_indexes(self, data_dir=None):
         if data_dir is None:
             data_dir = self.data_dir
             
-        with open(f'{data_dir}/ols_token_qualifier_index.pkl', 'wb') as f:
+        with open(self.token_qualifier_index_path(data_dir), 'wb') as f:
             pickle.dump(self.token_qualifier_index, f)
         with open(f'{data_dir}/ols_qualifiers.pkl', 'wb') as f:
             pickle.dump(self.ols_qualifiers, f)
+        self.set_saved(data_dir, 'token_qualifier_index', 'ols_qualifiers')
             
-    def load_indexes(self, data_dir=None):
+    def load_qualifier_indexes(self, data_dir=None):
         if data_dir is None:
             data_dir = self.data_dir
             
-        with open(f'{data_dir}/ols_token_qualifier_index.pkl', 'rb') as f:
+        with open(self.token_qualifier_index_path(data_dir), 'rb') as f:
             self.token_qualifier_index = pickle.load(f)
         with open(f'{data_dir}/ols_qualifiers.pkl', 'rb') as f:
             self.ols_qualifiers = pickle.load(f)
+        self.qualifier_matcher = None
 
             
+    def gen_qualifier_matcher(self):
+        """`(automaton, pattern_qualifiers)` over the filtered strings of every qualifier in `token_qualifier_index`.
+
+`pattern_qualifiers[pattern_id]` lists `(rank, qualifier, (iri, source), tokens)` for the qualifiers with that filtered
+string, `rank` being the qualifier's place in the order matches are taken in (longest qualifier first).
+"""
+        qualifiers = set()
+        for matches in self.token_qualifier_index.values():
+            qualifiers.update(matches)
+        
+        patterns = {}
+        pattern_qualifiers = []
+        for rank, (m, x) in enumerate(sorted(qualifiers, key=lambda x:(len(x[0]),x[0],x), reverse=True)):
+            filtered_m = self.filter_name(m)
+            if not filtered_m:
+                continue
+            if not filtered_m in patterns:
+                patterns[filtered_m] = len(patterns)
+                pattern_qualifiers.append([])
+            pattern_qualifiers[patterns[filtered_m]].append((rank, m, x, frozenset(self.tokenize(filtered_m))))
+        
+        self.qualifier_matcher = (AhoCorasick(patterns), pattern_qualifiers)
+        return self.qualifier_matcher
+    
+    def get_qualifier_matcher(self):
+        if self.qualifier_matcher is None:
+            self.gen_qualifier_matcher()
+        return self.qualifier_matcher
+    
     def extract_qualifiers(self, q):
+        """`(q, qualifiers)` with every qualifier found in `q` cut out of it.
+
+Qualifiers are matched as literal substrings of the lower-cased query in one scan of the qualifier automaton, and
+only count if they share a token with the query. Where matches overlap the longest qualifier wins.
+"""
+        automaton, pattern_qualifiers = self.get_qualifier_matcher()
         q_tokens = set(self.tokenize(self.filter_name(q)))
-        candidate_matches = set()
-        for t in q_tokens:
-            if t in self.token_qualifier_index:
-                candidate_matches.update(self.token_qualifier_index[t])
-
-    #     return candidate_matches
-        candidate_matches_2 = set()
-        for m,(iri,source) in candidate_matches:
-            m_tokens = set(self.tokenize(self.filter_name(m)))
-            if not m_tokens - q_tokens:
-                candidate_matches_2.add((m,(iri,source)))
-
-        filter_q = re.sub('-', ' ', q.lower())
+        filter_q = q.lower().replace('-', ' ')
+        
+        found = []
+        for start, end, p in automaton.finditer(filter_q):
+            for rank, m, x, m_tokens in pattern_qualifiers[p]:
+                if not m_tokens.isdisjoint(q_tokens):
+                    found.append((rank, start, end, m, x))
+        
         qualifiers = set()
-        for m,(iri,source) in sorted(candidate_matches, key=lambda x:(len(x[0]),x[0],x), reverse=True):
-            matches = list(re.finditer(self.filter_name(m), filter_q))
-            if matches:
-                qualifiers.add((m,(iri,source)))
-                match_spans = [match.span() for match in matches]
-                for (start, end) in sorted(match_spans, reverse=True):
-                    q = self.normalise_whitespace(q[:start] + q[end:])
-                    filter_q = re.sub('-', ' ', q.lower())
-
-
+        spans = []
+        for rank, start, end, m, x in sorted(found):
+            if all(end <= s or e <= start for s, e in spans):
+                qualifiers.add((m, x))
+                spans.append((start, end))
+        
+        if spans:
+            pieces = []
+            i = 0
+            for start, end in sorted(spans):
+                pieces.append(q[i:start])
+                i = end
+            pieces.append(q[i:])
+            q = self.normalise_whitespace(''.join(pieces))
+        
         return q, tuple(qualifiers)
+    
+    def extract_qualifiers_many(self, qs, workers=None, chunksize=10000):
+        """Batch version of `extract_qualifiers`, returning results aligned to `qs`.
+
+Inputs are deduplicated; with `workers` > 1 they are spread over a process pool.
+"""
+        qs = list(qs)
+        unique_qs = list(dict.fromkeys(qs))
+        self.get_qualifier_matcher()  # built before the index is copied into workers
+        
+        results = {}
+        for chunk in chunked_map(
+            extract_qualifiers_chunk, unique_qs, workers=workers, chunksize=chunksize, desc="Extracting qualifiers",
+            initializer=init_qualifier_worker, initargs=(self,)
+        ):
+            results.update(chunk)
+        
+        return [results[q] for q in qs]
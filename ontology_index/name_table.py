@@ -0,0 +1,154 @@
+import json
+from functools import lru_cache
+from collections.abc import Mapping
+from .binary_index import pack_mapping, write_index, BinaryIndexFile, MmapMapping
+from .name_index import TextFilter
+from .parallel import chunked_map
+
+NAMES_INFO = {'kind': 'multimap', 'fields': 's', 'scalar': True}
+QUERIES_INFO = {'kind': 'multimap', 'fields': 'ss', 'scalar': False}
+
+_worker_state = {}
+
+
+def init_name_table_worker(qualifier_index, min_length, extract_qualifiers):
+    _worker_state.update(
+        text_filter=TextFilter(),
+        qualifier_index=qualifier_index,
+        min_length=min_length,
+        extract_qualifiers=extract_qualifiers,
+    )
+
+
+def name_table_entries(rows):
+    """`(iri, filtered_names)` pairs -> `(iri, names, keys, queries)`, see `NameXrefTable`."""
+    text_filter = _worker_state['text_filter']
+    qualifier_index = _worker_state['qualifier_index']
+    min_length = _worker_state['min_length']
+    extract_qualifiers = _worker_state['extract_qualifiers']
+
+    entries = []
+    for iri, names in rows:
+        if min_length:
+            names = {n for n in names if len(n)>=min_length}
+        if not names:
+            continue
+
+        keys = set()
+        queries = set()
+        for n in names:
+            filtered_n = text_filter.filter_name(n)
+            queries.add((filtered_n, None))
+            if extract_qualifiers:
+                new_n, quals = qualifier_index.extract_qualifiers(n)
+                queries.add((text_filter.filter_name(new_n), tuple(sorted(quals))))
+                keys.add(qualifier_index.extract_qualifiers(filtered_n)[0])
+            else:
+                keys.add(filtered_n)
+        entries.append((iri, names, keys, queries))
+    return entries
+
+
+def encode_quals(quals):
+    return '' if quals is None else json.dumps(quals)
+
+
+def decode_quals(s):
+    if s == '':
+        return None
+    return tuple((m, tuple(q)) for m, q in json.loads(s))
+
+
+class NameXrefTable():
+    """The names of each IRI as `XrefIndex.name_xref` compares them, for one `min_length` / `extract_qualifiers` setting.
+
+`names[iri]` holds the IRI's filtered names of at least `min_length` characters, `keys[iri]` the same names
+normalised for comparison (with qualifiers stripped if `extract_qualifiers`), and `queries[iri]` the
+`(filtered_name, qualifiers)` lookups into the name index that find its candidates (`qualifiers` is `None` for the
+unstripped name). With these precomputed, scoring a candidate is a set intersection. The same candidates come up
+for many queries, so lookups into a saved table are cached.
+"""
+
+    names_cache_size = 1<<16
+
+    def __init__(self, names, keys, queries, min_length=4, extract_qualifiers=True):
+        self.names = names
+        self.keys = keys
+        self.queries = queries
+        self.min_length = min_length
+        self.extract_qualifiers = extract_qualifiers
+        if not isinstance(names, dict):
+            self.get_names = lru_cache(maxsize=self.names_cache_size)(self.get_names)
+
+    @classmethod
+    def build(cls, iri_name_index, qualifier_index, min_length=4, extract_qualifiers=True, workers=None, chunksize=10000):
+        if extract_qualifiers:
+            # build before the index is copied into workers
+            qualifier_index.get_qualifier_matcher()
+        rows = [(iri, {filtered_name for name, filtered_name, tokens in data}) for iri, data in iri_name_index.items()]
+
+        names, keys, queries = {}, {}, {}
+        for chunk in chunked_map(
+            name_table_entries, rows, workers=workers, chunksize=chunksize, desc="Name xref table",
+            initializer=init_name_table_worker, initargs=(qualifier_index, min_length, extract_qualifiers)
+        ):
+            for iri, iri_names, iri_keys, iri_queries in chunk:
+                names[iri] = iri_names
+                keys[iri] = iri_keys
+                queries[iri] = iri_queries
+        return cls(names, keys, queries, min_length=min_length, extract_qualifiers=extract_qualifiers)
+
+    def save(self, path, source_hash=None):
+        arrays = {}
+        for name, mapping in (('names', self.names), ('keys', self.keys)):
+            arrays.update(pack_mapping(mapping, prefix=f'{name}/')[0])
+        queries = {iri:{(q, encode_quals(quals)) for q, quals in qs} for iri, qs in self.queries.items()}
+        arrays.update(pack_mapping(queries, fields='ss', scalar=False, prefix='queries/')[0])
+
+        write_index(path, arrays, meta={'min_length': self.min_length, 'extract_qualifiers': self.extract_qualifiers, 'source_hash': source_hash})
+
+    @classmethod
+    def load(cls, path, source_hash=None):
+        """Open a saved table, or return `None` if it was built from a different `iri_name_index`."""
+        index_file = BinaryIndexFile(path)
+        meta = index_file.meta
+        if meta['source_hash'] != source_hash:
+            return None
+
+        return cls(
+            MmapMapping(index_file, NAMES_INFO, prefix='names/'),
+            MmapMapping(index_file, NAMES_INFO, prefix='keys/'),
+            QueriesView(MmapMapping(index_file, QUERIES_INFO, prefix='queries/')),
+            min_length=meta['min_length'],
+            extract_qualifiers=meta['extract_qualifiers'],
+        )
+
+    def get_names(self, iri):
+        """`(names, keys)` for `iri`, both empty if it has no names long enough."""
+        if not iri in self.names:
+            return set(), set()
+        return self.names[iri], self.keys[iri]
+
+    def get_queries(self, iri):
+        if not iri in self.queries:
+            return set()
+        return self.queries[iri]
+
+
+class QueriesView(Mapping):
+    """`{iri: {(filtered_name, qualifiers), ...}}` over the saved queries, decoding the qualifiers."""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def __getitem__(self, iri):
+        return {(q, decode_quals(quals)) for q, quals in self.mapping[iri]}
+
+    def __contains__(self, iri):
+        return iri in self.mapping
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def __len__(self):
+        return len(self.mapping)
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .cache import BoundedCache
+from tqdm.auto import tqdm
+
+import requests
+
+
+class OfflineError(LookupError):
+    pass
+
+
+class OlsClient():
+    """Fetches JSON from the OLS API with `workers` requests in flight at once, retrying failed requests.
+
+`base_url` may also be a directory (a path or `file://` URL) of saved responses, read from
+`{base_url}/{cache_key}.json`, e.g. `ontologies/hp/terms/{iri}/hierarchicalDescendants?page=0&size=50.json`; a
+response missing from it raises `FileNotFoundError`.
+
+Responses are kept in a `BoundedCache`, written through to an SQLite file at `cache_path` if given, keyed by the
+request URL relative to `base_url` (so a cache filled from the public OLS also serves a mirror or a local mock
+server). With `offline`, nothing is fetched and a request missing from the cache raises `OfflineError`.
+
+The cache is only touched from the calling thread, the pool threads only make the HTTP requests.
+"""
+
+    def __init__(self, base_url='https://www.ebi.ac.uk/ols/api', cache_path=None, workers=8, retries=3, backoff=1.0, timeout=60, offline=False):
+        self.base_url = base_url.rstrip('/')
+        self.base_dir = None
+        if base_url.startswith('file://'):
+            self.base_dir = urllib.parse.unquote(urllib.parse.urlparse(base_url).path)
+        elif not '://' in base_url:
+            self.base_dir = base_url
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.offline = offline
+        self.cache = BoundedCache(maxsize=10000, path=cache_path)
+
+    @staticmethod
+    def cache_key(path, params=None):
+        if not params:
+            return path
+        return f"{path}?{urllib.parse.urlencode(sorted(params.items()))}"
+
+    def fetch(self, path, params=None):
+        """GET `{base_url}/{path}` (or read it from the `base_url` directory) and return the decoded JSON, retrying
+with exponential backoff."""
+        if not self.base_dir is None:
+            with open(os.path.join(self.base_dir, f"{self.cache_key(path, params)}.json"), 'rt') as f:
+                return json.load(f)
+
+        for attempt in range(self.retries + 1):
+            try:
+                r = requests.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+                r.raise_for_status()
+                return r.json()
+            except requests.RequestException as e:
+                # client errors other than rate limiting will not go away on a retry
+                status = None if getattr(e, 'response', None) is None else e.response.status_code
+                if attempt == self.retries or (not status is None and status < 500 and status != 429):
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+
+    def get_many(self, queries, desc=None):
+        """`[json, ...]` for `[(path, params), ...]`, from the cache where possible and fetching the rest concurrently."""
+        results = [None] * len(queries)
+        missing = {}
+        for i, (path, params) in enumerate(queries):
+            key = self.cache_key(path, params)
+            value = self.cache.get(key)
+            if value is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                results[i] = value
+
+        if missing and self.offline:
+            raise OfflineError(f"{len(missing)} OLS requests are not cached, e.g. {next(iter(missing))}")
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.fetch, *queries[ids[0]]):key for key, ids in missing.items()}
+                for future in tqdm(as_completed(futures), total=len(futures), leave=True, position=0, desc=desc):
+                    key = futures[future]
+                    value = future.result()
+                    self.cache[key] = value
+                    for i in missing[key]:
+                        results[i] = value
+        return results
+
+    def get(self, path, params=None):
+        return self.get_many([(path, params)])[0]
+
+    @staticmethod
+    def term_path(iri, source):
+        # OLS expects the IRI double URL-encoded
+        iri_str = urllib.parse.quote(urllib.parse.quote(iri, safe=''), safe='')
+        return f"ontologies/{source}/terms/{iri_str}"
+
+    def get_terms(self, iri, source):
+        return self.get(self.term_path(iri, source), {'size': 10, 'page': 1})
+
+    def get_descendants_many(self, roots, page_size=50, desc="OLS descendants"):
+        """`{(iri, source): [term, ...]}` with the `hierarchicalDescendants` of each root.
+
+The first page of every root is fetched at once, then every remaining page of every root.
+"""
+        roots = list(roots)
+        paths = [f"{self.term_path(iri, source)}/hierarchicalDescendants" for iri, source in roots]
+        first_pages = self.get_many([(path, {'size': page_size, 'page': 0}) for path in paths], desc=desc)
+
+        queries = []
+        for path, r in zip(paths, first_pages):
+            for p in range(1, r['page']['totalPages']):
+                queries.append((path, {'size': page_size, 'page': p}))
+        pages = dict(zip((self.cache_key(*q) for q in queries), self.get_many(queries, desc=desc)))
+
+        descendants = {}
+        for root, path, r in zip(roots, paths, first_pages):
+            terms = []
+            for p in range(r['page']['totalPages'] or 1):
+                page = r if p == 0 else pages[self.cache_key(path, {'size': page_size, 'page': p})]
+                if '_embedded' in page:
+                    terms.extend(page['_embedded']['terms'])
+            descendants[root] = terms
+        return descendants
+
+    def close(self):
+        self.cache.close()
@@ -3,10 +3,55 @@ import itertools as it
 from collections import defaultdict
 import pickle
 import json
-from tqdm.auto import tqdm
-import zipfile
+import os
+import tempfile
+from array import array
+from .rel_graph import RelGraph
+from .equivalence import EquivalenceClasses
+from .reachability import ReachabilityIndex
+from .tree_numbers import TreeNumberIndex, tn_ancestors, close_pairs
+from .similarity import EfoSimilarity, MeshSimilarity
+from .cache import BoundedCache
+from .binary_index import save_mapping, open_index
+from .lazy_index import LazyIndexes
+from .parallel import chunked_map
+from .traversal import bounded_bfs, pairwise_distances, DistanceMatrix
+from .streaming import RelsHandler, XrefHandler, NamesHandler, LinksHandler, LocalNameHandler, stream_triples, query_triples
+from .changes import ChangeReport
+from .rrf import open_release_files, byte_ranges, parse_mrconso_chunk, parse_mrsty_chunk
 
-class EfoIndex():
+def sets(d):
+    return {k:set(vs) for k,vs in d.items()}
+
+def tuple_sets(d):
+    return {k:{tuple(v) for v in vs} for k,vs in d.items()}
+
+def efo_norm_xref(iri, \
+                  prefix_source_map = {'MESH': 'mesh',
+                                       'MSH': 'mesh',
+                                       'MeSH': 'mesh',
+                                       'SCTID': 'snomed',
+                                       'SCTID_2010_1_31': 'snomed',
+                                       'SNOMEDCT': 'snomed',
+                                       'SNOMEDCT_2010_1_31': 'snomed',
+                                       'SNOMEDCT_US': 'snomed',
+                                       'SNOMEDCT_US_2018_03_01': 'snomed',
+                                       'UMLS': 'umls',
+                                       'UMLS CUI': 'umls',
+                                       'UMLS_CUI': 'umls'
+                                      },\
+                  source_ns_map = {'snomed': 'snomed:',
+                                   'mesh': 'http://id.nlm.nih.gov/mesh/2021/',
+                                   'umls': 'UMLS:'
+                                  }):
+    prefix = iri.split(':')[0]
+    code = ':'.join(iri.split(':')[1:])
+    if prefix in prefix_source_map:
+        source = prefix_source_map[prefix]
+        ns = source_ns_map[source]
+        return f"{ns}{code}"
+
+class EfoIndex(LazyIndexes):
     equivalent_rels = {
         "http://www.w3.org/2002/07/owl#equivalentClass",
         "http://purl.obolibrary.org/obo/mondo#exactMatch",
@@ -81,7 +126,31 @@ class EfoIndex():
         "http://purl.obolibrary.org/obo/MONDO_0042489",
     }
     
-    def __init__(self, data_dir='.'):
+    rel_names = ['equivalent', 'close', 'xref', 'child', 'parent']
+    
+    index_files = {
+        'disease_iris': ('efo_disease_iris', set),
+        'xref_index': ('efo_xref_index', tuple_sets),
+        'rev_xref_index': ('efo_rev_xref_index', tuple_sets),
+        'iri2name': ('efo_iri2name', tuple_sets),
+        'iri2pref_name': ('efo_iri2pref_name', dict),
+    }
+    index_loaders = {
+        'rel_graph': 'load_rel_graph',
+        'rels_index': 'load_rel_graph',
+        'rev_rels_index': 'load_rel_graph',
+        'reachability': 'load_reachability',
+    }
+    index_loader_files = {
+        'rel_graph': ('efo_rel_graph.oidx', 'efo_rels_index.json', 'efo_rev_rels_index.json'),
+        'rels_index': ('efo_rel_graph.oidx', 'efo_rels_index.json', 'efo_rev_rels_index.json'),
+        'rev_rels_index': ('efo_rel_graph.oidx', 'efo_rels_index.json', 'efo_rev_rels_index.json'),
+        'reachability': ('efo_reachability.oidx',),
+    }
+    
+    cache_size = 100000
+    
+    def __init__(self, data_dir='.', cache=None):
         self.data_dir = data_dir
         
         self.rel_dict = {
@@ -100,129 +169,220 @@ class EfoIndex():
             **{k:'child' for k in self.parent_rels},
         }
         
-        self.efo_graph = rdflib.ConjunctiveGraph(store="Sleepycat")
-        
-        
+        # only needed for SPARQL queries and `gen_*_indexes`; `build_from_file` reads the OWL file directly
+        self.efo_graph = None
         try:
+            self.efo_graph = rdflib.ConjunctiveGraph(store="Sleepycat")
             r = self.efo_graph.open(f"{self.data_dir}/efo.db", create=False)
             assert r == rdflib.store.VALID_STORE, "Invalid EFO store"
         except:
             pass
         
+        # built on first use by `get_similarity_index` rather than by `preload`
+        self.similarity = None
+        
         try:
             self.load_indexes()
         except:
             pass
         
-        self.cache = {}
+        # SPARQL neighbour results, for when no rel graph is loaded
+        self.cache = cache if not cache is None else BoundedCache(maxsize=self.cache_size)
 
     def is_disease(self, iri):     
-        if (iri in self.iri2name) or (iri in self.rels_index) or (iri in self.rev_rels_index):        
-            return iri in self.disease_iris
-        
-    def get_children(self, iri, equivalents=True):
-        rels = set()
-
-        if iri in self.rels_index:
-            rels.update(self.rels_index[iri])
-        if iri in self.rev_rels_index:
-            rels.update(self.rev_rels_index[iri])
-
+        if (iri in self.iri2name) or (iri in self.rel_graph):        
+            return self.reachability.is_under(iri, self.disease_root_iris)
+    
+    def is_under(self, iri, ancestor_iris, strict=True):
+        return self.reachability.is_under(iri, ancestor_iris, strict=strict)
+    
+    def filter_under(self, iris, ancestor_iris, strict=True):
+        return self.reachability.filter_under(iris, ancestor_iris, strict=strict)
+    
+    def get_ancestors(self, iris, strict=True):
+        return self.reachability.get_ancestors(iris, strict=strict)
+    
+    def get_similarity_index(self):
+        """The `EfoSimilarity` over the current `reachability`, built the first time it is needed after that changes."""
+        if self.similarity is None or not self.similarity.reachability is self.reachability:
+            self.similarity = EfoSimilarity(self.reachability)
+        return self.similarity
+    
+    def get_similarity(self, iri1, iri2, measure='lin'):
+        return self.get_similarity_index().similarity(iri1, iri2, measure=measure)
+    
+    def get_similarities(self, pairs, measure='lin'):
+        return self.get_similarity_index().similarity_many(pairs, measure=measure)
+    
+    def _child_codes(self, equivalents=True):
         allowed_p = {'child'}
         if equivalents:
             allowed_p.add('equivalent')
-
-        return {i for p,i in rels if p in allowed_p}
+        return self.rel_graph.get_codes(allowed_p)
+        
+    def get_children(self, iri, equivalents=True):
+        i = self.rel_graph.get_id(iri)
+        if i is None:
+            return set()
+        
+        codes = self._child_codes(equivalents=equivalents)
+        return {self.rel_graph.iris[j] for p,j in self.rel_graph.neighbours(i, codes=codes)}
 
     def get_descendents(self, iris, covered_iris=None, jumps=1, equivalents=True):
         if isinstance(iris, str):
             iris = {iris}
-        iris = set(iris)
-
-        if covered_iris is None:
-            covered_iris = iris
-
+        
+        if jumps < 0 and covered_iris is None and equivalents:
+            return self.reachability.get_descendents(iris)
+        
+        ids = {self.rel_graph.get_id(iri) for iri in iris} - {None}
+        covered = set(ids)
+        if not covered_iris is None:
+            covered.update({self.rel_graph.get_id(iri) for iri in covered_iris} - {None})
+        
+        codes = self._child_codes(equivalents=equivalents)
+        
         xrefs = set()
+        frontier = ids
+        while frontier:
+            found = set()
+            for i in frontier:
+                found.update(j for p,j in self.rel_graph.neighbours(i, codes=codes))
+            xrefs.update(found)
+            
+            if jumps==0 or jumps==1:
+                break
+            jumps -= 1
+            
+            frontier = found - covered
+            covered.update(found)
 
-        for iri in iris:
-            xrefs.update(self.get_children(iri, equivalents=equivalents))  # ontology xrefs
-
-        new_xrefs = xrefs - covered_iris
-
-        if new_xrefs and not (jumps==0 or jumps==1):
-            xrefs.update(
-                self.get_descendents(
-                    new_xrefs, 
-                    covered_iris=covered_iris|xrefs, 
-                    jumps=jumps-1
-                )
-            )
-
-        return xrefs
+        return {self.rel_graph.iris[i] for i in xrefs}
         
-    def get_distant_efo_relatives(self, iri, distance=2, distant_rels={'close', 'child', 'parent'}, equivalent_rels={'equivalent'}):
-
-        def rec_f(iri, distance=2, related_iris={}):
-
-            def get_efo_relatives(iri):
-                rels = set()
+    def _inverse_rel_names(self):
+        inverse = {}
+        for p, rel in self.rel_dict.items():
+            inverse[rel] = self.rev_rel_dict[p]
+            inverse[self.rev_rel_dict[p]] = rel
+        return inverse
+    
+    def _distance_graph(self, distant_rels, equivalent_rels):
+        """Neighbour functions for the 0/1-cost traversals, as `(to_node, to_iri, neighbours, reverse_neighbours)`.
 
-                if self.rels_index:
-                    if iri in self.rels_index:
-                        rels.update(self.rels_index[iri])
-                    if iri in self.rev_rels_index:
-                        rels.update(self.rev_rels_index[iri])
+Nodes are `rel_graph` ids when a graph is loaded, otherwise IRIs looked up with SPARQL. `reverse_neighbours` is
+`None` when every edge costs the same as its inverse.
+"""
+        rel_graph = getattr(self, 'rel_graph', None)
+        inverse = self._inverse_rel_names()
+        
+        def get_costs(p):
+            if p in equivalent_rels:
+                return 0
+            if p in distant_rels:
+                return 1
+        
+        symmetric = all(get_costs(p) == get_costs(inverse.get(p, p)) for p in set(inverse) | set(distant_rels) | set(equivalent_rels))
+        
+        if rel_graph:
+            def get_edges(i):
+                return rel_graph.neighbours(i)
+            
+            def to_node(iri):
+                return rel_graph.get_id(str(iri))
+            
+            def to_iri(i):
+                return rel_graph.iris[i]
+            
+            names = rel_graph.rel_names
+        
+        else:
+            def get_edges(iri):
+                rels = self.cache.get(iri)
+                if rels is None:
+                    rels = set()
+                    p_str = ','.join(f"<{i}>" for i in self.equivalent_rels|self.close_rels|self.xref_rels|self.child_rels|self.parent_rels)
                     
-                    return rels
-                
-                else:
-                    if not iri in self.cache:
-                        p_str = ','.join(f"<{i}>" for i in self.equivalent_rels|self.close_rels|self.xref_rels|self.child_rels|self.parent_rels)
-                        
-                        query = self.efo_graph.query(f"SELECT ?p ?o WHERE {{ ?q ?p ?o . FILTER ( ?p IN({p_str}) )}}", initBindings={'q': rdflib.URIRef(iri)})
-                        rels.update({(self.rel_dict[str(p)],o) for p,o in query if isinstance(o, rdflib.term.URIRef)})
-
-                        query = self.efo_graph.query(f"SELECT ?p ?s WHERE {{ ?s ?p ?q . FILTER ( ?p IN({p_str}) )}}", initBindings={'q': rdflib.URIRef(iri)})
-                        rels.update({(self.rev_rel_dict[str(p)],s) for p,s in query if isinstance(s, rdflib.term.URIRef)})
-                        
-                        self.cache[iri] = rels
-                        
-                    return self.cache[iri]
-
-            for predicate, related_iri in get_efo_relatives(iri):
-
-                new_d = None
-                if predicate in distant_rels:
-                    new_d = distance-1
-                if predicate in equivalent_rels:
-                    new_d = distance
-
-                if (not new_d is None) and (new_d >= 0):
-                    if not ((related_iri in related_iris) and (new_d <= related_iris[related_iri])):
-                        related_iris[related_iri] = new_d
-                        related_iris = rec_f(related_iri, distance=new_d, related_iris=related_iris)
+                    query = self.efo_graph.query(f"SELECT ?p ?o WHERE {{ ?q ?p ?o . FILTER ( ?p IN({p_str}) )}}", initBindings={'q': rdflib.URIRef(iri)})
+                    rels.update({(self.rel_dict[str(p)],o) for p,o in query if isinstance(o, rdflib.term.URIRef)})
 
-            return related_iris
+                    query = self.efo_graph.query(f"SELECT ?p ?s WHERE {{ ?s ?p ?q . FILTER ( ?p IN({p_str}) )}}", initBindings={'q': rdflib.URIRef(iri)})
+                    rels.update({(self.rev_rel_dict[str(p)],s) for p,s in query if isinstance(s, rdflib.term.URIRef)})
+                    
+                    self.cache[iri] = rels
+                    
+                return rels
+            
+            def to_node(iri):
+                return rdflib.URIRef(iri)
+            
+            def to_iri(iri):
+                return str(iri)
+            
+            names = None
+        
+        def edge_costs(reverse):
+            if names is None:
+                return lambda p: get_costs(inverse.get(p, p) if reverse else p)
+            costs = [get_costs(inverse.get(p, p) if reverse else p) for p in names]
+            return costs.__getitem__
+        
+        def make_neighbours(reverse):
+            cost = edge_costs(reverse)
+            
+            def neighbours(node):
+                for p, other in get_edges(node):
+                    c = cost(p)
+                    if not c is None:
+                        yield other, c
+            
+            return neighbours
+        
+        return to_node, to_iri, make_neighbours(False), None if symmetric else make_neighbours(True)
+    
+    def get_distant_efo_relatives(self, iri, distance=2, distant_rels={'close', 'child', 'parent'}, equivalent_rels={'equivalent'}):
+        """`{iri: distance}` for everything within `distance` steps of `iri` (or of any of several IRIs, in one traversal).
 
-        r = rec_f(iri, distance=distance, related_iris={})
-        r = {str(k):distance-d for k,d in r.items()}  # adjust distances
+`distant_rels` edges cost one step and `equivalent_rels` edges none; a start IRI is only included if it is reached
+again.
+"""
+        to_node, to_iri, neighbours, _ = self._distance_graph(distant_rels, equivalent_rels)
+        
+        iris = {iri} if isinstance(iri, str) else iri
+        nodes = {to_node(i) for i in iris} - {None}
+        r = bounded_bfs(nodes, neighbours, distance)
+        return {to_iri(k):d for k,d in r.items()}
+    
+    def distance_matrix(self, iris, max_distance=2, distant_rels={'close', 'child', 'parent'}, equivalent_rels={'equivalent'}):
+        """Distances from each of `iris` to each other one within `max_distance`, as a sparse `DistanceMatrix`.
 
-        return r
+Entry `(i, j, d)` means `iris[j]` is `d` steps from `iris[i]`, as `get_distant_efo_relatives(iris[i])` would
+report it.
+"""
+        iris = list(dict.fromkeys(str(iri) for iri in iris))
+        to_node, to_iri, neighbours, reverse_neighbours = self._distance_graph(distant_rels, equivalent_rels)
+        
+        positions = {}
+        for k, iri in enumerate(iris):
+            node = to_node(iri)
+            if not node is None:
+                positions[node] = k
+        
+        distances = pairwise_distances(positions, neighbours, max_distance, reverse_neighbours=reverse_neighbours)
+        
+        rows, cols, dists = array('I'), array('I'), array('I')
+        for (s, t), d in sorted(distances.items(), key=lambda x:(positions[x[0][0]], positions[x[0][1]])):
+            rows.append(positions[s])
+            cols.append(positions[t])
+            dists.append(d)
+        return DistanceMatrix(iris, rows, cols, dists)
 
     def get_efo_links(self, iris, distance=2):
-        mappings = {}
-        for iri in iris:
-            rels = self.get_distant_efo_relatives(rdflib.URIRef(iri), distance=distance)
-            mappings[iri] = set(rels.items())
+        links = {}
+        for s_iri, t_iri, d in self.distance_matrix(iris, max_distance=distance):
+            k = tuple(sorted([s_iri,t_iri]))
+            links[k] = min(d, links.get(k, d))
 
-        links = defaultdict(set)
-        for s_iri in iris:
-            if s_iri in mappings:
-                for t_iri,d in mappings[s_iri]:
-                    if t_iri in iris:
-                        links[tuple(sorted([s_iri,t_iri]))].add(d)
-
-        return {(k1,k2,min(vs)) for (k1,k2),vs in links.items()}
+        return {(k1,k2,d) for (k1,k2),d in links.items()}
     
     def get_name(self, iri):
 #         try:
@@ -248,114 +408,147 @@ class EfoIndex():
             xrefs.update(self.rev_xref_index[iri])
         return xrefs
     
-    def gen_rel_indexes(self):
-        p_str = ','.join(f"<{i}>" for i in self.equivalent_rels|self.close_rels|self.child_rels|self.parent_rels)  # ['owl:equivalentClass', ':exactMatch', ':closeMatch', ':narrowMatch', ':broadMatch', 'rdfs:subClassOf', 'oboInOwl:inSubset']
+    def rels_handler(self):
+        return RelsHandler(self.equivalent_rels|self.close_rels|self.child_rels|self.parent_rels, self.rel_dict, self.rev_rel_dict)
+    
+    def xrefs_handler(self):
+        return XrefHandler(self.xref_rels, self.rel_dict, self.rev_rel_dict, efo_norm_xref)
+    
+    def names_handler(self):
+        return NamesHandler(self.name_labels, self.pref_label)
+    
+    def build_from_file(self, path, format=None):
+        """Generate every index in one pass over the EFO OWL (or N-Triples) file, without the Sleepycat store."""
+        rels, xrefs, names = self.rels_handler(), self.xrefs_handler(), self.names_handler()
+        stream_triples(path, [rels, xrefs, names], format=format)
+        
+        self.set_rel_indexes(rels)
+        self.set_xref_indexes(xrefs)
+        self.set_name_indexes(names)
+        self.gen_disease_indexes()
+    
+    def update_from_file(self, path, format=None):
+        """Move the indexes loaded from the previous release on to the release in `path`, returning a `ChangeReport`.
+
+The EFO indexes themselves are not patched: the new release is read in one pass as in `build_from_file`, and
+`xref_index`, `iri2name`, `iri2pref_name` and `disease_iris` are replaced with ones built from it, then compared with
+the previous indexes IRI by IRI. Only the graph and reachability indexes are kept when no relation changed. What
+is updated in place is the `NameIndex`: pass the report to `NameIndex.update_names` to renormalise just the IRIs
+in its `names` entry instead of regenerating the name indexes.
+"""
+        old = {name:getattr(self, name, None) for name in ('rels_index', 'xref_index', 'iri2name', 'iri2pref_name', 'disease_iris')}
+        old_reachability = getattr(self, 'reachability', None)
+        
+        rels, xrefs, names = self.rels_handler(), self.xrefs_handler(), self.names_handler()
+        stream_triples(path, [rels, xrefs, names], format=format)
         
-        self.rels_index = defaultdict(set)
-        self.rev_rels_index = defaultdict(set)
-        for p in self.equivalent_rels|self.close_rels|self.child_rels|self.parent_rels:
-            p_iri = rdflib.URIRef(p)
-            for s,o in tqdm(self.efo_graph.query(f"SELECT ?s ?o WHERE {{ ?s ?p ?o }}", initBindings={'p': p_iri}), leave=True, position=0, desc=str(p)):
-                if isinstance(s, rdflib.term.URIRef) and isinstance(o, rdflib.term.URIRef):
-                    self.rels_index[str(s)].add((self.rel_dict[str(p)],str(o)))
-                    self.rev_rels_index[str(o)].add((self.rev_rel_dict[str(p)],str(s)))
+        report = ChangeReport(source=path)
+        report.add_mapping('rels_index', old['rels_index'], rels.rels_index)
+        if report.keys('rels_index') or old_reachability is None:
+            self.set_rel_indexes(rels)
+        self.set_xref_indexes(xrefs)
+        self.set_name_indexes(names)
+        self.gen_disease_indexes()
+        
+        for name in ('xref_index', 'iri2name', 'iri2pref_name'):
+            report.add_mapping(name, old[name], getattr(self, name))
+        report.add_set('disease_iris', old['disease_iris'], self.disease_iris)
+        report.add_keys('names', report.keys('iri2name'))
+        return report
+    
+    def gen_rel_indexes(self):
+        handler = self.rels_handler()
+        query_triples(self.efo_graph, [handler])
+        self.set_rel_indexes(handler)
+    
+    def set_rel_indexes(self, handler):
+        self.set_rel_graph(RelGraph.from_indexes(handler.rels_index, handler.rev_rels_index, rel_names=self.rel_names))
+        self.gen_reachability_index()
+    
+    def set_rel_graph(self, rel_graph):
+        self.rel_graph = rel_graph
+        self.rels_index = rel_graph.as_index('fwd')
+        self.rev_rels_index = rel_graph.as_index('rev')
+    
+    def gen_reachability_index(self):
+        self.reachability = ReachabilityIndex.build(self.rel_graph, self._child_codes(equivalents=True))
     
     def gen_xref_indexes(self):
-        def efo_norm_xref(iri, \
-                          prefix_source_map = {'MESH': 'mesh',
-                                               'MSH': 'mesh',
-                                               'MeSH': 'mesh',
-                                               'SCTID': 'snomed',
-                                               'SCTID_2010_1_31': 'snomed',
-                                               'SNOMEDCT': 'snomed',
-                                               'SNOMEDCT_2010_1_31': 'snomed',
-                                               'SNOMEDCT_US': 'snomed',
-                                               'SNOMEDCT_US_2018_03_01': 'snomed',
-                                               'UMLS': 'umls',
-                                               'UMLS CUI': 'umls',
-                                               'UMLS_CUI': 'umls'
-                                              },\
-                          source_ns_map = {'snomed': 'snomed:',
-                                           'mesh': 'http://id.nlm.nih.gov/mesh/2021/',
-                                           'umls': 'UMLS:'
-                                          }):
-            prefix = iri.split(':')[0]
-            code = ':'.join(iri.split(':')[1:])
-            if prefix in prefix_source_map:
-                source = prefix_source_map[prefix]
-                ns = source_ns_map[source]
-                return f"{ns}{code}"
-        
-        self.xref_index = defaultdict(set)
-        self.rev_xref_index = defaultdict(set)
-        
-        p = "http://www.geneontology.org/formats/oboInOwl#hasDbXref"
-        p_iri = rdflib.URIRef(p)
-        for s,o in tqdm(self.efo_graph.query(f"SELECT ?s ?o WHERE {{ ?s ?p ?o }}", initBindings={'p': p_iri}), leave=True, position=0):
-            if isinstance(s, rdflib.term.URIRef):
-                o = efo_norm_xref(o)
-                self.xref_index[str(s)].add((self.rel_dict[str(p)],str(o)))
-                self.rev_xref_index[str(o)].add((self.rev_rel_dict[str(p)],str(s)))
-    
-        self.xref_index = dict(self.xref_index)
-        self.rev_xref_index = dict(self.rev_xref_index)
+        handler = self.xrefs_handler()
+        query_triples(self.efo_graph, [handler])
+        self.set_xref_indexes(handler)
+    
+    def set_xref_indexes(self, handler):
+        self.xref_index = dict(handler.rels_index)
+        self.rev_xref_index = dict(handler.rev_rels_index)
     
     def gen_disease_indexes(self):
-        self.disease_iris = self.get_descendents(self.disease_root_iris, covered_iris=None, jumps=-1, equivalents=True)
+        self.disease_iris = self.reachability.get_descendents(self.disease_root_iris)
     
     def gen_name_indexes(self):
-        self.iri2name = defaultdict(set)
-        self.iri2pref_name = {}
-        for p in self.name_labels:
-            p_iri = rdflib.URIRef(p)
-            for s,o in tqdm(self.efo_graph.query(f"SELECT ?s ?o WHERE {{ ?s ?p ?o }}", initBindings={'p': p_iri}), leave=True, position=0, desc=str(p)):
-                if isinstance(s, rdflib.term.URIRef):
-                    self.iri2name[str(s)].add((str(p), str(o)))
-                    if p == self.pref_label:
-                        self.iri2pref_name[str(s)] = str(o)
-                        
-        self.iri2name = dict(self.iri2name)
+        handler = self.names_handler()
+        query_triples(self.efo_graph, [handler])
+        self.set_name_indexes(handler)
+    
+    def set_name_indexes(self, handler):
+        self.iri2name = handler.iri2name
+        self.iri2pref_name = handler.iri2pref_name
     
-    def save_indexes(self, data_dir=None):
+    def save_indexes(self, data_dir=None, binary=True):
         if data_dir is None:
             data_dir = self.data_dir
         
+        if binary:
+            save_mapping(f"{data_dir}/efo_disease_iris.oidx", self.disease_iris, kind='set')
+            self.rel_graph.save(f"{data_dir}/efo_rel_graph.oidx")
+            self.reachability.save(f"{data_dir}/efo_reachability.oidx")
+            save_mapping(f"{data_dir}/efo_xref_index.oidx", self.xref_index, fields='ss', scalar=False)
+            save_mapping(f"{data_dir}/efo_rev_xref_index.oidx", self.rev_xref_index, fields='ss', scalar=False)
+            save_mapping(f"{data_dir}/efo_iri2name.oidx", self.iri2name, fields='ss', scalar=False)
+            save_mapping(f"{data_dir}/efo_iri2pref_name.oidx", self.iri2pref_name, kind='map')
+            self.set_saved(data_dir, *self.lazy_attributes())
+            return
+        
         with open(f"{data_dir}/efo_disease_iris.json", 'wt') as f:
-            json.dump(list(self.disease_iris), f)
+            json.dump(sorted(self.disease_iris), f)
         with open(f"{data_dir}/efo_rels_index.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.rels_index.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.rels_index.items()}, f, sort_keys=True)
         with open(f"{data_dir}/efo_rev_rels_index.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.rev_rels_index.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.rev_rels_index.items()}, f, sort_keys=True)
         with open(f"{data_dir}/efo_xref_index.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.xref_index.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.xref_index.items()}, f, sort_keys=True)
         with open(f"{data_dir}/efo_rev_xref_index.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.rev_xref_index.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.rev_xref_index.items()}, f, sort_keys=True)
         with open(f"{data_dir}/efo_iri2name.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.iri2name.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.iri2name.items()}, f, sort_keys=True)
         with open(f"{data_dir}/efo_iri2pref_name.json", 'wt') as f:
-            json.dump(self.iri2pref_name, f)
+            json.dump(self.iri2pref_name, f, sort_keys=True)
+        self.set_saved(data_dir, *self.lazy_attributes())
         
-    def load_indexes(self, data_dir=None):
+    def load_rel_graph(self, data_dir=None):
         if data_dir is None:
             data_dir = self.data_dir
         
-        with open(f"{data_dir}/efo_disease_iris.json", 'rt') as f:
-            self.disease_iris = set(json.load(f))
-        with open(f"{data_dir}/efo_rels_index.json", 'rt') as f:
-            self.rels_index = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/efo_rev_rels_index.json", 'rt') as f:
-            self.rev_rels_index = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/efo_xref_index.json", 'rt') as f:
-            self.xref_index = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/efo_rev_xref_index.json", 'rt') as f:
-            self.rev_xref_index = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/efo_iri2name.json", 'rt') as f:
-            self.iri2name = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/efo_iri2pref_name.json", 'rt') as f:
-            self.iri2pref_name = json.load(f)
+        if os.path.exists(f"{data_dir}/efo_rel_graph.oidx"):
+            self.set_rel_graph(RelGraph.load(f"{data_dir}/efo_rel_graph.oidx"))
+        else:
+            with open(f"{data_dir}/efo_rels_index.json", 'rt') as f:
+                rels_index = json.load(f)
+            with open(f"{data_dir}/efo_rev_rels_index.json", 'rt') as f:
+                rev_rels_index = json.load(f)
+            self.set_rel_graph(RelGraph.from_indexes(rels_index, rev_rels_index, rel_names=self.rel_names))
+    
+    def load_reachability(self, data_dir=None):
+        if data_dir is None:
+            data_dir = self.data_dir
+        
+        if os.path.exists(f"{data_dir}/efo_reachability.oidx"):
+            self.reachability = ReachabilityIndex.load(f"{data_dir}/efo_reachability.oidx")
+        else:
+            self.gen_reachability_index()
     
 
-class MeshIndex():
+class MeshIndex(LazyIndexes):
     term_rels = {
         'http://id.nlm.nih.gov/mesh/vocab#term',
         'http://id.nlm.nih.gov/mesh/vocab#preferredTerm',
@@ -399,12 +592,33 @@ class MeshIndex():
         "C26", "F03", 
     }
     
-    def __init__(self, data_dir='.'):
+    index_files = {
+        'iri2treenumber': ('iri2treenumber', sets),
+        'iri2name': ('mesh_iri2name', tuple_sets),
+        'iri2pref_name': ('mesh_iri2pref_name', dict),
+        'iri2term': ('mesh_iri2term', tuple_sets),
+        'term2iri': ('mesh_term2iri', dict),
+        'iri2concept': ('mesh_iri2concept', tuple_sets),
+        'concept2iri': ('mesh_concept2iri', dict),
+        'iri2type': ('mesh_iri2type', dict),
+    }
+    index_loaders = {
+        'tree_numbers': 'load_tree_numbers',
+        'treenumber_index': 'load_tree_numbers',
+    }
+    index_loader_files = {
+        'tree_numbers': ('mesh_tree_numbers.oidx', 'iri2treenumber.oidx', 'iri2treenumber.json'),
+        'treenumber_index': ('mesh_tree_numbers.oidx', 'iri2treenumber.oidx', 'iri2treenumber.json'),
+    }
+    
+    cache_size = 100000
+    
+    def __init__(self, data_dir='.', cache=None):
         self.data_dir = data_dir
         
-        self.mesh_graph = rdflib.ConjunctiveGraph(store="Sleepycat")
-        
+        self.mesh_graph = None
         try:
+            self.mesh_graph = rdflib.ConjunctiveGraph(store="Sleepycat")
             rt = self.mesh_graph.open(f"{data_dir}/mesh.db", create=False)
             assert rt == rdflib.store.VALID_STORE, "Invalid MeSH store"
 
@@ -413,109 +627,111 @@ class MeshIndex():
         except:
             pass
         
+        # built on first use by `get_similarity_index` rather than by `preload`
+        self.similarity = None
+        
         try:
             self.load_indexes()
         except:
             pass
         
-        self.cache = {}
+        # `get_mesh_treenumbers` results
+        self.cache = cache if not cache is None else BoundedCache(maxsize=self.cache_size)
     
     def is_disease(self, iri):
         for tn in self.get_treenumber(iri):
-            if tn.split('.')[0] in self.relevant_root_treenumbers:
+            if self.tree_numbers.is_under(tn, self.relevant_root_treenumbers):
                 return True
         return False
     
     def get_mesh_treenumbers(self, mesh_descriptor_id):
-        if not mesh_descriptor_id in self.cache:
+        treenumbers = self.cache.get(mesh_descriptor_id)
+        if treenumbers is None:
             query = self.mesh_graph.query(f"SELECT ?o WHERE {{ mesh2021:{mesh_descriptor_id} vocab:treeNumber ?o }}")
-            self.cache[mesh_descriptor_id] = {o.split('/')[-1] for o, in query}
-        return self.cache[mesh_descriptor_id]
-
-#     def get_mesh_links(self, iris, distance=2):
-
-#         # get treenumbers
-#         iri_treenumbers = {}
-#         for iri in iris:
-#             if self.iri2treenumber:
-#                 r = self.iri2treenumber[iri]
-#             else:
-#                 r = self.get_mesh_treenumbers(iri)
-#             iri_treenumbers[iri] = r
-
-#         treenumber_iris = defaultdict(set)
-#         for iri, treenumbers in iri_treenumbers.items():
-#             for t in treenumbers:
-#                 treenumber_iris[t].add(iri)
+            treenumbers = {o.split('/')[-1] for o, in query}
+            self.cache[mesh_descriptor_id] = treenumbers
+        return treenumbers
 
-#         # parse treenumbers and create distances
-#         treenumbers = list(treenumber_iris.keys())
-#         treenumber_distances = defaultdict(set)
-#         for i,t in enumerate(treenumbers):
-#             treenumber_distances[t].add((i,0))
-#             t = t.split('.')
-#             for d in range(1,distance+1):
-#                 trimmed_t = '.'.join(t[:-d])
-#                 treenumber_distances[trimmed_t].add((i,d))
-
-#         # find links between treenumbers
-#         links = defaultdict(set)
-#         for t,ds in treenumber_distances.items():
-#             for (i1,d1),(i2,d2) in it.combinations(ds,2):
-#                 if i1==i2:
-#                     continue
-#                 links[tuple(sorted([i1,i2]))].add(d1+d2)
-
-#         # convert to iri links
-#         iri_links = set()
-#         for (i1,i2),ds in links.items():
-#             d = min(ds)
-#             if d <= distance:
-#                 for iri1,iri2 in it.product(treenumber_iris[treenumbers[i1]], treenumber_iris[treenumbers[i2]]):
-#                     if iri1 == iri2:
-#                         continue
-#                     iri_links.add((iri1, iri2, d))
-#         return iri_links
+    def get_mesh_links(self, iris, distance=2):
+        entries = []
+        for iri in iris:
+            if self.get_iri(iri).split('/')[-1] in self.iri2treenumber:
+                entries.extend((tn, iri) for tn in self.get_treenumber(iri))
+        
+        links = {}
+        for iri1, iri2, d in close_pairs(entries, distance):
+            if iri1 == iri2:
+                continue
+            k = tuple(sorted([iri1,iri2]))
+            links[k] = min(d, links.get(k, d))
+        
+        return {(k1,k2,d) for (k1,k2),d in links.items()}
 
     def get_descendents(self, iri, distance=None):
+        max_depth = None if (distance is None) or (distance==-1) else distance
+        
         xrefs = set()
         for tn in self.get_treenumber(iri):
-            if (distance is None) or (distance==-1):
-                xrefs.update({f"http://id.nlm.nih.gov/mesh/2021/{i}" for d,i in self.treenumber_index[tn]})
-            else:
-                xrefs.update({f"http://id.nlm.nih.gov/mesh/2021/{i}" for d,i in self.treenumber_index[tn] if d<=distance})
+            xrefs.update({f"http://id.nlm.nih.gov/mesh/2021/{i}" for d,i in self.tree_numbers.get_descendents(tn, max_depth=max_depth)})
         
         return xrefs
     
     def get_distant_mesh_relatives(self, iri, distance=2, search_up=True, search_down=True):
+        """`{iri: distance}` for descriptors reachable by going up, then down, the tree from any of `iri`'s tree numbers.
 
-        def rec_f(tn, distance=2, related_iris=set()):
-            if tn in self.treenumber_index:
-                for d, related_iri in self.treenumber_index[tn]:
-                    if (d <= distance) and (not related_iri in related_iris):
-                        if search_down or d==0:
-                            related_iris[related_iri].add(distance-d)
-                            for related_tn in self.iri2treenumber[related_iri]:
-                                related_iris = rec_f(related_tn, distance=distance-d, related_iris=related_iris)
-
-            return related_iris
-
-        related_iris = defaultdict(set)
+A descriptor reached on the way down also opens the subtrees of its other tree numbers at no extra cost. Costs are
+expanded in increasing order, so each tree number is scanned once and every descriptor gets its smallest distance.
+"""
+        tn_buckets = [[] for _ in range(distance+1)]
+        iri_buckets = [[] for _ in range(distance+1)]
         for original_tn in self.get_treenumber(iri):
-            tn_split = original_tn.split('.')
-
-            for i,idx in enumerate(reversed(range(len(tn_split)))):
+            for i, sub_tn in enumerate(tn_ancestors(original_tn)):
                 if i > distance:
                     break
-                sub_tn = '.'.join(tn_split[:idx+1])
-                related_iris.update(rec_f(sub_tn, distance=distance-i, related_iris=related_iris))
+                tn_buckets[i].append(sub_tn)
                 
                 # if config dictates, terminate the upwards search before it begins
                 if not search_up:
                     break
+        
+        related_iris = {}
+        expanded = set()
+        for c in range(distance+1):
+            tns = tn_buckets[c]
+            for related_iri in iri_buckets[c]:
+                if not related_iri in related_iris:
+                    related_iris[related_iri] = c
+                    tns.extend(self.iri2treenumber[related_iri])
+            
+            # `tns` grows while it is scanned, as descriptors found at this cost add their other tree numbers
+            for tn in tns:
+                if tn in expanded:
+                    continue
+                expanded.add(tn)
+                for d, related_iri in self.tree_numbers.get_descendents(tn, max_depth=distance-c if search_down else 0):
+                    if related_iri in related_iris:
+                        continue
+                    if d == 0:
+                        related_iris[related_iri] = c
+                        tns.extend(self.iri2treenumber[related_iri])
+                    else:
+                        iri_buckets[c+d].append(related_iri)
 
-        return {f'http://id.nlm.nih.gov/mesh/2021/{k}':(distance-max(vs)) for k,vs in related_iris.items()}
+        return {f'http://id.nlm.nih.gov/mesh/2021/{k}':d for k,d in related_iris.items()}
 
+    def get_similarity_index(self):
+        """The `MeshSimilarity` over the current `tree_numbers`, built the first time it is needed after that changes."""
+        if self.similarity is None or not self.similarity.tree_numbers is self.tree_numbers:
+            self.similarity = MeshSimilarity(self.tree_numbers, self.iri2treenumber)
+        return self.similarity
+    
+    def get_similarity(self, iri1, iri2, measure='lin'):
+        return self.get_similarity_index().similarity(self.get_iri(iri1).split('/')[-1], self.get_iri(iri2).split('/')[-1], measure=measure)
+    
+    def get_similarities(self, pairs, measure='lin'):
+        pairs = ((self.get_iri(iri1).split('/')[-1], self.get_iri(iri2).split('/')[-1]) for iri1,iri2 in pairs)
+        return self.get_similarity_index().similarity_many(pairs, measure=measure)
+    
     def get_iri(self, iri):
         if iri in self.concept2iri:
             return self.concept2iri[iri]
@@ -555,119 +771,167 @@ class MeshIndex():
         
         return names
         
-    def gen_treenumber_indexes(self):
-        self.treenumber_index = defaultdict(set)
-        self.iri2treenumber = defaultdict(set)
-        for iri,tn in tqdm(self.mesh_graph.query(f"SELECT ?s ?o WHERE {{ ?s vocab:treeNumber ?o }}"), leave=True, position=0):
-            iri = str(iri).split('/')[-1]
-            tn = tn.split('/')[-1]
-            self.iri2treenumber[iri].add(tn)
-            tn_split = tn.split('.')
-            for i,idx in enumerate(reversed(range(len(tn_split)))):
-                self.treenumber_index['.'.join(tn_split[:idx+1])].add((i,iri))
-                
-        self.treenumber_index = dict(self.treenumber_index)
-        self.iri2treenumber = dict(self.iri2treenumber)
+    def treenumbers_handler(self):
+        return LocalNameHandler({'http://id.nlm.nih.gov/mesh/vocab#treeNumber'})
     
-    def gen_type_indexes(self):
-        self.iri2type = {}
-        for s,o in tqdm(self.mesh_graph.query(f"SELECT ?s ?o WHERE {{ ?s <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> ?o }}"), position=0, leave=True):
-            self.iri2type[str(s).split('/')[-1]] = str(o).split('#')[-1]
+    def types_handler(self):
+        return LocalNameHandler({'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'}, sep='#', multi=False)
     
-    def gen_name_indexes(self):
-        self.iri2name = defaultdict(set)
-        self.iri2pref_name = {}
-        for p in self.name_labels:
-            p_iri = rdflib.URIRef(p)
-            for s,o in tqdm(self.mesh_graph.query(f"SELECT ?s ?o WHERE {{ ?s ?p ?o }}", initBindings={'p': p_iri}), leave=True, position=0, desc=str(p)):
-                if isinstance(s, rdflib.term.URIRef):
-                    self.iri2name[str(s)].add((str(p), str(o)))
-                    if p == self.pref_label:
-                        self.iri2pref_name[str(s)] = str(o)
-        
-        self.iri2name = dict(self.iri2name)
-        
-    def gen_term_indexes(self):
+    def names_handler(self):
+        return NamesHandler(self.name_labels, self.pref_label)
+    
+    def concepts_handler(self):
+        return LinksHandler(self.concept_rels)
+    
+    def terms_handler(self, concepts=None):
+        # terms hang off concepts, so they are mapped on to descriptors once the concepts are all in (from `concepts`,
+        # which must finish first, or the existing `concept2iri`)
         def convert_concept(iri):
-            if iri in self.concept2iri:
-                return self.concept2iri[iri]
+            concept2iri = self.concept2iri if concepts is None else concepts.rev_links
+            if iri in concept2iri:
+                return concept2iri[iri]
             else:
                 return iri
         
-        self.iri2term = defaultdict(set)
-        self.term2iri = {}
-        for p in self.term_rels:
-            p_iri = rdflib.URIRef(p)
-            for s,o in tqdm(self.mesh_graph.query(f"SELECT ?s ?o WHERE {{ ?s ?p ?o }}", initBindings={'p': p_iri}), leave=True, position=0, desc=str(p)):
-                if isinstance(s, rdflib.term.URIRef) and isinstance(o, rdflib.term.URIRef):
-                    self.iri2term[str(s)].add((str(p), str(o)))
-                    self.term2iri[str(o)] = convert_concept(str(s))
+        return LinksHandler(self.term_rels, convert=convert_concept)
+    
+    def build_from_file(self, path, format=None):
+        """Generate every index in one pass over the MeSH N-Triples (or other RDF) file, without the Sleepycat store."""
+        treenumbers, types, names, concepts = self.treenumbers_handler(), self.types_handler(), self.names_handler(), self.concepts_handler()
+        terms = self.terms_handler(concepts)
+        stream_triples(path, [treenumbers, types, names, concepts, terms], format=format)
+        
+        self.set_treenumber_indexes(treenumbers)
+        self.set_type_indexes(types)
+        self.set_name_indexes(names)
+        self.set_concept_indexes(concepts)
+        self.set_term_indexes(terms)
+    
+    def update_from_file(self, path, format=None):
+        """Move the indexes loaded from the previous release on to the release in `path`, returning a `ChangeReport`.
+
+Every MeSH index is rebuilt from one pass over `path` by `build_from_file` and the previous ones are only kept to
+diff against, so this saves the store scans but not the build itself. The report's `names` entry lists the
+descriptors whose names (including those of their terms) may have changed, for `NameIndex.update_names`, which
+patches the name indexes in place.
+"""
+        names = ('iri2treenumber', 'iri2name', 'iri2pref_name', 'iri2term', 'term2iri', 'iri2concept', 'concept2iri', 'iri2type')
+        old = {name:getattr(self, name, None) for name in names}
+        old_concept2iri = old['concept2iri'] or {}
+        old_term2iri = old['term2iri'] or {}
+        
+        def old_get_iri(iri):
+            if iri in old_concept2iri:
+                return old_concept2iri[iri]
+            if iri in old_term2iri:
+                return old_term2iri[iri]
+            return iri
+        
+        self.build_from_file(path, format=format)
         
-        self.iri2term = dict(self.iri2term)
-        self.term2iri = dict(self.term2iri)
+        report = ChangeReport(source=path)
+        for name in names:
+            report.add_mapping(name, old[name], getattr(self, name))
+        
+        touched = report.keys('iri2name', 'iri2term', 'term2iri', 'concept2iri')
+        report.add_keys('names', {f(iri) for iri in touched for f in (old_get_iri, self.get_iri)})
+        return report
+    
+    def gen_treenumber_indexes(self):
+        handler = self.treenumbers_handler()
+        query_triples(self.mesh_graph, [handler])
+        self.set_treenumber_indexes(handler)
+    
+    def set_treenumber_indexes(self, handler):
+        self.iri2treenumber = handler.index
+        self.set_tree_numbers(TreeNumberIndex.build(self.iri2treenumber))
+    
+    def set_tree_numbers(self, tree_numbers):
+        self.tree_numbers = tree_numbers
+        self.treenumber_index = tree_numbers.as_index()
+    
+    def gen_type_indexes(self):
+        handler = self.types_handler()
+        query_triples(self.mesh_graph, [handler])
+        self.set_type_indexes(handler)
+    
+    def set_type_indexes(self, handler):
+        self.iri2type = handler.index
+    
+    def gen_name_indexes(self):
+        handler = self.names_handler()
+        query_triples(self.mesh_graph, [handler])
+        self.set_name_indexes(handler)
+    
+    def set_name_indexes(self, handler):
+        self.iri2name = handler.iri2name
+        self.iri2pref_name = handler.iri2pref_name
+        
+    def gen_term_indexes(self):
+        handler = self.terms_handler()
+        query_triples(self.mesh_graph, [handler])
+        self.set_term_indexes(handler)
+    
+    def set_term_indexes(self, handler):
+        self.iri2term = handler.links
+        self.term2iri = handler.rev_links
     
     def gen_concept_indexes(self):
-        self.iri2concept = defaultdict(set)
-        self.concept2iri = {}
-        for p in self.concept_rels:
-            p_iri = rdflib.URIRef(p)
-            for s,o in tqdm(self.mesh_graph.query(f"SELECT ?s ?o WHERE {{ ?s ?p ?o }}", initBindings={'p': p_iri}), leave=True, position=0, desc=str(p)):
-                if isinstance(s, rdflib.term.URIRef) and isinstance(o, rdflib.term.URIRef):
-                    self.iri2concept[str(s)].add((str(p), str(o)))
-                    self.concept2iri[str(o)] = str(s)
-        
-        self.iri2concept = dict(self.iri2concept)
-        self.concept2iri = dict(self.concept2iri)
-        
-    def save_indexes(self, data_dir=None):
+        handler = self.concepts_handler()
+        query_triples(self.mesh_graph, [handler])
+        self.set_concept_indexes(handler)
+    
+    def set_concept_indexes(self, handler):
+        self.iri2concept = handler.links
+        self.concept2iri = handler.rev_links
+        
+    def save_indexes(self, data_dir=None, binary=True):
         if data_dir is None:
             data_dir = self.data_dir
+        
+        if binary:
+            self.tree_numbers.save(f"{data_dir}/mesh_tree_numbers.oidx")
+            save_mapping(f"{data_dir}/iri2treenumber.oidx", self.iri2treenumber)
+            save_mapping(f"{data_dir}/mesh_iri2name.oidx", self.iri2name, fields='ss', scalar=False)
+            save_mapping(f"{data_dir}/mesh_iri2pref_name.oidx", self.iri2pref_name, kind='map')
+            save_mapping(f"{data_dir}/mesh_iri2term.oidx", self.iri2term, fields='ss', scalar=False)
+            save_mapping(f"{data_dir}/mesh_term2iri.oidx", self.term2iri, kind='map')
+            save_mapping(f"{data_dir}/mesh_iri2concept.oidx", self.iri2concept, fields='ss', scalar=False)
+            save_mapping(f"{data_dir}/mesh_concept2iri.oidx", self.concept2iri, kind='map')
+            save_mapping(f"{data_dir}/mesh_iri2type.oidx", self.iri2type, kind='map')
+            self.set_saved(data_dir, *self.lazy_attributes())
+            return
             
-        with open(f"{data_dir}/treenumber_index.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.treenumber_index.items()}, f)
         with open(f"{data_dir}/iri2treenumber.json", 'wt') as f:
-            json.dump({k:list(vs) for k,vs in self.iri2treenumber.items()}, f)
+            json.dump({k:sorted(vs) for k,vs in self.iri2treenumber.items()}, f, sort_keys=True)
         with open(f"{data_dir}/mesh_iri2name.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.iri2name.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.iri2name.items()}, f, sort_keys=True)
         with open(f"{data_dir}/mesh_iri2pref_name.json", 'wt') as f:
-            json.dump(self.iri2pref_name, f)
+            json.dump(self.iri2pref_name, f, sort_keys=True)
         
         with open(f"{data_dir}/mesh_iri2term.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.iri2term.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.iri2term.items()}, f, sort_keys=True)
         with open(f"{data_dir}/mesh_term2iri.json", 'wt') as f:
-            json.dump(self.term2iri, f)
+            json.dump(self.term2iri, f, sort_keys=True)
         with open(f"{data_dir}/mesh_iri2concept.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.iri2concept.items()}, f)
+            json.dump({k:sorted(list(v) for v in vs) for k,vs in self.iri2concept.items()}, f, sort_keys=True)
         with open(f"{data_dir}/mesh_concept2iri.json", 'wt') as f:
-            json.dump(self.concept2iri, f)
+            json.dump(self.concept2iri, f, sort_keys=True)
         with open(f"{data_dir}/mesh_iri2type.json", 'wt') as f:
-            json.dump(self.iri2type, f)
-        
-    def load_indexes(self, data_dir=None):
+            json.dump(self.iri2type, f, sort_keys=True)
+        self.set_saved(data_dir, *self.lazy_attributes())
+    
+    def load_tree_numbers(self, data_dir=None):
         if data_dir is None:
             data_dir = self.data_dir
-            
-        with open(f"{data_dir}/treenumber_index.json", 'rt') as f:
-            self.treenumber_index = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/iri2treenumber.json", 'rt') as f:
-            self.iri2treenumber = {k:set(vs) for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/mesh_iri2name.json", 'rt') as f:
-            self.iri2name = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/mesh_iri2pref_name.json", 'rt') as f:
-            self.iri2pref_name = json.load(f)
-            
-        with open(f"{data_dir}/mesh_iri2term.json", 'rt') as f:
-            self.iri2term = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/mesh_term2iri.json", 'rt') as f:
-            self.term2iri = json.load(f)
-        with open(f"{data_dir}/mesh_iri2concept.json", 'rt') as f:
-            self.iri2concept = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/mesh_concept2iri.json", 'rt') as f:
-            self.concept2iri = json.load(f)
-        with open(f"{data_dir}/mesh_iri2type.json", 'rt') as f:
-            self.iri2type = json.load(f)
-        
-class UmlsIndex():
+        
+        if os.path.exists(f"{data_dir}/mesh_tree_numbers.oidx"):
+            self.set_tree_numbers(TreeNumberIndex.load(f"{data_dir}/mesh_tree_numbers.oidx"))
+        else:
+            self.set_tree_numbers(TreeNumberIndex.build(self.iri2treenumber))
+        
+        
+class UmlsIndex(LazyIndexes):
     name = "umls"
     pref_label = 'umls:cui_pref_string'
     name_labels = {
@@ -721,9 +985,24 @@ class UmlsIndex():
         'T201',  # Clinical Attribute
     }
     
-    def __init__(self, filepath=None, data_dir='.'):
+    index_files = {
+        'iri2semantic_types': ('umls_iri2semantic_types', sets),
+        'iri2name': ('umls_iri2name', tuple_sets),
+        'iri2pref_name': ('umls_iri2pref_name', dict),
+    }
+    index_loaders = {
+        'same_cui': 'load_same_cui',
+        'entity_rels': 'load_same_cui',
+    }
+    index_loader_files = {
+        'same_cui': ('umls_same_cui.oidx', 'umls_same_cui.json', 'umls_entity_rels.oidx', 'umls_entity_rels.json'),
+        'entity_rels': ('umls_same_cui.oidx', 'umls_same_cui.json', 'umls_entity_rels.oidx', 'umls_entity_rels.json'),
+    }
+    
+    def __init__(self, filepath=None, data_dir='.', member_prefix=None):
         self.data_dir = data_dir
         self.filepath = filepath
+        self.member_prefix = member_prefix  # e.g. 'umls-2020AB-data/', auto-detected if None
         
         try:
             self.load_indexes()
@@ -734,82 +1013,58 @@ class UmlsIndex():
         semantic_types = self.iri2semantic_types[iri]
         return bool(semantic_types & self.good_semantic_types)
     
-    def gen_terms_and_rel_indexes(self, filepath=None):
+    def set_same_cui(self, same_cui):
+        self.same_cui = same_cui
+        self.entity_rels = same_cui.as_rels('umls:same_cui')
+    
+    def gen_terms_and_rel_indexes(self, filepath=None, workers=None, chunk_size=1<<26, member_prefix=None, extract_dir=None, merge_shared_codes=False):
+        """Parse `MRCONSO.RRF` and `MRSTY.RRF` from a UMLS release zip (or a directory of `.RRF` files).
+
+Zip members are decompressed to a temporary directory (in `extract_dir` if given), split into line-aligned byte
+ranges of about `chunk_size` bytes and parsed over `workers` processes.
+
+Each CUI and its source codes form an equivalence class in `same_cui`; with `merge_shared_codes=True`, CUIs that
+share a source code are merged into one class.
+"""
         if filepath is None:
             filepath = self.filepath
+        if member_prefix is None:
+            member_prefix = self.member_prefix
             
         def gen_iri(source, code, source_name_map={'MSH': 'http://id.nlm.nih.gov/mesh/2021/', 'SNOMEDCT_US': 'snomed:'}):
             if source in source_name_map:
                 prefix = source_name_map[source]
                 return f"{prefix}{code}"
-        
-        def clean_line(l):
-            line = l.decode('utf-8')
-            while True:
-                if line[-1] in {'\n', '\r'}: 
-                    line = line[:-1]
-                else:
-                    break
-            return line
 
-#         cui_terms = defaultdict(list)
-        sources = set()
         equivalent_entities = defaultdict(set)
-        cui_terms = defaultdict(list)
         iri2semantic_types = defaultdict(set)
+        self.iri2name = defaultdict(set)
+        self.iri2pref_name = {}
         
-#         with tarfile.open(self.filepath, 'r:') as tf:
-#             for member in tf.getmembers():
-#                 if re.match('^.*?META/MRCONSO\.RRF$', member.name):
-#                     for line in (clean_line(l) for l in tf.extractfile(member)):
-
-        with zipfile.ZipFile(filepath) as f:
-            with f.open(name='umls-2020AB-data/MRCONSO.RRF') as df:
-                cols = ['CUI','LAT','TS','LUI','STT','SUI','ISPREF','AUI','SAUI','SCUI','SDUI','SAB','TTY','CODE','STR','SRL','SUPPRESS','CVF']
-                for line in tqdm((clean_line(l) for l in df), leave=True, position=0, desc='Extracting file'):
-                    row_dict = {cols[i]:v for i,v in enumerate(line.split('|')) if i < len(cols)}
-                    cui = f"UMLS:{row_dict['CUI']}"
-                    if all([
-                        str(row_dict['LAT']) == 'ENG',  # only english
-                        str(row_dict['SUPPRESS']) == 'N',
-                    ]):
-#                             sources.add(row_dict['SAB'])  # keep track of what sources are present
-                        cui_terms[cui].append({'string': row_dict['STR'], \
-                                               'source': row_dict['SAB'], \
-                                               'string_type': row_dict['STT'], \
-                                               'is_pref': row_dict['ISPREF'], \
-                                               'term_status': row_dict['TS'], \
-                                               'term_type_in_source': row_dict['TTY']})
-
-                        iri = gen_iri(row_dict['SAB'], row_dict['CODE'])
-                        if iri:
-                            equivalent_entities[cui].add(iri)
+        with tempfile.TemporaryDirectory(dir=extract_dir) as tmp_dir:
+            mrconso_path, mrsty_path = open_release_files(filepath, ['MRCONSO.RRF', 'MRSTY.RRF'], tmp_dir, member_prefix)
             
-            with f.open(name='umls-2020AB-data/MRSTY.RRF') as df:
-                cols = ['CUI','STY','?1','?2','?3','?4',]
-                for line in tqdm((clean_line(l) for l in df), leave=True, position=0, desc='Extracting file'):
-                    row_dict = {cols[i]:v for i,v in enumerate(line.split('|')[:-1])}
-                    cui = f"UMLS:{row_dict['CUI']}"
-                    iri2semantic_types[cui].add(row_dict['STY'])
-        
-        self.iri2semantic_types = {k:set(vs) for k,vs in iri2semantic_types.items()}
+            # chunks are merged in file order, so the last preferred string of a CUI still wins
+            for rows in chunked_map(parse_mrconso_chunk, byte_ranges(mrconso_path, chunk_size), workers=workers, chunksize=1, desc='Parsing MRCONSO'):
+                for cui, string, string_type, is_pref, source, code in rows:
+                    cui = f"UMLS:{cui}"
+                    if is_pref=='Y':
+                        self.iri2name[cui].add(('umls:cui_pref_string', string_type, string))
+                        self.iri2pref_name[cui] = string
+                    else:
+                        self.iri2name[cui].add(('umls:cui_string', string_type, string))
+                    
+                    iri = gen_iri(source, code)
+                    if iri:
+                        equivalent_entities[cui].add(iri)
+            
+            for rows in chunked_map(parse_mrsty_chunk, byte_ranges(mrsty_path, chunk_size), workers=workers, chunksize=1, desc='Parsing MRSTY'):
+                for cui, semantic_type in rows:
+                    iri2semantic_types[f"UMLS:{cui}"].add(semantic_type)
+        
+        self.iri2semantic_types = dict(iri2semantic_types)
 
-        self.entity_rels = defaultdict(set)
-        self.iri2name = defaultdict(set)
-        self.iri2pref_name = {}
-        for cui,iris in tqdm(equivalent_entities.items(), leave=True, position=0, desc='Processing rels'):
-            for iri1, iri2 in it.permutations(iris|{cui},2):
-                self.entity_rels[iri1].add(('umls:same_cui', iri2))
-        
-        for cui,vs in tqdm(cui_terms.items(), leave=True, position=0, desc='Processing names'):
-            for v in vs:
-                if v['is_pref']=='Y':
-                    self.iri2name[cui].add(('umls:cui_pref_string', v['string_type'], v['string']))
-                    self.iri2pref_name[cui] = v['string']
-                else:
-                    self.iri2name[cui].add(('umls:cui_string', v['string_type'], v['string']))
-        
-        self.entity_rels = dict(self.entity_rels)
+        self.set_same_cui(EquivalenceClasses.build((iris|{cui} for cui,iris in equivalent_entities.items()), merge=merge_shared_codes))
         self.iri2name = dict(self.iri2name)
     
     def get_name(self, iri):
@@ -823,32 +1078,46 @@ class UmlsIndex():
         return {(n,p,self.name_ranks[p]) for _,p,n in self.iri2name[iri]}
     
     def get_xrefs(self, iri):
-        if iri in self.entity_rels:
-            return self.entity_rels[iri]
+        equivalents = self.same_cui.get_equivalents(iri)
+        if equivalents:
+            return {('umls:same_cui', o) for o in equivalents}
     
-    def save_indexes(self, data_dir=None):
+    def save_indexes(self, data_dir=None, binary=True):
         if data_dir is None:
             data_dir = self.data_dir
         
+        if binary:
+            save_mapping(f"{data_dir}/umls_iri2semantic_types.oidx", self.iri2semantic_types)
+            self.same_cui.save(f"{data_dir}/umls_same_cui.oidx")
+            save_mapping(f"{data_dir}/umls_iri2name.oidx", self.iri2name, fields='sss', scalar=False)
+            save_mapping(f"{data_dir}/umls_iri2pref_name.oidx", self.iri2pref_name, kind='map')
+            self.set_saved(data_dir, *self.lazy_attributes())
+            return
+        
         with open(f"{data_dir}/umls_iri2semantic_types.json", 'wt') as f:
             json.dump({k:list(vs) for k,vs in self.iri2semantic_types.items()}, f)
-        with open(f"{data_dir}/umls_entity_rels.json", 'wt') as f:
-            json.dump({k:[list(v) for v in vs] for k,vs in self.entity_rels.items()}, f)
+        with open(f"{data_dir}/umls_same_cui.json", 'wt') as f:
+            json.dump([sorted(c) for c in self.same_cui.classes()], f)
         with open(f"{data_dir}/umls_iri2name.json", 'wt') as f:
             json.dump({k:[list(v) for v in vs] for k,vs in self.iri2name.items()}, f)
         with open(f"{data_dir}/umls_iri2pref_name.json", 'wt') as f:
             json.dump(self.iri2pref_name, f)
+        self.set_saved(data_dir, *self.lazy_attributes())
         
-    def load_indexes(self, data_dir=None):
+            
+    
+    def load_same_cui(self, data_dir=None):
         if data_dir is None:
             data_dir = self.data_dir
-            
-        with open(f"{data_dir}/umls_iri2semantic_types.json", 'rt') as f:
-            self.iri2semantic_types = {k:set(vs) for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/umls_entity_rels.json", 'rt') as f:
-            self.entity_rels = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/umls_iri2name.json", 'rt') as f:
-            self.iri2name = {k:{tuple(v) for v in vs} for k,vs in json.load(f).items()}
-        with open(f"{data_dir}/umls_iri2pref_name.json", 'rt') as f:
-            self.iri2pref_name = json.load(f)
-            
+        
+        if os.path.exists(f"{data_dir}/umls_same_cui.oidx"):
+            self.set_same_cui(EquivalenceClasses.load(f"{data_dir}/umls_same_cui.oidx"))
+        elif os.path.exists(f"{data_dir}/umls_same_cui.json"):
+            with open(f"{data_dir}/umls_same_cui.json", 'rt') as f:
+                self.set_same_cui(EquivalenceClasses.build(json.load(f)))
+        else:
+            # indexes saved before same_cui classes: every CUI lists the rest of its class
+            entity_rels = open_index(data_dir, 'umls_entity_rels', tuple_sets)
+            self.set_same_cui(EquivalenceClasses.build(
+                {cui}|{o for _,o in vs} for cui,vs in entity_rels.items() if cui.startswith('UMLS:')
+            ))
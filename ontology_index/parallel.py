@@ -0,0 +1,24 @@
+import multiprocessing
+from tqdm.auto import tqdm
+
+
+def chunked(items, chunksize):
+    items = list(items)
+    return [items[i:i+chunksize] for i in range(0, len(items), chunksize)]
+
+
+def chunked_map(func, items, workers=None, chunksize=1000, desc=None, initializer=None, initargs=()):
+    """Apply `func` to consecutive chunks of `items`, yielding each chunk's result in input order.
+
+With `workers` greater than 1 the chunks are fanned out over a process pool (`func`, and `initializer` if given, must
+be picklable module-level functions); otherwise they are processed in this process.
+"""
+    chunks = chunked(items, chunksize)
+
+    if workers and workers > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(min(workers, len(chunks)), initializer=initializer, initargs=initargs) as pool:
+            yield from tqdm(pool.imap(func, chunks), total=len(chunks), leave=True, position=0, desc=desc)
+    else:
+        if initializer:
+            initializer(*initargs)
+        yield from tqdm(map(func, chunks), total=len(chunks), leave=True, position=0, desc=desc)
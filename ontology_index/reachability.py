@@ -0,0 +1,230 @@
+from array import array
+from bisect import bisect_right
+from .binary_index import write_index, BinaryIndexFile, StringTable
+
+
+def strongly_connected_components(n, successors):
+    """Iterative Tarjan over nodes `0..n-1`; returns `(comp, comps)` with components in reverse topological order."""
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    comp = [-1] * n
+    comps = []
+    counter = 0
+
+    for root in range(n):
+        if index[root] != -1:
+            continue
+
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, iter(successors(root)))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, iter(successors(w))))
+                    break
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+                if low[v] == index[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp[w] = len(comps)
+                        members.append(w)
+                        if w == v:
+                            break
+                    comps.append(members)
+
+    return comp, comps
+
+
+class Reachability():
+    """Interval-labelled transitive closure of a directed graph over nodes `0..n-1`.
+
+Strongly connected components are numbered in the order Tarjan's algorithm emits them, which is a post-order of the
+condensed DAG, so every component reaches a few contiguous runs of component numbers. Component `c` reaches
+exactly the components in `intervals[interval_offsets[c]:interval_offsets[c+1]]` (flattened `start, end` pairs,
+inclusive), making "does `i` reach `j`" a binary search and "everything `i` reaches" linear in the output.
+"""
+
+    def __init__(self, comp, comp_offsets, comp_nodes, cyclic, interval_offsets, intervals):
+        self.comp = comp
+        self.comp_offsets = comp_offsets
+        self.comp_nodes = comp_nodes
+        self.cyclic = cyclic
+        self.interval_offsets = interval_offsets
+        self.intervals = intervals
+
+    @classmethod
+    def build(cls, n, successors):
+        successors_lists = [list(successors(i)) for i in range(n)]
+        comp, comps = strongly_connected_components(n, successors_lists.__getitem__)
+
+        comp_offsets = array('q', [0])
+        comp_nodes = array('I')
+        cyclic = array('B')
+        for members in comps:
+            comp_nodes.extend(sorted(members))
+            comp_offsets.append(len(comp_nodes))
+            cyclic.append(len(members) > 1 or members[0] in successors_lists[members[0]])
+
+        interval_offsets = array('q', [0])
+        intervals = array('I')
+        for c, members in enumerate(comps):
+            # successors are always numbered before `c`, so their labels are complete
+            runs = [(c, c)]
+            for d in {comp[j] for i in members for j in successors_lists[i]} - {c}:
+                start, end = interval_offsets[d], interval_offsets[d+1]
+                runs.extend(zip(intervals[start:end:2], intervals[start+1:end:2]))
+
+            merged = []
+            for start, end in sorted(runs):
+                if merged and start <= merged[-1][1] + 1:
+                    if end > merged[-1][1]:
+                        merged[-1][1] = end
+                else:
+                    merged.append([start, end])
+            for start, end in merged:
+                intervals.extend((start, end))
+            interval_offsets.append(len(intervals))
+
+        return cls(array('I', comp), comp_offsets, comp_nodes, cyclic, interval_offsets, intervals)
+
+    def to_arrays(self, prefix=''):
+        arrays = {
+            'comp': self.comp,
+            'comp_offsets': self.comp_offsets,
+            'comp_nodes': self.comp_nodes,
+            'cyclic': self.cyclic,
+            'interval_offsets': self.interval_offsets,
+            'intervals': self.intervals,
+        }
+        return {f"{prefix}{k}":a if isinstance(a, array) else array(a.format, a) for k,a in arrays.items()}
+
+    @classmethod
+    def from_file(cls, index_file, prefix=''):
+        return cls(*(
+            index_file.array(f"{prefix}{k}")
+            for k in ('comp', 'comp_offsets', 'comp_nodes', 'cyclic', 'interval_offsets', 'intervals')
+        ))
+
+    def _runs(self, c):
+        start, end = self.interval_offsets[c], self.interval_offsets[c+1]
+        return self.intervals[start:end]
+
+    def comp_reaches(self, c, d):
+        runs = self._runs(c)
+        k = bisect_right(runs, d)
+        # an odd insertion point falls after a run's start and at or before its end
+        return k % 2 == 1 or (k > 0 and runs[k-1] == d)
+
+    def reaches(self, i, j, strict=True):
+        """Whether `j` can be reached from `i`; with `strict=False` every node reaches itself."""
+        c, d = self.comp[i], self.comp[j]
+        if c == d:
+            return bool(self.cyclic[c]) or not strict
+        return self.comp_reaches(c, d)
+
+    def reachable(self, i, strict=True):
+        """Yield every node reachable from `i` (including `i` itself if it is on a cycle, or `strict=False`)."""
+        c = self.comp[i]
+        runs = self._runs(c)
+        for k in range(0, len(runs), 2):
+            for d in range(runs[k], runs[k+1]+1):
+                if d == c and strict and not self.cyclic[c]:
+                    continue
+                yield from self.comp_nodes[self.comp_offsets[d]:self.comp_offsets[d+1]]
+
+
+class ReachabilityIndex():
+    """Descendant and ancestor closures of a `RelGraph` restricted to some relation codes.
+
+Built over the edges `RelGraph.neighbours(i, codes)` follows, so e.g. `codes` for `{'child', 'equivalent'}` gives
+the subClassOf/equivalence hierarchy walked by `EfoIndex.get_descendents`.
+"""
+
+    def __init__(self, iris, down, up):
+        self.iris = iris
+        self.down = down
+        self.up = up
+        if isinstance(iris, StringTable):
+            self._find = iris.find
+        else:
+            self._find = {iri:i for i,iri in enumerate(iris)}.get
+
+    @classmethod
+    def build(cls, rel_graph, codes):
+        n = len(rel_graph)
+        successors = [[j for p,j in rel_graph.neighbours(i, codes=codes)] for i in range(n)]
+        predecessors = [[] for _ in range(n)]
+        for i, js in enumerate(successors):
+            for j in js:
+                predecessors[j].append(i)
+
+        return cls(rel_graph.iris, Reachability.build(n, successors.__getitem__), Reachability.build(n, predecessors.__getitem__))
+
+    def save(self, path, meta=None):
+        arrays = {
+            **StringTable.build(self.iris).to_arrays('iris'),
+            **self.down.to_arrays('down/'),
+            **self.up.to_arrays('up/'),
+        }
+        write_index(path, arrays, meta=meta)
+
+    @classmethod
+    def load(cls, path):
+        index_file = BinaryIndexFile(path)
+        return cls(StringTable.from_file(index_file, 'iris'), Reachability.from_file(index_file, 'down/'), Reachability.from_file(index_file, 'up/'))
+
+    def get_id(self, iri):
+        return self._find(iri)
+
+    def _ids(self, iris):
+        if isinstance(iris, str):
+            iris = {iris}
+        return {self.get_id(iri) for iri in iris} - {None}
+
+    def is_under(self, iri, ancestor_iris, strict=True):
+        """Whether `iri` is a descendant of any of `ancestor_iris`."""
+        i = self.get_id(iri)
+        if i is None:
+            return False
+        return any(self.down.reaches(a, i, strict=strict) for a in self._ids(ancestor_iris))
+
+    def filter_under(self, iris, ancestor_iris, strict=True):
+        """The subset of `iris` inside the subtrees of `ancestor_iris`."""
+        ancestors = self._ids(ancestor_iris)
+
+        def under(iri):
+            i = self.get_id(iri)
+            return not i is None and any(self.down.reaches(a, i, strict=strict) for a in ancestors)
+
+        return {iri for iri in iris if under(iri)}
+
+    def _closure(self, reachability, iris, strict):
+        ids = set()
+        for i in self._ids(iris):
+            ids.update(reachability.reachable(i, strict=strict))
+        return {self.iris[i] for i in ids}
+
+    def get_descendents(self, iris, strict=True):
+        return self._closure(self.down, iris, strict)
+
+    def get_ancestors(self, iris, strict=True):
+        return self._closure(self.up, iris, strict)
@@ -0,0 +1,135 @@
+from array import array
+from collections.abc import Mapping
+from .binary_index import write_index, BinaryIndexFile, StringTable
+
+
+class RelGraph():
+    """Compact integer-ID adjacency store for relation indexes.
+
+IRIs are interned to dense integer ids (ids follow the sorted order of the IRIs) and edges are held in CSR form.
+For node `i`, `targets[offsets[i]:offsets[i+1]]` are its neighbours and `codes[offsets[i]:offsets[i+1]]` the
+relation type of each edge (an index into `rel_names`).
+
+Forward edges (`rels_index`) and reverse edges (`rev_rels_index`) are kept as two separate CSR blocks, so the
+original string indexes can be reproduced exactly with `as_index('fwd')` / `as_index('rev')`.
+"""
+
+    directions = ('fwd', 'rev')
+
+    def __init__(self, iris, rel_names, fwd, rev):
+        self.iris = iris
+        self.rel_names = list(rel_names)
+        self.rel_codes = {n:i for i,n in enumerate(self.rel_names)}
+        self.fwd = fwd
+        self.rev = rev
+        if isinstance(iris, StringTable):
+            self._find = iris.find
+        else:
+            self._find = {iri:i for i,iri in enumerate(iris)}.get
+
+    @classmethod
+    def from_indexes(cls, rels_index, rev_rels_index, rel_names=()):
+        """Build from `{iri: {(rel_name, iri), ...}}` style forward and reverse indexes."""
+        iris = set(rels_index) | set(rev_rels_index)
+        rel_names = list(rel_names)
+        for index in (rels_index, rev_rels_index):
+            for vs in index.values():
+                for rel, o in vs:
+                    iris.add(o)
+                    if not rel in rel_names:
+                        rel_names.append(rel)
+
+        iris = sorted(iris)
+        iri2id = {iri:i for i,iri in enumerate(iris)}
+        rel_codes = {n:i for i,n in enumerate(rel_names)}
+
+        def build(index):
+            offsets = array('q', [0])
+            targets = array('i')
+            codes = array('B')
+            for iri in iris:
+                if iri in index:
+                    for rel, o in sorted((rel_codes[rel], iri2id[o]) for rel, o in index[iri]):
+                        codes.append(rel)
+                        targets.append(o)
+                offsets.append(len(targets))
+            return offsets, targets, codes
+
+        return cls(iris, rel_names, build(rels_index), build(rev_rels_index))
+
+    def save(self, path):
+        arrays = {**StringTable.build(self.iris).to_arrays('iris')}
+        for direction in self.directions:
+            for name, a in zip(('offsets', 'targets', 'codes'), getattr(self, direction)):
+                arrays[f"{direction}.{name}"] = a if isinstance(a, array) else array(a.format, a)
+        write_index(path, arrays, meta={'rel_names': self.rel_names})
+
+    @classmethod
+    def load(cls, path):
+        """Open a graph written by `save`; the id table and edge arrays stay memory-mapped."""
+        index_file = BinaryIndexFile(path)
+        fwd, rev = (
+            tuple(index_file.array(f"{direction}.{name}") for name in ('offsets', 'targets', 'codes'))
+            for direction in cls.directions
+        )
+        return cls(StringTable.from_file(index_file, 'iris'), index_file.meta['rel_names'], fwd, rev)
+
+    def __len__(self):
+        return len(self.iris)
+
+    def __contains__(self, iri):
+        return not self.get_id(iri) is None
+
+    def get_id(self, iri):
+        return self._find(iri)
+
+    def get_codes(self, rel_names):
+        return {self.rel_codes[n] for n in rel_names if n in self.rel_codes}
+
+    def edges(self, i, direction='fwd'):
+        offsets, targets, codes = getattr(self, direction)
+        start, end = offsets[i], offsets[i+1]
+        return zip(codes[start:end], targets[start:end])
+
+    def neighbours(self, i, codes=None):
+        """Yield `(code, j)` for every forward and reverse edge of node `i`, optionally restricted to `codes`."""
+        for direction in self.directions:
+            for code, j in self.edges(i, direction):
+                if codes is None or code in codes:
+                    yield code, j
+
+    def as_index(self, direction='fwd'):
+        return RelIndexView(self, direction)
+
+
+class RelIndexView(Mapping):
+    """Read-only `{iri: {(rel_name, iri), ...}}` view of one direction of a `RelGraph`."""
+
+    def __init__(self, graph, direction='fwd'):
+        self.graph = graph
+        self.direction = direction
+        self._len = None
+
+    def _has_edges(self, i):
+        offsets = getattr(self.graph, self.direction)[0]
+        return offsets[i+1] > offsets[i]
+
+    def __getitem__(self, iri):
+        i = self.graph.get_id(iri)
+        if i is None or not self._has_edges(i):
+            raise KeyError(iri)
+        return {(self.graph.rel_names[code], self.graph.iris[j]) for code, j in self.graph.edges(i, self.direction)}
+
+    def __contains__(self, iri):
+        i = self.graph.get_id(iri)
+        return (not i is None) and self._has_edges(i)
+
+    def __iter__(self):
+        for i in range(len(self.graph)):
+            if self._has_edges(i):
+                yield self.graph.iris[i]
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
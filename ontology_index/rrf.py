@@ -0,0 +1,106 @@
+import os
+import zipfile
+import shutil
+
+MRCONSO_COLUMNS = {'CUI': 0, 'LAT': 1, 'TS': 2, 'STT': 4, 'ISPREF': 6, 'SAB': 11, 'TTY': 12, 'CODE': 13, 'STR': 14, 'SUPPRESS': 16}
+MRSTY_COLUMNS = {'CUI': 0, 'TUI': 1}
+
+
+def find_member(names, filename, prefix=None):
+    """Find `filename` (e.g. `MRCONSO.RRF`) among the `names` of a release archive.
+
+With `prefix` (e.g. `umls-2020AB-data/`) the member must be exactly `{prefix}{filename}`, otherwise the shortest
+path ending in `/{filename}` is used.
+"""
+    if not prefix is None:
+        name = f"{prefix}{filename}"
+        if name in names:
+            return name
+        raise KeyError(f"{name} not found in release")
+
+    matches = sorted((n for n in names if n == filename or n.endswith(f"/{filename}")), key=lambda n:(n.count('/'), n))
+    if not matches:
+        raise KeyError(f"{filename} not found in release")
+    return matches[0]
+
+
+def open_release_files(filepath, filenames, extract_dir, prefix=None):
+    """Return on-disk paths for `filenames` of a UMLS release.
+
+`filepath` is either a directory holding the `.RRF` files (searched recursively) or a release zip, whose members are
+decompressed into `extract_dir` so they can be read in parallel byte ranges.
+"""
+    if os.path.isdir(filepath):
+        names = [
+            os.path.relpath(os.path.join(root, f), filepath).replace(os.sep, '/')
+            for root, _, files in os.walk(filepath) for f in files
+        ]
+        return [os.path.join(filepath, find_member(names, fn, prefix)) for fn in filenames]
+
+    paths = []
+    with zipfile.ZipFile(filepath) as zf:
+        names = zf.namelist()
+        for fn in filenames:
+            path = os.path.join(extract_dir, fn)
+            with zf.open(find_member(names, fn, prefix)) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1<<24)
+            paths.append(path)
+    return paths
+
+
+def byte_ranges(path, chunk_size=1<<26):
+    """Split a file into `(path, start, end)` ranges of about `chunk_size` bytes, each ending on a line boundary."""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((path, start, end))
+            start = end
+    return ranges
+
+
+def read_lines(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return [l.rstrip('\r') for l in data.decode('utf-8').split('\n') if l]
+
+
+def parse_mrconso_chunk(ranges):
+    """Parse byte ranges of `MRCONSO.RRF` into `(CUI, STR, STT, ISPREF, SAB, CODE)` rows.
+
+Only English, unsuppressed rows are kept; rows are returned in file order.
+"""
+    lat, suppress = MRCONSO_COLUMNS['LAT'], MRCONSO_COLUMNS['SUPPRESS']
+    cols = [MRCONSO_COLUMNS[c] for c in ('CUI', 'STR', 'STT', 'ISPREF', 'SAB', 'CODE')]
+    n_split = suppress + 1
+
+    rows = []
+    for path, start, end in ranges:
+        for line in read_lines(path, start, end):
+            if not '|ENG|' in line:
+                continue
+            row = line.split('|', n_split)
+            if len(row) <= suppress or row[lat] != 'ENG' or row[suppress] != 'N':
+                continue
+            rows.append(tuple(row[i] for i in cols))
+    return rows
+
+
+def parse_mrsty_chunk(ranges):
+    """Parse byte ranges of `MRSTY.RRF` into `(CUI, TUI)` rows."""
+    cui, tui = MRSTY_COLUMNS['CUI'], MRSTY_COLUMNS['TUI']
+
+    rows = []
+    for path, start, end in ranges:
+        for line in read_lines(path, start, end):
+            row = line.split('|', tui + 1)
+            if len(row) > tui:
+                rows.append((row[cui], row[tui]))
+    return rows
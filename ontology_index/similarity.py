@@ -0,0 +1,165 @@
+import math
+from array import array
+import numpy as np
+from .tree_numbers import tn_ancestors
+
+
+class InformationContent():
+    """Resnik, Lin and Jiang-Conrath similarity from intrinsic information content.
+
+A node's information content is `1 - log(n_descendants) / log(n_nodes)` (Seco et al.), counting the node itself,
+so leaves score 1 and a node above everything scores 0. The most informative common ancestor (MICA) of two nodes
+is the best-scoring node in both ancestor sets. Every node's ancestors (itself included) are precomputed once as
+a CSR table, so a batch of pairs is scored by intersecting their ancestor rows with NumPy, at a cost proportional
+to the ancestors involved rather than to a walk per pair. An LCA over the tree alone would not do, as MeSH
+descriptors sit at several tree numbers and EFO is a DAG.
+
+Subclasses set `ic` (an array indexed by node) and implement `get_node` and `ancestors`.
+"""
+
+    measures = ('resnik', 'lin', 'jc')
+    pairs_chunk_size = 1<<16
+
+    ancestor_offsets = None
+    ancestor_ids = None
+
+    @staticmethod
+    def seco_ic(n_descendants, n_nodes):
+        if n_nodes <= 1:
+            return 0.0
+        return 1 - math.log(n_descendants) / math.log(n_nodes)
+
+    def gen_ancestor_table(self):
+        """`ancestor_ids[ancestor_offsets[i]:ancestor_offsets[i+1]]` are the ancestors of node `i`, sorted by id."""
+        offsets = array('q', [0])
+        ids = array('q')
+        for i in range(len(self.ic)):
+            ids.extend(sorted(set(self.ancestors(i))))
+            offsets.append(len(ids))
+        self.ancestor_offsets = np.frombuffer(offsets, dtype=np.int64)
+        self.ancestor_ids = np.frombuffer(ids, dtype=np.int64)
+        self.ic_array = np.frombuffer(self.ic, dtype=np.float64)
+
+    def get_ic(self, iri):
+        node = self.get_node(iri)
+        if not node is None:
+            return self.ic[node]
+
+    def _ancestor_keys(self, nodes):
+        """`pair * n_nodes + ancestor` for every ancestor of each of `nodes` (the `pair`-th)."""
+        starts = self.ancestor_offsets[nodes]
+        counts = self.ancestor_offsets[nodes+1] - starts
+        total = int(counts.sum())
+        pair = np.repeat(np.arange(len(nodes), dtype=np.int64), counts)
+        # position of each entry within its row, added to the row's start
+        within = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        return pair * len(self.ic) + self.ancestor_ids[np.repeat(starts, counts) + within]
+
+    def mica_ic_many(self, a, b):
+        """IC of the most informative common ancestor of each pair of nodes `a[k]`, `b[k]` (0 if they share none)."""
+        if self.ancestor_offsets is None:
+            self.gen_ancestor_table()
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        mica = np.zeros(len(a))
+        if len(a):
+            common = np.intersect1d(self._ancestor_keys(a), self._ancestor_keys(b), assume_unique=True)
+            np.maximum.at(mica, common // len(self.ic), self.ic_array[common % len(self.ic)])
+        # a node is its own MICA, even where (in MeSH) an ancestor's subtree does not hold all of its descendants
+        return np.where(a == b, self.ic_array[a], mica)
+
+    def mica_ic(self, a, b):
+        """IC of the most informative common ancestor of nodes `a` and `b` (0 if they only meet at the root)."""
+        return float(self.mica_ic_many([a], [b])[0])
+
+    def similarity(self, iri1, iri2, measure='lin'):
+        """Similarity of two IRIs, or `None` if either is not in the hierarchy."""
+        r = self.similarity_many([(iri1, iri2)], measure=measure)[0]
+        if not np.isnan(r):
+            return float(r)
+
+    def similarity_many(self, pairs, measure='lin'):
+        """Score `(iri1, iri2)` pairs as a NumPy array, with NaN where either IRI is not in the hierarchy."""
+        if not measure in self.measures:
+            raise ValueError(f"Unknown measure '{measure}', expected one of {self.measures}")
+
+        a, b = [], []
+        for iri1, iri2 in pairs:
+            a.append(self.get_node(iri1))
+            b.append(self.get_node(iri2))
+        found = np.array([not x is None and not y is None for x, y in zip(a, b)], dtype=bool)
+        same = np.array([x == y for x, y in zip(a, b)], dtype=bool)
+        a = np.array([x for x, ok in zip(a, found) if ok], dtype=np.int64)
+        b = np.array([y for y, ok in zip(b, found) if ok], dtype=np.int64)
+
+        ic = np.frombuffer(self.ic, dtype=np.float64)
+        ic1, ic2, mica = (np.full(len(found), math.nan) for _ in range(3))
+        ic1[found] = ic[a]
+        ic2[found] = ic[b]
+        mica[found] = np.concatenate([np.zeros(0), *(
+            self.mica_ic_many(a[k:k+self.pairs_chunk_size], b[k:k+self.pairs_chunk_size])
+            for k in range(0, len(a), self.pairs_chunk_size)
+        )])
+
+        total = ic1 + ic2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if measure == 'resnik':
+                scores = mica.copy()
+            elif measure == 'lin':
+                # two identical root-level nodes have no information, but are still the same node
+                scores = np.where(total > 0, 2 * mica / total, same.astype(float))
+            else:
+                scores = 1 / (1 + np.maximum(total - 2 * mica, 0))
+        scores[np.isnan(total)] = np.nan
+        return scores
+
+
+class EfoSimilarity(InformationContent):
+    """Information content over a `ReachabilityIndex`; nodes are its (and the `RelGraph`'s) integer ids."""
+
+    def __init__(self, reachability):
+        self.reachability = reachability
+        down = reachability.down
+        n_nodes = len(down.comp)
+
+        comp_ic = array('d')
+        for c in range(len(down.comp_offsets) - 1):
+            runs = down._runs(c)
+            n_descendants = sum(down.comp_offsets[runs[k+1]+1] - down.comp_offsets[runs[k]] for k in range(0, len(runs), 2))
+            comp_ic.append(self.seco_ic(n_descendants, n_nodes))
+        self.ic = array('d', (comp_ic[c] for c in down.comp))
+
+    def get_node(self, iri):
+        return self.reachability.get_id(iri)
+
+    def ancestors(self, i):
+        return self.reachability.up.reachable(i, strict=False)
+
+
+class MeshSimilarity(InformationContent):
+    """Information content over a `TreeNumberIndex`; nodes are descriptor ids, ancestors come from tree-number prefixes."""
+
+    def __init__(self, tree_numbers, iri2treenumber):
+        self.tree_numbers = tree_numbers
+        self.iri2treenumber = iri2treenumber
+        descriptors = tree_numbers.descriptors
+        descriptor_ids = tree_numbers.descriptor_ids
+        n_nodes = len(descriptors)
+
+        self.ic = array('d')
+        for i in range(n_nodes):
+            subtree = set()
+            for tn in iri2treenumber[descriptors[i]]:
+                subtree.update(descriptor_ids[k] for k in tree_numbers.subtree(tn))
+            self.ic.append(self.seco_ic(len(subtree), n_nodes))
+
+    def get_node(self, iri):
+        return self.tree_numbers.descriptors.find(iri)
+
+    def ancestors(self, i):
+        tree_numbers = self.tree_numbers
+        for tn in self.iri2treenumber[tree_numbers.descriptors[i]]:
+            for prefix in tn_ancestors(tn):
+                k = tree_numbers.treenumbers.find(prefix)
+                if not k is None:
+                    yield tree_numbers.descriptor_ids[k]
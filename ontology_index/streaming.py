@@ -0,0 +1,242 @@
+import re
+import gzip
+from collections import defaultdict
+from tqdm.auto import tqdm
+
+
+class TripleHandler():
+    """Builds part of an index from the triples of some `predicates`.
+
+`start` is called before any triple, `add(s, p, o, s_iri, o_iri)` for every triple whose predicate is in
+`predicates` (`s_iri` and `o_iri` say whether the subject and object are IRIs rather than blank nodes or literals,
+literals being given by their lexical form), and `finish` once all triples have been seen. Results must not
+depend on the order the triples arrive in, so a build from a file matches a build from the store.
+"""
+
+    predicates = ()
+
+    def start(self):
+        pass
+
+    def add(self, s, p, o, s_iri, o_iri):
+        pass
+
+    def finish(self):
+        pass
+
+
+class RelsHandler(TripleHandler):
+    """`rels_index` and `rev_rels_index` (`{iri: {(rel_name, iri), ...}}`) from IRI-to-IRI relation triples."""
+
+    def __init__(self, predicates, rel_dict, rev_rel_dict):
+        self.predicates = predicates
+        self.rel_dict = rel_dict
+        self.rev_rel_dict = rev_rel_dict
+
+    def start(self):
+        self.rels_index = defaultdict(set)
+        self.rev_rels_index = defaultdict(set)
+
+    def add(self, s, p, o, s_iri, o_iri):
+        if s_iri and o_iri:
+            self.rels_index[s].add((self.rel_dict[p], o))
+            self.rev_rels_index[o].add((self.rev_rel_dict[p], s))
+
+
+class XrefHandler(RelsHandler):
+    """`xref_index` and `rev_xref_index` from cross-reference triples, with objects normalised by `norm`."""
+
+    def __init__(self, predicates, rel_dict, rev_rel_dict, norm):
+        super().__init__(predicates, rel_dict, rev_rel_dict)
+        self.norm = norm
+
+    def add(self, s, p, o, s_iri, o_iri):
+        if s_iri:
+            o = str(self.norm(o))
+            self.rels_index[s].add((self.rel_dict[p], o))
+            self.rev_rels_index[o].add((self.rev_rel_dict[p], s))
+
+
+class NamesHandler(TripleHandler):
+    """`iri2name` (`{iri: {(label_predicate, name), ...}}`) and `iri2pref_name` from label triples.
+
+An IRI with several `pref_label` names keeps the first in sorted order.
+"""
+
+    def __init__(self, predicates, pref_label):
+        self.predicates = predicates
+        self.pref_label = pref_label
+
+    def start(self):
+        self.iri2name = defaultdict(set)
+        self.iri2pref_name = {}
+
+    def add(self, s, p, o, s_iri, o_iri):
+        if s_iri:
+            self.iri2name[s].add((p, o))
+            if p == self.pref_label and (not s in self.iri2pref_name or o < self.iri2pref_name[s]):
+                self.iri2pref_name[s] = o
+
+    def finish(self):
+        self.iri2name = dict(self.iri2name)
+
+
+class LinksHandler(TripleHandler):
+    """`{subject: {(predicate, object), ...}}` and the reverse `{object: subject}` from IRI-to-IRI triples.
+
+When an object is linked from several subjects the reverse mapping keeps the first in sorted order (after
+`convert`, which is applied once all triples are in, e.g. to map MeSH concepts to their descriptors).
+"""
+
+    def __init__(self, predicates, convert=None):
+        self.predicates = predicates
+        self.convert = convert
+
+    def start(self):
+        self.links = defaultdict(set)
+        self.rev_links = defaultdict(set)
+
+    def add(self, s, p, o, s_iri, o_iri):
+        if s_iri and o_iri:
+            self.links[s].add((p, o))
+            self.rev_links[o].add(s)
+
+    def finish(self):
+        convert = self.convert or (lambda x:x)
+        self.links = dict(self.links)
+        self.rev_links = {o:min(convert(s) for s in ss) for o,ss in self.rev_links.items()}
+
+
+class LocalNameHandler(TripleHandler):
+    """`{local_name: {local_name, ...}}` (or `{local_name: local_name}` with `multi=False`, keeping the first in
+sorted order), taking the part of the subject after the last `/` and of the object after the last `sep`.
+"""
+
+    def __init__(self, predicates, sep='/', multi=True):
+        self.predicates = predicates
+        self.sep = sep
+        self.multi = multi
+
+    def start(self):
+        self.index = defaultdict(set)
+
+    def add(self, s, p, o, s_iri, o_iri):
+        self.index[s.split('/')[-1]].add(o.split(self.sep)[-1])
+
+    def finish(self):
+        if self.multi:
+            self.index = dict(self.index)
+        else:
+            self.index = {k:min(vs) for k,vs in self.index.items()}
+
+
+def dispatcher(handlers):
+    """`{predicate: [handler.add, ...]}` over the predicates of `handlers`."""
+    dispatch = defaultdict(list)
+    for handler in handlers:
+        for p in handler.predicates:
+            dispatch[p].append(handler.add)
+    return dict(dispatch)
+
+
+_iri = r'<([^>]*)>'
+_bnode = r'(_:\S+)'
+_literal = r'"((?:[^"\\]|\\.)*)"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?'
+_ntriple = re.compile(rf'\s*(?:{_iri}|{_bnode})\s*{_iri}\s*(?:{_iri}|{_bnode}|{_literal})\s*\.\s*(?:#.*)?$')
+_escape = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_escapes = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def unescape(s):
+    if not '\\' in s:
+        return s
+    return _escape.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)) if m.group(3) is None else _escapes.get(m.group(3), m.group(3)), s)
+
+
+def parse_ntriple(line):
+    """`(s, p, o, s_iri, o_iri)` for one N-Triples line, or `None` for a blank or comment line."""
+    m = _ntriple.match(line)
+    if m is None:
+        if not line.strip() or line.lstrip().startswith('#'):
+            return None
+        raise ValueError(f"Invalid N-Triples line: {line!r}")
+
+    s_iri, s_bnode, p, o_iri, o_bnode, o_literal = m.groups()
+    s = unescape(s_iri) if s_bnode is None else s_bnode
+    if not o_iri is None:
+        o = unescape(o_iri)
+    elif not o_bnode is None:
+        o = o_bnode
+    else:
+        o = unescape(o_literal)
+    return s, unescape(p), o, s_bnode is None, not o_iri is None
+
+
+def is_ntriples(path, format=None):
+    if not format is None:
+        return format in ('nt', 'ntriples', 'nt11')
+    return path.endswith('.nt') or path.endswith('.nt.gz')
+
+
+def stream_triples(path, handlers, format=None):
+    """Read the triples of an RDF file once, passing each to every handler of its predicate.
+
+N-Triples files (optionally gzipped) are parsed line by line; anything else (e.g. OWL as RDF/XML) goes through
+rdflib's parser into a store that forwards triples instead of keeping them.
+"""
+    dispatch = dispatcher(handlers)
+    for handler in handlers:
+        handler.start()
+
+    if is_ntriples(path, format):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in tqdm(f, leave=True, position=0, desc=path, unit=' lines'):
+                # cheap check of the predicate before fully parsing the line
+                if line[:1] in ('<', '_'):
+                    k = line.find('<', line.find('>') + 1 if line[0] == '<' else 0) + 1
+                    if k > 0 and not line[k:line.find('>', k)] in dispatch:
+                        continue
+                triple = parse_ntriple(line)
+                if not triple is None and triple[1] in dispatch:
+                    for add in dispatch[triple[1]]:
+                        add(*triple)
+    else:
+        parse_rdf(path, dispatch, format=format)
+
+    for handler in handlers:
+        handler.finish()
+
+
+def parse_rdf(path, dispatch, format=None):
+    import rdflib
+    from rdflib.util import guess_format
+
+    class DispatchStore(rdflib.store.Store):
+        def add(self, triple, context, quoted=False):
+            s, p, o = triple
+            p = str(p)
+            if p in dispatch:
+                triple = (str(s), p, str(o), isinstance(s, rdflib.URIRef), isinstance(o, rdflib.URIRef))
+                for add in dispatch[p]:
+                    add(*triple)
+
+    graph = rdflib.Graph(store=DispatchStore())
+    graph.parse(path, format=format or guess_format(path))
+
+
+def query_triples(graph, handlers):
+    """Feed `handlers` from an rdflib `graph` (e.g. the Sleepycat store), with one query per predicate."""
+    import rdflib
+
+    for handler in handlers:
+        handler.start()
+
+    for p, adds in sorted(dispatcher(handlers).items()):
+        for s, o in tqdm(graph.query("SELECT ?s ?o WHERE { ?s ?p ?o }", initBindings={'p': rdflib.URIRef(p)}), leave=True, position=0, desc=p):
+            triple = (str(s), p, str(o), isinstance(s, rdflib.URIRef), isinstance(o, rdflib.URIRef))
+            for add in adds:
+                add(*triple)
+
+    for handler in handlers:
+        handler.finish()
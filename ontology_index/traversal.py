@@ -0,0 +1,112 @@
+def bounded_bfs(sources, neighbours, max_distance):
+    """Level-synchronous BFS from `sources` over edges costing 0 or 1, up to `max_distance`.
+
+`neighbours(node)` yields `(node, cost)` pairs. Returns `{node: distance}`, the cheapest cost from any source. A
+source is only included if it is reached again via at least one edge. Every node is expanded at most once: each
+cost level is closed under zero-cost edges before the next level starts, so the first cost assigned to a node is
+its minimum.
+"""
+    distances = {}
+    expanded = set(sources)
+    frontier = list(expanded)
+    d = 0
+    while frontier and d <= max_distance:
+        stack = frontier
+        next_frontier = []
+        while stack:
+            node = stack.pop()
+            for other, cost in neighbours(node):
+                if other in distances:
+                    continue
+                if cost == 0:
+                    distances[other] = d
+                    if not other in expanded:
+                        expanded.add(other)
+                        stack.append(other)
+                elif d < max_distance:
+                    next_frontier.append(other)
+
+        frontier = []
+        for other in next_frontier:
+            if not other in distances:
+                distances[other] = d + 1
+                if not other in expanded:
+                    expanded.add(other)
+                    frontier.append(other)
+        d += 1
+
+    return distances
+
+
+def pairwise_distances(sources, neighbours, max_distance, reverse_neighbours=None):
+    """`{(s, t): distance}` for every ordered pair of `sources` at most `max_distance` apart, meeting in the middle.
+
+Each source's forward ball is grown to `ceil(max_distance/2)` and its backward ball (over `reverse_neighbours`,
+or the same edges if the costs are symmetric) to `floor(max_distance/2)`. Every path within the bound has a node
+that both balls reach, so pairs are found by joining the balls at shared nodes instead of growing a full-radius
+ball per source. As with `bounded_bfs`, `(s, s)` is only included for a non-empty walk back to `s`.
+"""
+    sources = list(dict.fromkeys(sources))
+    out_radius = max_distance - max_distance // 2
+    in_radius = max_distance // 2
+
+    def balls(neighbours, radius):
+        labels = {}
+        own = {}
+        for s in sources:
+            ball = bounded_bfs([s], neighbours, radius)
+            own[s] = ball
+            labels.setdefault(s, []).append((s, 0))
+            for node, d in ball.items():
+                if node != s:
+                    labels.setdefault(node, []).append((s, d))
+        return labels, own
+
+    out_labels, out_balls = balls(neighbours, out_radius)
+    if reverse_neighbours is None and in_radius == out_radius:
+        in_labels, in_balls = out_labels, out_balls
+    else:
+        in_labels, in_balls = balls(reverse_neighbours or neighbours, in_radius)
+
+    distances = {}
+    for node, out in out_labels.items():
+        if not node in in_labels:
+            continue
+        for s, ds in out:
+            for t, dt in in_labels[node]:
+                d = ds + dt
+                if d <= max_distance and (s != t or node != s) and d < distances.get((s, t), max_distance + 1):
+                    distances[(s, t)] = d
+
+    # a closed walk that only meets the balls at `s` itself is found by the balls directly
+    for s in sources:
+        for d in (out_balls[s].get(s), in_balls[s].get(s)):
+            if not d is None and d < distances.get((s, s), max_distance + 1):
+                distances[(s, s)] = d
+
+    return distances
+
+
+class DistanceMatrix():
+    """Sparse `(row, col, distance)` triples over the positions of `iris`."""
+
+    def __init__(self, iris, rows, cols, dists):
+        self.iris = iris
+        self.rows = rows
+        self.cols = cols
+        self.dists = dists
+
+    def __len__(self):
+        return len(self.dists)
+
+    def __iter__(self):
+        for i, j, d in zip(self.rows, self.cols, self.dists):
+            yield self.iris[i], self.iris[j], d
+
+    def to_numpy(self, fill=-1):
+        """Dense `len(iris) x len(iris)` array, with `fill` where two IRIs are further apart than the bound."""
+        import numpy as np
+
+        m = np.full((len(self.iris), len(self.iris)), fill, dtype=np.int32)
+        m[np.asarray(self.rows, dtype=np.intp), np.asarray(self.cols, dtype=np.intp)] = np.asarray(self.dists, dtype=np.int32)
+        return m
@@ -0,0 +1,167 @@
+from array import array
+from collections.abc import Mapping
+from .binary_index import write_index, BinaryIndexFile, StringTable
+
+
+def tn_depth(tn):
+    return tn.count('.')
+
+
+def tn_ancestors(tn):
+    """Yield `tn` and each of its ancestors, nearest first."""
+    while True:
+        yield tn
+        k = tn.rfind('.')
+        if k == -1:
+            break
+        tn = tn[:k]
+
+
+class TreeNumberIndex():
+    """MeSH tree numbers held in sorted (pre-order) order, with the depth and descriptor of each.
+
+Every descendant of tree number `t` starts with `t.`, so a subtree is the contiguous slice between `t.` and `t/`
+(`/` sorts straight after `.`) and is found by binary search. Depth limits are a filter over that slice.
+"""
+
+    def __init__(self, treenumbers, depths, descriptor_ids, descriptors):
+        self.treenumbers = treenumbers
+        self.depths = depths
+        self.descriptor_ids = descriptor_ids
+        self.descriptors = descriptors
+
+    @classmethod
+    def build(cls, iri2treenumber):
+        """Build from `{descriptor: {tree_number, ...}}`."""
+        entries = sorted(((tn.encode('utf-8'), iri) for iri,tns in iri2treenumber.items() for tn in tns))
+        descriptors = StringTable.build(iri2treenumber)
+        descriptor_ids = {iri:i for i,iri in enumerate(descriptors)}
+
+        return cls(
+            StringTable.from_sorted(tn.decode('utf-8') for tn,_ in entries),
+            array('B', (tn.count(b'.') for tn,_ in entries)),
+            array('I', (descriptor_ids[iri] for _,iri in entries)),
+            descriptors,
+        )
+
+    def save(self, path, meta=None):
+        arrays = {
+            **StringTable.from_sorted(self.treenumbers).to_arrays('treenumbers'),
+            'depths': self.depths if isinstance(self.depths, array) else array('B', self.depths),
+            'descriptor_ids': self.descriptor_ids if isinstance(self.descriptor_ids, array) else array('I', self.descriptor_ids),
+            **StringTable.build(self.descriptors).to_arrays('descriptors'),
+        }
+        write_index(path, arrays, meta=meta)
+
+    @classmethod
+    def load(cls, path):
+        index_file = BinaryIndexFile(path)
+        return cls(
+            StringTable.from_file(index_file, 'treenumbers'),
+            index_file.array('depths'),
+            index_file.array('descriptor_ids'),
+            StringTable.from_file(index_file, 'descriptors'),
+        )
+
+    def __len__(self):
+        return len(self.treenumbers)
+
+    def subtree(self, tn):
+        """Positions of `tn` and all its descendants."""
+        bisect_left = self.treenumbers.bisect_left
+        start = bisect_left(tn)
+        exact_end = bisect_left(tn + '\0', lo=start)
+        children = bisect_left(tn + '.', lo=exact_end)
+        end = bisect_left(tn + '/', lo=children)
+        if children == exact_end:
+            return range(start, end)
+        # something like `tn-x` sorts between `tn` and `tn.` without being in the subtree
+        return [*range(start, exact_end), *range(children, end)]
+
+    def get_descendents(self, tn, max_depth=None):
+        """Yield `(relative_depth, descriptor)` for every tree number in the subtree of `tn` (itself at depth 0)."""
+        base = tn_depth(tn)
+        for k in self.subtree(tn):
+            d = self.depths[k] - base
+            if max_depth is None or d <= max_depth:
+                yield d, self.descriptors[self.descriptor_ids[k]]
+
+    def is_under(self, tn, root_tns):
+        """Whether `tn` is in the subtree of `root_tns` (one tree number, or a set of them)."""
+        if isinstance(root_tns, str):
+            root_tns = {root_tns}
+        return any(a in root_tns for a in tn_ancestors(tn))
+
+    def as_index(self):
+        return TreeNumberIndexView(self)
+
+
+class TreeNumberIndexView(Mapping):
+    """Read-only `{tree_number_prefix: {(relative_depth, descriptor), ...}}` view of a `TreeNumberIndex`."""
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __getitem__(self, tn):
+        r = set(self.tree.get_descendents(tn)) if isinstance(tn, str) else None
+        if not r:
+            raise KeyError(tn)
+        return r
+
+    def __contains__(self, tn):
+        return isinstance(tn, str) and len(self.tree.subtree(tn)) > 0
+
+    def __iter__(self):
+        seen = set()
+        for tn in self.tree.treenumbers:
+            for prefix in tn_ancestors(tn):
+                if prefix in seen:
+                    break
+                seen.add(prefix)
+                yield prefix
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def close_pairs(entries, max_distance):
+    """Yield `(key_a, key_b, distance)` for every two `(tree_number, key)` entries at most `max_distance` apart.
+
+The distance is the number of edges between the tree numbers, with top-level tree numbers joined by a virtual root.
+Entries are sorted so that each subtree is contiguous; the longest common prefix of an entry with each later one is
+then the running minimum of the prefixes shared by neighbours. Once an entry's depth minus that minimum exceeds
+`max_distance` nothing further along can be close enough, and a later entry that is too far away lets the scan jump
+over its whole subtree, which is deeper still.
+"""
+    entries = sorted((tuple(tn.split('.')), key) for tn,key in entries)
+
+    neighbour_lcps = []
+    for (a, _), (b, _) in zip(entries, entries[1:]):
+        n = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            n += 1
+        neighbour_lcps.append(n)
+
+    subtree_ends = [len(entries)] * len(entries)
+    stack = []
+    for k, (b, _) in enumerate(entries):
+        while stack and b[:len(entries[stack[-1]][0])] != entries[stack[-1]][0]:
+            subtree_ends[stack.pop()] = k
+        stack.append(k)
+
+    for i, (a, key_a) in enumerate(entries):
+        m = len(a)
+        j = i + 1
+        while j < len(entries):
+            m = min(m, neighbour_lcps[j-1])
+            if len(a) - m > max_distance:
+                break
+            b, key_b = entries[j]
+            d = len(a) + len(b) - 2*m
+            if d <= max_distance:
+                yield key_a, key_b, d
+                j += 1
+            else:
+                j = subtree_ends[j]
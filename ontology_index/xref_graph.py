@@ -0,0 +1,217 @@
+import math
+from array import array
+from .binary_index import write_index, BinaryIndexFile, StringTable
+from .equivalence import UnionFind
+from .reachability import Reachability
+from .traversal import bounded_bfs
+from .parallel import chunked_map
+
+ONTOLOGY = 1
+NAME = 2
+
+_worker_state = {}
+
+
+def init_xref_worker(xref_index, options):
+    _worker_state.update(xref_index=xref_index, options=options)
+
+
+def direct_xrefs_chunk(iris):
+    """`iris` -> `[(iri, [(xref, kinds, name_score), ...]), ...]` with the worker's `XrefIndex` and options."""
+    xref_index = _worker_state['xref_index']
+    options = _worker_state['options']
+    return [(iri, xref_index.direct_xrefs(iri, **options)) for iri in iris]
+
+
+def expand_xrefs(iris, neighbours, jumps=1, covered_iris=None):
+    """The xrefs `XrefIndex.get_xrefs` finds from `iris`, given each IRI's direct xrefs as `neighbours(iri)`.
+
+Each round collects the direct xrefs of the frontier; the IRIs among them not yet covered form the next frontier.
+`jumps` rounds are run (`jumps` of 0 or 1 meaning one, and a negative `jumps` running until nothing new is found).
+"""
+    frontier = set(iris)
+    covered = frontier if covered_iris is None else set(covered_iris)
+    xrefs = set()
+    while True:
+        found = set()
+        for iri in frontier:
+            found.update(neighbours(iri))
+        xrefs.update(found)
+
+        frontier = found - covered
+        if not frontier or jumps == 0 or jumps == 1:
+            break
+        jumps -= 1
+        covered = covered | found
+    return xrefs
+
+
+class XrefGraph():
+    """The direct xrefs of every IRI, materialised as a directed graph in CSR form.
+
+`targets[offsets[i]:offsets[i+1]]` are the direct xrefs of IRI `i`, with `kinds` saying whether each edge comes from
+the ontologies (`ONTOLOGY`), from names (`NAME`) or both, and `name_scores` the `name_xref` max score of name edges
+(NaN otherwise). The edges were found with the `options` of `XrefIndex.direct_xrefs`; queries can drop a kind or
+raise the name score threshold, and are answered by a breadth-first search over the stored edges. `reachability`
+is the transitive closure over all edges (for `jumps<0`), and `components` numbers the weakly connected clusters,
+whose members are `component_members[component_offsets[c]:component_offsets[c+1]]`.
+"""
+
+    def __init__(self, iris, offsets, targets, kinds, name_scores, components, component_offsets, component_members, reachability, options, source_hash=None):
+        self.iris = iris
+        self.offsets = offsets
+        self.targets = targets
+        self.kinds = kinds
+        self.name_scores = name_scores
+        self.components = components
+        self.component_offsets = component_offsets
+        self.component_members = component_members
+        self.reachability = reachability
+        self.options = options
+        self.source_hash = source_hash  # of the saved indexes the graph was built from
+        if isinstance(iris, StringTable):
+            self._find = iris.find
+        else:
+            self._find = {iri:i for i,iri in enumerate(iris)}.get
+
+    @classmethod
+    def build(cls, xref_index, iris, workers=None, chunksize=1000, **options):
+        """Find the direct xrefs of `iris`, then of every IRI they lead to, until the graph is closed."""
+        edges = {}
+        frontier = sorted(set(iris))
+        while frontier:
+            for chunk in chunked_map(
+                direct_xrefs_chunk, frontier, workers=workers, chunksize=chunksize, desc="Xref graph",
+                initializer=init_xref_worker, initargs=(xref_index, options)
+            ):
+                for iri, xrefs in chunk:
+                    edges[iri] = xrefs
+            frontier = sorted({x for iri in frontier for x, kinds, score in edges[iri]} - set(edges))
+
+        iris = sorted(edges)
+        ids = {iri:i for i,iri in enumerate(iris)}
+        offsets = array('q', [0])
+        targets, kinds, name_scores = array('I'), array('B'), array('d')
+        for iri in iris:
+            for x, k, score in sorted((ids[x], k, score) for x, k, score in edges[iri]):
+                targets.append(x)
+                kinds.append(k)
+                name_scores.append(math.nan if score is None else score)
+            offsets.append(len(targets))
+
+        successors = lambda i: targets[offsets[i]:offsets[i+1]]
+        union_find = UnionFind()
+        for i in range(len(iris)):
+            union_find.find(i)
+            for j in successors(i):
+                union_find.union(i, j)
+        roots = {}
+        components = array('I', (roots.setdefault(union_find.find(i), len(roots)) for i in range(len(iris))))
+        component_members = array('I', sorted(range(len(iris)), key=components.__getitem__))
+        component_offsets = array('q', [0] * (len(roots) + 1))
+        for c in components:
+            component_offsets[c+1] += 1
+        for c in range(len(roots)):
+            component_offsets[c+1] += component_offsets[c]
+
+        return cls(
+            iris, offsets, targets, kinds, name_scores, 
+            components, component_offsets, component_members,
+            Reachability.build(len(iris), successors), options
+        )
+
+    def save(self, path):
+        arrays = {
+            **StringTable.build(self.iris).to_arrays('iris'),
+            'offsets': self.offsets,
+            'targets': self.targets,
+            'kinds': self.kinds,
+            'name_scores': self.name_scores,
+            'components': self.components,
+            'component_offsets': self.component_offsets,
+            'component_members': self.component_members,
+            **self.reachability.to_arrays('reachability/'),
+        }
+        write_index(path, {k:a if isinstance(a, array) else array(a.format, a) for k,a in arrays.items()}, meta={'options': self.options, 'source_hash': self.source_hash})
+
+    @classmethod
+    def load(cls, path):
+        index_file = BinaryIndexFile(path)
+        return cls(
+            StringTable.from_file(index_file, 'iris'),
+            *(index_file.array(k) for k in ('offsets', 'targets', 'kinds', 'name_scores', 'components', 'component_offsets', 'component_members')),
+            Reachability.from_file(index_file, 'reachability/'),
+            index_file.meta['options'],
+            index_file.meta.get('source_hash'),
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_id(self, iri):
+        return self._find(iri)
+
+    def covers(self, iris):
+        """Whether every one of `iris` is in the graph, so `get_xrefs` from them can be answered from it.
+
+The graph is closed under xrefs, so everything found from such IRIs is in it too, and covered IRIs outside it
+cannot change the result.
+"""
+        if isinstance(iris, str):
+            iris = {iris}
+        return all(not self.get_id(iri) is None for iri in iris)
+
+    def answers(self, ontology_based=True, name_based=True, name_xref_score_threshold=0.05, **options):
+        """Whether `get_xrefs` with these options can be answered from the graph."""
+        if any(self.options.get(k) != v for k, v in options.items()):
+            return False
+        return not name_based or name_xref_score_threshold >= self.options.get('name_xref_score_threshold', 0)
+
+    def neighbours(self, i, ontology_based=True, name_based=True, name_xref_score_threshold=None):
+        """Ids of the direct xrefs of id `i`, through edges of the chosen kinds."""
+        mask = (ONTOLOGY if ontology_based else 0) | (NAME if name_based else 0)
+        for k in range(self.offsets[i], self.offsets[i+1]):
+            kind = self.kinds[k]
+            if kind & mask & ONTOLOGY:
+                yield self.targets[k]
+            elif kind & mask & NAME and (name_xref_score_threshold is None or self.name_scores[k] >= name_xref_score_threshold):
+                yield self.targets[k]
+
+    def _neighbours(self, ontology_based, name_based, name_xref_score_threshold):
+        if name_based and name_xref_score_threshold <= self.options.get('name_xref_score_threshold', 0):
+            name_xref_score_threshold = None
+        return lambda i: self.neighbours(i, ontology_based, name_based, name_xref_score_threshold)
+
+    def get_xrefs(self, iris, covered_iris=None, jumps=1, ontology_based=True, name_based=True, name_xref_score_threshold=0.05):
+        """As `XrefIndex.get_xrefs`, over the stored edges. Only valid for IRIs the graph `covers`; others are ignored."""
+        if isinstance(iris, str):
+            iris = {iris}
+        ids = {self.get_id(iri) for iri in iris} - {None}
+
+        if jumps < 0 and covered_iris is None and ontology_based and name_based and name_xref_score_threshold <= self.options.get('name_xref_score_threshold', 0):
+            found = set()
+            for i in ids:
+                found.update(self.reachability.reachable(i))
+        else:
+            covered = None
+            if not covered_iris is None:
+                # covered IRIs outside the graph can never be found, so they do not matter
+                covered = {self.get_id(iri) for iri in covered_iris} - {None}
+            found = expand_xrefs(ids, self._neighbours(ontology_based, name_based, name_xref_score_threshold), jumps=jumps, covered_iris=covered)
+        return {self.iris[i] for i in found}
+
+    def get_xref_distances(self, iri, jumps=1, ontology_based=True, name_based=True, name_xref_score_threshold=0.05):
+        """`{xref: hops}` for everything within `jumps` xref hops of `iri` (itself only if it is reached again)."""
+        i = self.get_id(iri)
+        if i is None:
+            return {}
+        r = bounded_bfs([i], lambda j: ((k, 1) for k in self.neighbours(j, ontology_based, name_based, name_xref_score_threshold)), jumps)
+        return {self.iris[j]:d for j,d in r.items()}
+
+    def get_cluster(self, iri):
+        """Every IRI in the weakly connected xref cluster of `iri`."""
+        i = self.get_id(iri)
+        if i is None:
+            return set()
+        c = self.components[i]
+        return {self.iris[j] for j in self.component_members[self.component_offsets[c]:self.component_offsets[c+1]]}
@@ -1,10 +1,42 @@
 from .onto_index import EfoIndex, MeshIndex, UmlsIndex
 from .name_index import NameIndex, QualifierIndex
+from .name_table import NameXrefTable
+from .xref_graph import XrefGraph, expand_xrefs, ONTOLOGY, NAME
+from .binary_index import file_digest
+from .parallel import chunked, chunked_map
 
+import os
+import multiprocessing
 from collections import defaultdict
 
+_worker_state = {}
+
+
+def init_get_xrefs_worker(xref_index, options):
+    if isinstance(xref_index, str):
+        # not forked, so open the saved indexes (memory-mapped where binary) rather than copying them over
+        xref_index = XrefIndex(data_dir=xref_index)
+    _worker_state.update(xref_index=xref_index, options=options)
+
+
+def get_xrefs_chunk(iris):
+    """`iris` -> `[xrefs, ...]` with the worker's `XrefIndex` and `get_xrefs` options."""
+    xref_index = _worker_state['xref_index']
+    options = _worker_state['options']
+    return [xref_index.get_xrefs(iri, **options) for iri in iris]
+
+
 class XrefIndex():
     
+    # the indexes `direct_xrefs` and `xref_graph_iris` read, by attribute of the `XrefIndex`
+    xref_graph_sources = {
+        'efo_index': ('xref_index', 'rev_xref_index', 'rel_graph'),
+        'mesh_index': ('iri2treenumber', 'tree_numbers', 'concept2iri', 'term2iri'),
+        'umls_index': ('same_cui',),
+        'name_index': ('name_index', 'iri_name_index'),
+        'qualifier_index': ('token_qualifier_index',),
+    }
+    
     def __init__(self, data_dir='.', efo_index=None, mesh_index=None, umls_index=None, name_index=None, qualifier_index=None):
         self.data_dir = data_dir
         
@@ -33,49 +65,88 @@ class XrefIndex():
         else:
             self.qualifier_index = QualifierIndex(data_dir=self.data_dir)
         
+        # `NameXrefTable`s by `(min_length, extract_qualifiers)`
+        self.name_tables = {}
+        self.xref_graph = None
+        self.xref_graph_state = []
+        
         try:
             self.load_indexes()
         except:
             pass
     
+    def preload(self):
+        for index in (self.efo_index, self.mesh_index, self.umls_index, self.name_index, self.qualifier_index):
+            index.preload()
+        return self
+    
+    def name_table_path(self, min_length=4, extract_qualifiers=True, data_dir=None):
+        if data_dir is None:
+            data_dir = self.data_dir
+        return f"{data_dir}/name_xref_table_{min_length}{'_quals' if extract_qualifiers else ''}.oidx"
+    
+    def _name_table_source_hash(self, extract_qualifiers=True):
+        """Digest of the saved indexes a name table is built from, or `None` if one in use is not the saved one."""
+        if not self.name_index.is_saved('iri_name_index'):
+            return None
+        if extract_qualifiers and not self.qualifier_index.is_saved('token_qualifier_index'):
+            return None
+        try:
+            source_hash = file_digest(self.name_index.iri_name_index_path())
+            if extract_qualifiers:
+                # the table holds the names with their qualifiers cut out
+                source_hash += f":{file_digest(self.qualifier_index.token_qualifier_index_path())}"
+        except OSError:
+            return None
+        return source_hash
+    
+    def gen_name_table(self, min_length=4, extract_qualifiers=True, workers=None, chunksize=10000, save=True):
+        """Precompute (and save) the `NameXrefTable` used by `name_xref` for one `min_length` / `extract_qualifiers` setting."""
+        table = NameXrefTable.build(
+            self.name_index.iri_name_index, self.qualifier_index, 
+            min_length=min_length, extract_qualifiers=extract_qualifiers, workers=workers, chunksize=chunksize
+        )
+        self.name_tables[(min_length, extract_qualifiers)] = table
+        
+        source_hash = self._name_table_source_hash(extract_qualifiers)
+        if save and not source_hash is None:
+            try:
+                table.save(self.name_table_path(min_length, extract_qualifiers), source_hash=source_hash)
+            except OSError:
+                pass
+        return table
+    
+    def get_name_table(self, min_length=4, extract_qualifiers=True):
+        """The `NameXrefTable` for a setting: already in memory, saved and built from the current `iri_name_index` (and
+qualifiers), or built now."""
+        key = (min_length, extract_qualifiers)
+        if not key in self.name_tables:
+            table = None
+            source_hash = self._name_table_source_hash(extract_qualifiers)
+            if not source_hash is None:
+                try:
+                    table = NameXrefTable.load(self.name_table_path(min_length, extract_qualifiers), source_hash=source_hash)
+                except (OSError, ValueError):
+                    table = None
+            if table is None:
+                table = self.gen_name_table(min_length=min_length, extract_qualifiers=extract_qualifiers)
+            self.name_tables[key] = table
+        return self.name_tables[key]
+    
     def name_xref(self, iri, min_length=4, extract_qualifiers=True):
-        def get_names(iri, min_length=4):
-            r = self.name_index.get_names(iri)
-            if r:
-                iri_names = {filtered_name for name, filtered_name, tokens in r}
-            else:
-                iri_names = set()
-
-            if min_length:
-                iri_names = {n for n in iri_names if len(n)>=min_length}
-
-            return iri_names
+        table = self.get_name_table(min_length=min_length, extract_qualifiers=extract_qualifiers)
+        iri_names, filtered_iri_names = table.get_names(iri)
         
-        iri_names = get_names(iri, min_length=min_length)
-            
         candidates = defaultdict(set)
-        for n in iri_names:
-            r = self.name_index.query(n)
+        for q, quals in table.get_queries(iri):
+            r = self.name_index.query(q, filter_query=False)
             if r:
-                candidates[None].update(r)
-            if extract_qualifiers:
-                new_n, quals = self.qualifier_index.extract_qualifiers(n)
-                r = self.name_index.query(new_n)
-                if r:
-                    candidates[tuple(quals)].update(r)
-        
-        filtered_iri_names = {self.name_index.filter_name(n) for n in iri_names}
-        if extract_qualifiers:
-            filtered_iri_names = {self.qualifier_index.extract_qualifiers(n)[0] for n in filtered_iri_names}
+                candidates[quals].update(r)
         
         for quals, qual_candidates in candidates.items():
             for c in qual_candidates:
-                c_names = get_names(c, min_length=min_length)
+                c_names, filtered_c_names = table.get_names(c)
                 if c_names:
-                    filtered_c_names = {self.name_index.filter_name(n) for n in c_names}
-                    if extract_qualifiers:
-                        filtered_c_names = {self.qualifier_index.extract_qualifiers(n)[0] for n in filtered_c_names}
-                        
                     overlap = filtered_c_names & filtered_iri_names
                     scores = [len(overlap)/len(filtered_c_names), len(overlap)/len(filtered_iri_names)]
                     yield (
@@ -117,39 +188,157 @@ class XrefIndex():
         return xrefs
         
     
+    def direct_xrefs(self, iri, ontology_based=True, name_based=True, extract_qualifiers=True, name_xref_score_threshold=0.05, equivalents=True, min_name_length=4):
+        """One hop of `get_xrefs`: `[(xref, kinds, name_score), ...]` for the direct xrefs of `iri`.
+
+`kinds` has the `ONTOLOGY` bit for ontology xrefs and the `NAME` bit for name matches, whose best `name_xref` max
+score is `name_score` (`None` for ontology-only xrefs).
+"""
+        kinds = defaultdict(int)
+        name_scores = {}
+        if ontology_based:
+            for x in self.ontology_xref(iri, equivalents=equivalents):  # ontology xrefs
+                kinds[x] |= ONTOLOGY
+        if name_based:
+            for m, max_score, min_score, _, _, _, quals in self.name_xref(iri, min_length=min_name_length, extract_qualifiers=extract_qualifiers):
+                if max_score >= name_xref_score_threshold:
+                    kinds[m] |= NAME  # name-based xrefs
+                    name_scores[m] = max(max_score, name_scores.get(m, max_score))
+        
+        return [(x, k, name_scores.get(x)) for x, k in kinds.items()]
+    
     def get_xrefs(self, iris, covered_iris=None, jumps=1, ontology_based=True, name_based=True, extract_qualifiers=True, name_xref_score_threshold=0.05, equivalents=True, min_name_length=4):
         if isinstance(iris, str):
             iris = {iris}
         iris = set(iris)
         
-        if covered_iris is None:
-            covered_iris = iris
+        graph = self.current_xref_graph()
+        if not graph is None and graph.answers(ontology_based=ontology_based, name_based=name_based, name_xref_score_threshold=name_xref_score_threshold, extract_qualifiers=extract_qualifiers, equivalents=equivalents, min_name_length=min_name_length) and graph.covers(iris):
+            return graph.get_xrefs(iris, covered_iris=covered_iris, jumps=jumps, ontology_based=ontology_based, name_based=name_based, name_xref_score_threshold=name_xref_score_threshold)
         
-        xrefs = set()
+        def neighbours(iri):
+            return [x for x, k, score in self.direct_xrefs(
+                iri, 
+                ontology_based=ontology_based, 
+                name_based=name_based, 
+                extract_qualifiers=extract_qualifiers, 
+                name_xref_score_threshold=name_xref_score_threshold, 
+                equivalents=equivalents, 
+                min_name_length=min_name_length
+            )]
         
-        for iri in iris:
-            if ontology_based:
-                xrefs.update(self.ontology_xref(iri, equivalents=equivalents))  # ontology xrefs
-            if name_based:
-                for m, max_score, min_score, _, _, _, quals in self.name_xref(iri, min_length=min_name_length, extract_qualifiers=extract_qualifiers):
-                    if max_score >= name_xref_score_threshold:
-                        xrefs.add(m)  # name-based xrefs
-            
-        new_xrefs = xrefs - covered_iris
-        
-        if new_xrefs and not (jumps==0 or jumps==1):
-            xrefs.update(
-                self.get_xrefs(
-                    new_xrefs, 
-                    covered_iris=covered_iris|xrefs, 
-                    jumps=jumps-1, 
-                    ontology_based=ontology_based, 
-                    name_based=name_based, 
-                    name_xref_score_threshold=name_xref_score_threshold,
-                    min_name_length=min_name_length
-                )
-            )
-            
-        return xrefs
+        return expand_xrefs(iris, neighbours, jumps=jumps, covered_iris=covered_iris)
+    
+    def get_xrefs_many(self, iris, workers=None, chunksize=1000, **options):
+        """`get_xrefs` for each of `iris` with the same `options`, yielding `(iri, xrefs)` in input order.
+
+With `workers` > 1 the IRIs are sent in chunks to a process pool. The indexes are loaded before the pool starts so
+forked workers inherit them (and share the memory-mapped ones); where processes are spawned instead, each worker
+opens the saved indexes from `data_dir`.
+"""
+        iris = list(iris)
+        if workers and workers > 1:
+            if multiprocessing.get_start_method() == 'fork':
+                graph = self.current_xref_graph()
+                graph_options = {k:v for k,v in options.items() if not k in ('covered_iris', 'jumps')}
+                if graph is None or not graph.answers(**graph_options) or not graph.covers(iris):
+                    self.preload()
+                    if options.get('name_based', True):
+                        self.get_name_table(options.get('min_name_length', 4), options.get('extract_qualifiers', True))
+                xref_index = self
+            else:
+                xref_index = self.data_dir
+        else:
+            xref_index = self
+        
+        results = chunked_map(
+            get_xrefs_chunk, iris, workers=workers, chunksize=chunksize, desc="Xrefs",
+            initializer=init_get_xrefs_worker, initargs=(xref_index, options)
+        )
+        for chunk_iris, chunk in zip(chunked(iris, chunksize), results):
+            yield from zip(chunk_iris, chunk)
+    
+    def xref_graph_iris(self):
+        """The IRIs of every source the xref graph starts from: everything named, EFO xrefs and relations, MeSH descriptors and UMLS members."""
+        iris = set(self.name_index.iri_name_index)
+        for get_iris in (
+            lambda: self.efo_index.xref_index,
+            lambda: self.efo_index.rev_xref_index,
+            lambda: self.efo_index.rel_graph.iris,
+            lambda: (f"http://id.nlm.nih.gov/mesh/2021/{k}" for k in self.mesh_index.iri2treenumber),
+            lambda: self.umls_index.same_cui.members,
+        ):
+            try:
+                iris.update(get_iris())
+            except AttributeError:
+                pass
+        return iris
+    
+    def gen_xref_graph(self, iris=None, workers=None, chunksize=1000, extract_qualifiers=True, name_xref_score_threshold=0.05, equivalents=True, min_name_length=4, save=True):
+        """Materialise the direct xrefs of every IRI (from `xref_graph_iris` if `iris` is not given) as an `XrefGraph`.
+
+`get_xrefs` then answers from the graph whenever its options match the ones given here (or only raise the score
+threshold or drop a kind of xref) and every IRI asked about is in the graph; other IRIs are looked up live.
+
+The graph is only used while the indexes in `xref_graph_sources` are unchanged, and is saved with a digest of them
+(so only when they are all saved) that `load_indexes` checks.
+"""
+        if iris is None:
+            iris = self.xref_graph_iris()
+        self.xref_graph = XrefGraph.build(
+            self, iris, workers=workers, chunksize=chunksize, 
+            extract_qualifiers=extract_qualifiers, 
+            name_xref_score_threshold=name_xref_score_threshold, 
+            equivalents=equivalents, 
+            min_name_length=min_name_length
+        )
+        self.xref_graph.source_hash = self.xref_graph_source_hash()
+        self.xref_graph_state = self._xref_graph_state()
+        if save and not self.xref_graph.source_hash is None:
+            self.xref_graph.save(f"{self.data_dir}/xref_graph.oidx")
+        return self.xref_graph
+    
+    def xref_graph_source_hash(self):
+        """Digest of the saved `xref_graph_sources`, or `None` if one in use is not the saved one."""
+        digests = []
+        for name, attrs in self.xref_graph_sources.items():
+            digest = getattr(self, name).saved_digest(*attrs)
+            if digest is None:
+                return None
+            digests.append(digest)
+        return ':'.join(digests)
+    
+    def _xref_graph_state(self):
+        """`(index, attr, value)` for each of `xref_graph_sources`, `value` being `None` where it is the saved index."""
+        state = []
+        for name, attrs in self.xref_graph_sources.items():
+            index = getattr(self, name)
+            for attr in attrs:
+                state.append((index, attr, None if index.is_saved(attr) else index.__dict__.get(attr)))
+        return state
+    
+    def current_xref_graph(self):
+        """`xref_graph`, unless an index it was built from has been rebuilt, patched or replaced since."""
+        for index, attr, value in self.xref_graph_state:
+            if value is None:
+                if not index.is_saved(attr):
+                    return None
+            elif not index.__dict__.get(attr) is value:
+                return None
+        return self.xref_graph
+    
+    def load_indexes(self, data_dir=None):
+        """Load the saved `XrefGraph`, if it was built from the indexes now saved alongside it."""
+        if data_dir is None:
+            data_dir = self.data_dir
+        
+        self.xref_graph = None
+        path = f"{data_dir}/xref_graph.oidx"
+        if os.path.exists(path):
+            graph = XrefGraph.load(path)
+            source_hash = self.xref_graph_source_hash()
+            if not source_hash is None and graph.source_hash == source_hash:
+                self.xref_graph = graph
+                self.xref_graph_state = self._xref_graph_state()
         
         
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip('rdflib')
+pytest.importorskip('tqdm')
+pytest.importorskip('requests')
+
+from ontology_index.cache import BoundedCache
+
+
+def test_lfu_admits_new_entries_when_full():
+    c = BoundedCache(maxsize=2, policy='lfu')
+    c['a'] = 1
+    c['b'] = 2
+    c.get('a')
+    c.get('b')
+    c['c'] = 3
+    c['d'] = 4
+    # 'a' and 'b' tie, so the older 'a' makes room for 'c', then 'c' (used least) makes room for 'd'
+    assert sorted(c.data) == ['b', 'd']
+    assert c.get('d') == 4
+    assert c.evictions == 2
+
+
+def test_lfu_evicts_least_frequent_oldest_first():
+    c = BoundedCache(maxsize=3, policy='lfu')
+    for k in 'abc':
+        c[k] = k
+    c.get('a')
+    c.get('a')
+    c.get('c')
+    c['d'] = 'd'
+    assert sorted(c.data) == ['a', 'c', 'd']
+    c['e'] = 'e'
+    assert sorted(c.data) == ['a', 'c', 'e']
+
+
+def test_lru_evicts_least_recent():
+    c = BoundedCache(maxsize=2, policy='lru')
+    c['a'] = 1
+    c['b'] = 2
+    c.get('a')
+    c['c'] = 3
+    assert sorted(c.data) == ['a', 'c']
+
+
+@pytest.mark.parametrize('policy', ['lru', 'lfu'])
+def test_max_bytes(policy):
+    c = BoundedCache(maxsize=None, max_bytes=30, policy=policy, sizeof=len)
+    c['a'] = 'x' * 10
+    c['b'] = 'x' * 10
+    c['c'] = 'x' * 15
+    assert c.get('c') == 'x' * 15
+    assert c.nbytes <= 30
+    # too big to keep at all
+    c['d'] = 'x' * 40
+    assert not 'd' in c.data
+    assert c.nbytes <= 30
+
+
+def test_lfu_disk_hits_are_kept(tmp_path):
+    c = BoundedCache(maxsize=2, policy='lfu', path=str(tmp_path / 'cache.db'))
+    for k in 'abc':
+        c[k] = k
+    c.get('b')
+    c.get('c')
+    c.get('b')
+    c.get('c')
+    # 'a' was evicted from memory, but comes back from SQLite and stays
+    assert c.get('a') == 'a'
+    assert 'a' in c.data
+    assert c.disk_hits == 1
+    c.close()
@@ -0,0 +1,158 @@
+import random
+import pytest
+
+pytest.importorskip('rdflib')
+pytest.importorskip('tqdm')
+pytest.importorskip('requests')
+
+from ontology_index.onto_index import MeshIndex
+from ontology_index.tree_numbers import TreeNumberIndex, tn_depth
+
+
+def synthetic_tree(seed=0):
+    """`{descriptor: {tree_number, ...}}` over a few random trees, with awkward siblings like `C01`/`C010` and `C01-1`."""
+    rng = random.Random(seed)
+    tns = []
+    for root in ('C01', 'C010', 'C01-1', 'C02', 'F03'):
+        level = [root]
+        tns.append(root)
+        for _ in range(4):
+            children = []
+            for tn in level:
+                for i in range(rng.randint(1, 3)):
+                    children.append(f"{tn}.{rng.randint(0, 999):03d}")
+            children = sorted(set(children))
+            tns.extend(children)
+            level = children
+    # sibling prefixes one level down as well
+    tns.extend(['C01.100', 'C01.1000', 'C01.100.200', 'C01.1000.200'])
+    tns = sorted(set(tns))
+
+    descriptors = [f"D{i:06d}" for i in range(len(tns) * 2 // 3)]
+    iri2treenumber = {}
+    for k, tn in enumerate(tns):
+        # every descriptor gets at least one tree number, some several
+        d = descriptors[k] if k < len(descriptors) else rng.choice(descriptors)
+        iri2treenumber.setdefault(d, set()).add(tn)
+    return iri2treenumber
+
+
+def in_subtree(x, tn):
+    return x == tn or x.startswith(tn + '.')
+
+
+def all_entries(iri2treenumber):
+    return sorted((tn, d) for d, tns in iri2treenumber.items() for tn in tns)
+
+
+def brute_descendents(iri2treenumber, tn, max_depth=None):
+    base = tn_depth(tn)
+    return {
+        (tn_depth(x) - base, d) for x, d in all_entries(iri2treenumber)
+        if in_subtree(x, tn) and (max_depth is None or tn_depth(x) - base <= max_depth)
+    }
+
+
+def brute_relatives(iri2treenumber, iri, distance, search_up, search_down):
+    """Smallest cost of each descriptor, relaxing until nothing improves.
+
+Going up from one of `iri`'s tree numbers costs a step per level, going down the same; reaching a descriptor opens
+the subtrees of all its tree numbers at the cost it was reached with.
+"""
+    best = {}
+    starts = {}
+    for tn in iri2treenumber[iri]:
+        parts = tn.split('.')
+        for i in range(len(parts)):
+            if i > distance or (i > 0 and not search_up):
+                break
+            sub_tn = '.'.join(parts[:len(parts)-i])
+            starts[sub_tn] = min(i, starts.get(sub_tn, i))
+
+    changed = True
+    while changed:
+        changed = False
+        roots = dict(starts)
+        for d, c in best.items():
+            for tn in iri2treenumber[d]:
+                roots[tn] = min(c, roots.get(tn, c))
+        for tn, c in roots.items():
+            for x, d in all_entries(iri2treenumber):
+                if not in_subtree(x, tn):
+                    continue
+                depth = tn_depth(x) - tn_depth(tn)
+                if (depth > 0 and not search_down) or c + depth > distance:
+                    continue
+                if c + depth < best.get(d, distance + 1):
+                    best[d] = c + depth
+                    changed = True
+    return best
+
+
+@pytest.fixture(scope='module')
+def iri2treenumber():
+    return synthetic_tree()
+
+
+@pytest.fixture(scope='module')
+def tree(iri2treenumber):
+    return TreeNumberIndex.build(iri2treenumber)
+
+
+@pytest.fixture(scope='module')
+def mesh_index(iri2treenumber, tmp_path_factory):
+    mesh_index = MeshIndex(data_dir=str(tmp_path_factory.mktemp('mesh')))
+    mesh_index.iri2treenumber = iri2treenumber
+    mesh_index.concept2iri = {}
+    mesh_index.term2iri = {}
+    mesh_index.set_tree_numbers(TreeNumberIndex.build(iri2treenumber))
+    return mesh_index
+
+
+def query_tree_numbers(iri2treenumber):
+    tns = {tn for tns in iri2treenumber.values() for tn in tns}
+    # prefixes that are not tree numbers themselves, and ones with no match at all
+    return sorted(tns | {'C', 'C0', 'C01.1', 'C1', 'C01.', 'Z99'})
+
+
+def test_subtree_matches_prefix_scan(iri2treenumber, tree):
+    entries = all_entries(iri2treenumber)
+    assert [tn for tn, d in entries] == list(tree.treenumbers)
+    for tn in query_tree_numbers(iri2treenumber):
+        expected = [k for k, (x, d) in enumerate(entries) if in_subtree(x, tn)]
+        assert list(tree.subtree(tn)) == expected, tn
+
+
+def test_subtree_boundaries(tree):
+    # `C010`, `C01-1` and `C01.1000` share a string prefix with `C01` / `C01.100` but are not in their subtrees
+    tns = lambda tn: {tree.treenumbers[k] for k in tree.subtree(tn)}
+    assert not any(tn.startswith(('C010', 'C01-1')) for tn in tns('C01'))
+    assert tns('C01.100') == {'C01.100', 'C01.100.200'}
+    assert tns('C01.1000') == {'C01.1000', 'C01.1000.200'}
+
+
+@pytest.mark.parametrize('max_depth', [None, 0, 1, 2])
+def test_get_descendents_matches_prefix_scan(iri2treenumber, tree, max_depth):
+    for tn in query_tree_numbers(iri2treenumber):
+        assert set(tree.get_descendents(tn, max_depth=max_depth)) == brute_descendents(iri2treenumber, tn, max_depth), tn
+
+
+@pytest.mark.parametrize('distance', [None, 0, 1, 3])
+def test_mesh_get_descendents(iri2treenumber, mesh_index, distance):
+    for d, tns in iri2treenumber.items():
+        expected = {
+            f"http://id.nlm.nih.gov/mesh/2021/{x}"
+            for tn in tns for depth, x in brute_descendents(iri2treenumber, tn, distance)
+        }
+        assert mesh_index.get_descendents(d, distance=distance) == expected, d
+
+
+@pytest.mark.parametrize('distance', [0, 1, 2, 3])
+@pytest.mark.parametrize('search_up, search_down', [(True, True), (False, True), (True, False)])
+def test_distant_mesh_relatives_minimum_distances(iri2treenumber, mesh_index, distance, search_up, search_down):
+    for d in sorted(iri2treenumber)[::3]:
+        expected = {
+            f"http://id.nlm.nih.gov/mesh/2021/{x}":c
+            for x, c in brute_relatives(iri2treenumber, d, distance, search_up, search_down).items()
+        }
+        assert mesh_index.get_distant_mesh_relatives(d, distance=distance, search_up=search_up, search_down=search_down) == expected, d